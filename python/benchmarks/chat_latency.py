@@ -0,0 +1,147 @@
+"""Measure per-turn latency of ChatGmailAgent against a local stub model server.
+
+The stub speaks the OpenAI chat completions API over HTTP/1.1 keep-alive.
+Every turn first asks for a ``gmail_poll`` tool call and then answers, so a
+turn makes two requests. A configurable delay before each response stands in
+for model latency. Each backend profile runs the same conversation with and
+without streaming.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import statistics
+import threading
+import time
+from dataclasses import replace
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List
+from unittest.mock import MagicMock
+
+from chat_gmail_agent import ChatGmailAgent
+from local_py.llm_backend import BackendProfile
+
+REPLY = "You have no new mail."
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    latency = 0.0
+
+    def do_POST(self) -> None:
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        time.sleep(self.latency)
+        if "tools" in request and request["messages"][-1]["role"] == "user":
+            call = {
+                "index": 0,
+                "id": "call",
+                "type": "function",
+                "function": {"name": "gmail_poll", "arguments": "{}"},
+            }
+            message: Dict[str, Any] = {"role": "assistant", "tool_calls": [call]}
+        else:
+            message = {"role": "assistant", "content": REPLY}
+        if request.get("stream"):
+            self._send_stream(request, message)
+        else:
+            self._send(
+                "application/json",
+                json.dumps(self._completion(request, {"message": message})).encode(),
+            )
+
+    def _completion(self, request: Dict[str, Any], choice: Dict[str, Any]) -> Any:
+        return {
+            "id": "chatcmpl-stub",
+            "object": "chat.completion",
+            "created": 0,
+            "model": request["model"],
+            "choices": [{"index": 0, "finish_reason": "stop", **choice}],
+            "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+        }
+
+    def _send_stream(self, request: Dict[str, Any], message: Dict[str, Any]) -> None:
+        deltas: List[Dict[str, Any]] = []
+        if "tool_calls" in message:
+            deltas.append({"tool_calls": message["tool_calls"]})
+        else:
+            deltas.extend({"content": word} for word in message["content"].split(" "))
+        events = []
+        for delta in deltas:
+            chunk = self._completion(request, {"delta": delta})
+            chunk["object"] = "chat.completion.chunk"
+            del chunk["usage"]
+            events.append(f"data: {json.dumps(chunk)}\n\n")
+        events.append("data: [DONE]\n\n")
+        self._send("text/event-stream", "".join(events).encode())
+
+    def _send(self, content_type: str, body: bytes) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: object) -> None:
+        pass
+
+
+def measure(label: str, backend: BackendProfile, turns: int, stream: bool) -> None:
+    poller = MagicMock()
+    poller.poll.return_value = []
+    agent = ChatGmailAgent(poller, stream=stream, backend=backend, poll_cache_ttl=0)
+    latencies: List[float] = []
+    ttfts: List[float] = []
+
+    def next_input(prompt: str) -> str:
+        if agent.last_turn_seconds is not None:
+            latencies.append(agent.last_turn_seconds)
+            assert agent.last_ttft is not None
+            ttfts.append(agent.last_ttft)
+        return "exit" if len(latencies) == turns else "Any new mail?"
+
+    agent.run(
+        input_fn=next_input, print_fn=lambda line: None, stream_fn=lambda text: None
+    )
+    agent.client.close()
+    latencies.sort()
+    print(
+        f"{label:<28} mean {statistics.mean(latencies) * 1000:7.1f} ms"
+        f"  p95 {latencies[int(len(latencies) * 0.95) - 1] * 1000:7.1f} ms"
+        f"  ttft {statistics.mean(ttfts) * 1000:6.1f} ms"
+    )
+
+
+def main(turns: int, latency: float) -> None:
+    # The agent logs every turn at INFO.
+    logging.basicConfig(level=logging.WARNING)
+    Handler.latency = latency
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    pooled = BackendProfile(
+        model="stub",
+        base_url=f"http://127.0.0.1:{server.server_port}/v1",
+        max_retries=0,
+    )
+    try:
+        for label, backend in (
+            ("keep-alive", pooled),
+            ("new connection per request", replace(pooled, keepalive=0)),
+        ):
+            measure(label, backend, turns, stream=False)
+            measure(f"{label}, streaming", backend, turns, stream=True)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--turns", type=int, default=50)
+    parser.add_argument(
+        "--latency", type=float, default=0.002, help="Server delay per request"
+    )
+    args = parser.parse_args()
+    main(args.turns, args.latency)
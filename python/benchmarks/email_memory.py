@@ -0,0 +1,81 @@
+"""Measure the heap used by a large backlog of parsed :class:`Email` objects.
+
+Synthetic ``messages.get`` responses in the ``metadata`` format are parsed
+with :func:`local_py.gmail_poller.email_from_message` and the allocated memory
+is reported per message. For comparison the same fields are also stored in
+an equivalent dataclass without slots and without interned strings.
+"""
+
+from __future__ import annotations
+
+import argparse
+import gc
+import json
+import tracemalloc
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+from local_py.gmail_poller import email_from_message
+
+
+@dataclass
+class PlainEmail:
+    id: str
+    snippet: str
+    thread_id: Optional[str] = None
+    label_ids: Optional[List[str]] = None
+    headers: Optional[Dict[str, str]] = None
+
+
+def plain_from_message(message: Dict[str, Any]) -> PlainEmail:
+    payload = message["payload"]
+    return PlainEmail(
+        id=message["id"],
+        snippet=message["snippet"],
+        thread_id=message["threadId"],
+        label_ids=message["labelIds"],
+        headers={h["name"]: h["value"] for h in payload["headers"]},
+    )
+
+
+def responses(count: int) -> List[str]:
+    """Return raw JSON bodies, so every run parses its own fresh strings."""
+    return [
+        json.dumps(
+            {
+                "id": f"{i:016x}",
+                "threadId": f"{i // 3:016x}",
+                "labelIds": ["UNREAD", "INBOX", "CATEGORY_UPDATES"],
+                "snippet": f"Message number {i} about the quarterly report",
+                "payload": {
+                    "headers": [
+                        {"name": "From", "value": f"user{i % 97}@example.com"},
+                        {"name": "Subject", "value": f"Report {i}"},
+                        {"name": "Date", "value": "Mon, 6 Jan 2025 10:00:00 +0000"},
+                    ]
+                },
+            }
+        )
+        for i in range(count)
+    ]
+
+
+def measure(label: str, parse: Callable[[Dict[str, Any]], object], count: int) -> None:
+    bodies = responses(count)
+    gc.collect()
+    tracemalloc.start()
+    emails = [parse(json.loads(body)) for body in bodies]
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<24} {current / len(emails):8.0f} bytes/message")
+
+
+def main(count: int) -> None:
+    measure("dataclass", plain_from_message, count)
+    measure("slots + interning", email_from_message, count)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=50_000)
+    main(parser.parse_args().messages)
@@ -0,0 +1,100 @@
+"""Guard the import time of the agent entry points with ``-X importtime``.
+
+Each module is imported in a fresh interpreter several times. The table
+shows the median cumulative import time reported by ``-X importtime`` and
+the slowest third-party packages pulled in. The run fails when a module
+exceeds ``--budget-ms`` or imports a dependency that must stay deferred
+until it is needed, so it can gate changes in CI.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Set, Tuple
+
+MODULES = (
+    "local_py.gmail_poller",
+    "local_py.poll_gmail_agent",
+    "chat_gmail_agent",
+)
+# Dependencies loaded only by the code paths that use them.
+DEFERRED = (
+    "semantic_kernel",
+    "googleapiclient",
+    "google_auth_oauthlib",
+    "httplib2",
+    "openai",
+    "aiohttp",
+    "psycopg",
+)
+
+
+def import_times(module: str) -> Dict[str, int]:
+    """Return the cumulative import time in microseconds of every module."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+        env={**os.environ, "PYTHONPATH": os.pathsep.join(sys.path)},
+    )
+    times: Dict[str, int] = {}
+    for line in result.stderr.splitlines():
+        # "import time:  self [us] | cumulative | imported package"
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def measure(
+    module: str, runs: int, startup: Set[str]
+) -> Tuple[float, List[Tuple[str, int]], List[str]]:
+    totals = []
+    for _ in range(runs):
+        times = import_times(module)
+        totals.append(times[module])
+    packages = {
+        name: cumulative
+        for name, cumulative in times.items()
+        if "." not in name and name != module and name not in startup
+    }
+    slowest = sorted(packages.items(), key=lambda item: -item[1])[:3]
+    deferred = [name for name in DEFERRED if name in times]
+    return statistics.median(totals) / 1000, slowest, deferred
+
+
+def main(runs: int, budget_ms: float) -> int:
+    # Modules the interpreter loads before running any code, e.g. from .pth
+    # files, are not attributed to the entry points.
+    startup = set(import_times("sys"))
+    failures = 0
+    for module in MODULES:
+        median_ms, slowest, deferred = measure(module, runs, startup)
+        heaviest = ", ".join(f"{name} {us / 1000:.0f}" for name, us in slowest)
+        print(f"{module:<28} {median_ms:8.1f} ms   slowest: {heaviest}")
+        if median_ms > budget_ms:
+            print(f"  over budget of {budget_ms:.0f} ms")
+            failures += 1
+        if deferred:
+            print(f"  imports deferred dependencies: {', '.join(deferred)}")
+            failures += 1
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="Imports per module")
+    parser.add_argument(
+        "--budget-ms",
+        type=float,
+        default=300.0,
+        help="Maximum median import time of each module",
+    )
+    args = parser.parse_args()
+    sys.exit(main(args.runs, args.budget_ms))
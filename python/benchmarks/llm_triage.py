@@ -0,0 +1,172 @@
+"""Measure TriageHandler throughput against a local stub model server.
+
+The stub speaks the OpenAI chat completions API over HTTP/1.1 keep-alive and
+answers every triage request with JSON results. Its delay per request stands
+in for the time to first token and its delay per email for generating each
+result, so packing emails saves the former but not the latter. A fraction of
+results can be left out of replies to exercise retries. Batch size 1 with
+concurrency 1 is one request per email, as a chat turn per email would be.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List
+
+from local_py.email_triage import TriageError, TriageHandler
+from local_py.gmail_poller import Email
+from local_py.llm_backend import BackendProfile
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    latency = 0.0
+    per_email = 0.0
+    drop_rate = 0.0
+    requests = 0
+    rng = random.Random(0)
+    lock = threading.Lock()
+
+    def do_POST(self) -> None:
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        emails = json.loads(request["messages"][-1]["content"])
+        with self.lock:
+            type(self).requests += 1
+            kept = [email for email in emails if self.rng.random() >= self.drop_rate]
+        time.sleep(self.latency + self.per_email * len(emails))
+        results = [
+            {
+                "id": email["id"],
+                "category": "fyi",
+                "priority": "normal",
+                "summary": f"{email['subject']}.",
+            }
+            for email in kept
+        ]
+        completion = {
+            "id": "chatcmpl-stub",
+            "object": "chat.completion",
+            "created": 0,
+            "model": request["model"],
+            "choices": [
+                {
+                    "index": 0,
+                    "finish_reason": "stop",
+                    "message": {
+                        "role": "assistant",
+                        "content": json.dumps({"results": results}),
+                    },
+                }
+            ],
+            "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+        }
+        body = json.dumps(completion).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: object) -> None:
+        pass
+
+
+def make_emails(count: int) -> List[Email]:
+    return [
+        Email(
+            id=f"{i:016x}",
+            snippet=f"Message number {i} about the quarterly report",
+            headers={"From": f"user{i % 50}@example.com", "Subject": f"Report {i}"},
+        )
+        for i in range(count)
+    ]
+
+
+async def measure(
+    backend: BackendProfile, emails: List[Email], batch_size: int, concurrency: int
+) -> None:
+    handler = TriageHandler(
+        backend=backend,
+        batch_size=batch_size,
+        concurrency=concurrency,
+        retry_delay=0.01,
+    )
+    requests = Handler.requests
+    failed = 0
+    start = time.perf_counter()
+    for email in emails:
+        await handler.handle(email)
+    try:
+        await handler.flush()
+    except TriageError as exc:
+        failed = len(exc.message_ids)
+    elapsed = time.perf_counter() - start
+    handler.client.close()
+    print(
+        f"batch {batch_size:>4}  concurrency {concurrency:>3}"
+        f"  {len(emails) / elapsed:9.1f} emails/s"
+        f"  {Handler.requests - requests:6d} requests  {failed:4d} failed"
+    )
+
+
+async def main(messages: int, batch_sizes: List[int], concurrencies: List[int]) -> None:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    emails = make_emails(messages)
+    try:
+        for concurrency in concurrencies:
+            backend = BackendProfile(
+                model="stub",
+                base_url=f"http://127.0.0.1:{server.server_port}/v1",
+                max_retries=0,
+                max_connections=concurrency,
+            )
+            for batch_size in batch_sizes:
+                await measure(backend, emails, batch_size, concurrency)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument(
+        "--batch-sizes", default="1,10,50", help="Comma-separated batch sizes"
+    )
+    parser.add_argument(
+        "--concurrency", default="1,4", help="Comma-separated request limits"
+    )
+    parser.add_argument(
+        "--latency", type=float, default=0.05, help="Server delay per request"
+    )
+    parser.add_argument(
+        "--per-email", type=float, default=0.002, help="Server delay per email"
+    )
+    parser.add_argument(
+        "--drop-rate",
+        type=float,
+        default=0.02,
+        help="Fraction of results left out of replies",
+    )
+    args = parser.parse_args()
+    # Every result is logged at INFO.
+    logging.basicConfig(level=logging.WARNING)
+    Handler.latency = args.latency
+    Handler.per_email = args.per_email
+    Handler.drop_rate = args.drop_rate
+    asyncio.run(
+        main(
+            args.messages,
+            [int(size) for size in args.batch_sizes.split(",")],
+            [int(limit) for limit in args.concurrency.split(",")],
+        )
+    )
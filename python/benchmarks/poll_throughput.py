@@ -0,0 +1,127 @@
+"""Measure poll throughput, latency and memory against a fake Gmail server.
+
+Every run refills a :class:`~testing.fake_gmail.FakeGmailServer` mailbox
+with a backlog of unread messages and drains it with one poll, either
+straight through :meth:`GmailPoller.poll` or through
+:meth:`GmailPollingAgent.poll_once`. The table reports messages per second
+over all runs, the p50 and p99 duration of a poll and the peak memory
+allocated during one poll as traced by :mod:`tracemalloc`, which slows the
+traced run down and is therefore measured separately.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import statistics
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, List, Optional
+
+from local_py.gmail_poller import GmailPoller
+from local_py.gmail_polling_agent import GmailPollingAgent
+from local_py.gmail_quota import QuotaLimiter
+from local_py.gmail_transport import PooledHttp
+from testing.fake_gmail import FakeGmailServer
+
+
+def percentile(samples: List[float], fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def make_poller(server: FakeGmailServer) -> GmailPoller:
+    # The fake is not rate limited, so neither is the client.
+    return GmailPoller(
+        service=server.service(transport=PooledHttp),
+        limiter=QuotaLimiter(1e9),
+    )
+
+
+def poll_directly(server: FakeGmailServer) -> Callable[[], int]:
+    poller = make_poller(server)
+    return lambda: len(poller.poll())
+
+
+def poll_with_agent(server: FakeGmailServer) -> Callable[[], int]:
+    agent = GmailPollingAgent(make_poller(server))
+    return lambda: asyncio.run(agent.poll_once())
+
+
+def measure(
+    label: str,
+    server: FakeGmailServer,
+    make_run: Callable[[FakeGmailServer], Callable[[], int]],
+    size: int,
+    runs: int,
+) -> None:
+    run = make_run(server)
+    samples: List[float] = []
+    fetched = 0
+    for _ in range(runs):
+        server.reset(size)
+        start = time.perf_counter()
+        fetched += run()
+        samples.append(time.perf_counter() - start)
+    server.reset(size)
+    tracemalloc.start()
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(
+        f"{label:<18} {size:>7} {fetched / sum(samples):10.1f}"
+        f" {statistics.median(samples) * 1000:10.2f}"
+        f" {percentile(samples, 0.99) * 1000:10.2f} {peak / 1024:10.1f}"
+    )
+
+
+def main(
+    sizes: List[int],
+    runs: int,
+    latency: float,
+    error_rate: float,
+    replay: Optional[Path],
+) -> None:
+    # Injected failures are logged by the poller on every run.
+    logging.disable(logging.WARNING)
+    print(
+        f"{'poller':<18} {'backlog':>7} {'msgs/s':>10} {'p50 ms':>10}"
+        f" {'p99 ms':>10} {'peak KiB':>10}"
+    )
+    with FakeGmailServer(
+        latency=latency, error_rate=error_rate, replay=replay
+    ) as server:
+        for size in sizes:
+            measure("GmailPoller", server, poll_directly, size, runs)
+            measure("GmailPollingAgent", server, poll_with_agent, size, runs)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--sizes",
+        default="10,100,1000",
+        help="Comma-separated backlog sizes",
+    )
+    parser.add_argument("--runs", type=int, default=10, help="Polls per size")
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="Server delay per request"
+    )
+    parser.add_argument(
+        "--error-rate", type=float, default=0.0, help="Fraction of failed calls"
+    )
+    parser.add_argument(
+        "--replay",
+        type=Path,
+        help="Answer from a recording made with testing.fake_gmail.RecordingHttp",
+    )
+    args = parser.parse_args()
+    main(
+        [int(size) for size in args.sizes.split(",")],
+        args.runs,
+        args.latency,
+        args.error_rate,
+        args.replay,
+    )
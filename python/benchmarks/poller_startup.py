@@ -0,0 +1,87 @@
+"""Measure how long it takes to construct a :class:`GmailPoller`.
+
+The benchmark writes a throwaway token that is valid for an hour, so no
+network access or OAuth flow is needed. It compares building the Gmail
+service from scratch for every poller with the process-wide cache used by
+:func:`local_py.gmail_poller.get_service`, which only holds services with a
+thread-safe transport. A default poller still reuses the parsed discovery
+document and the cached credentials.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Callable, List
+
+import httplib2
+from google_auth_httplib2 import AuthorizedHttp
+from googleapiclient.discovery import build
+
+from local_py.gmail_poller import GmailPoller, clear_auth_cache, load_credentials
+from local_py.gmail_transport import PooledHttp
+
+
+def write_token(path: Path) -> None:
+    expiry = datetime.now(timezone.utc) + timedelta(hours=1)
+    path.write_text(
+        json.dumps(
+            {
+                "token": "benchmark-token",
+                "refresh_token": "benchmark-refresh",
+                "client_id": "benchmark-client",
+                "client_secret": "benchmark-secret",
+                "expiry": expiry.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            }
+        )
+    )
+
+
+def measure(label: str, run: Callable[[], object], iterations: int) -> None:
+    samples: List[float] = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        run()
+        samples.append(time.perf_counter() - start)
+    print(
+        f"{label:<28} median {statistics.median(samples) * 1000:8.3f} ms"
+        f"  max {max(samples) * 1000:8.3f} ms"
+    )
+
+
+def main(iterations: int) -> None:
+    with tempfile.TemporaryDirectory() as tmpdir:
+        token_path = Path(tmpdir) / "token.json"
+        write_token(token_path)
+
+        def uncached() -> object:
+            # What every GmailPoller used to do on construction.
+            creds = load_credentials(token_path, Path(tmpdir) / "unused.json")
+            http = AuthorizedHttp(creds, http=httplib2.Http(timeout=10.0))
+            return build("gmail", "v1", http=http)
+
+        def cold() -> object:
+            clear_auth_cache()
+            return GmailPoller(token_path=token_path, transport=PooledHttp)
+
+        def warm() -> object:
+            return GmailPoller(token_path=token_path, transport=PooledHttp)
+
+        def unshared() -> object:
+            return GmailPoller(token_path=token_path)
+
+        measure("build() per poller", uncached, iterations)
+        measure("GmailPoller, cold cache", cold, iterations)
+        measure("GmailPoller, warm cache", warm, iterations)
+        measure("GmailPoller, httplib2", unshared, iterations)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=50)
+    main(parser.parse_args().iterations)
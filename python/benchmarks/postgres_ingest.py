@@ -0,0 +1,89 @@
+"""Measure how many messages per second :class:`PostgresSink` ingests.
+
+Needs a PostgreSQL server configured by ``PG_HOST``, ``PG_PORT``,
+``PG_USER``, ``PG_PASS`` and ``DB_NAME``. Synthetic messages with a small
+body are written to a scratch table, dropped afterwards, once per batch
+size. Each size is run twice, inserting new rows and then updating them, as
+happens when a backlog is fetched again after a restart.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import base64
+import time
+import uuid
+from typing import List
+
+import psycopg
+from psycopg import sql
+
+from local_py.gmail_poller import Email
+from local_py.postgres_sink import PostgresSink, conninfo_from_env
+
+BODY = base64.urlsafe_b64encode(b"Quarterly numbers attached.\n" * 40).decode()
+
+
+def make_emails(count: int) -> List[Email]:
+    return [
+        Email(
+            id=f"{i:016x}",
+            snippet=f"Message number {i} about the quarterly report",
+            thread_id=f"{i // 3:016x}",
+            label_ids=["INBOX", "UNREAD"],
+            headers={"From": f"user{i % 50}@example.com", "Subject": f"Report {i}"},
+            encoded_body=(BODY,),
+        )
+        for i in range(count)
+    ]
+
+
+async def ingest(sink: PostgresSink, emails: List[Email]) -> float:
+    start = time.perf_counter()
+    for email in emails:
+        await sink.handle(email)
+    await sink.flush()
+    return time.perf_counter() - start
+
+
+async def main(messages: int, batch_sizes: List[int], pool_size: int) -> None:
+    emails = make_emails(messages)
+    conninfo = conninfo_from_env()
+    async with await psycopg.AsyncConnection.connect(conninfo, autocommit=True) as conn:
+        for batch_size in batch_sizes:
+            table = f"emails_benchmark_{uuid.uuid4().hex[:8]}"
+            sink = PostgresSink(
+                conninfo, table=table, batch_size=batch_size, pool_size=pool_size
+            )
+            try:
+                inserted = await ingest(sink, emails)
+                updated = await ingest(sink, emails)
+            finally:
+                await sink.close()
+                await conn.execute(
+                    sql.SQL("DROP TABLE IF EXISTS {}").format(sql.Identifier(table))
+                )
+            print(
+                f"batch {batch_size:>6}  insert {messages / inserted:10.1f} msg/s"
+                f"  upsert {messages / updated:10.1f} msg/s"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument(
+        "--batch-sizes",
+        default="10,100,1000",
+        help="Comma-separated sink batch sizes",
+    )
+    parser.add_argument("--pool-size", type=int, default=4)
+    args = parser.parse_args()
+    asyncio.run(
+        main(
+            args.messages,
+            [int(size) for size in args.batch_sizes.split(",")],
+            args.pool_size,
+        )
+    )
@@ -0,0 +1,100 @@
+"""Compare Gmail HTTP transports by requests per second on a local server.
+
+A threaded HTTP/1.1 keep-alive server answers every request with a small JSON
+body after a configurable delay that stands in for network latency. Each
+transport sends the same number of requests from one or more threads.
+``httplib2.Http`` cannot be shared between threads, so the multi-threaded run
+serializes it behind a lock, which is what sharing one Gmail service across
+workers would require.
+"""
+
+from __future__ import annotations
+
+import argparse
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable
+
+import httplib2
+
+from local_py.gmail_transport import PooledHttp
+
+BODY = b'{"id": "1", "snippet": "hello"}'
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes; without this, delayed ACKs
+    # add ~40 ms to every keep-alive response.
+    disable_nagle_algorithm = True
+    latency = 0.0
+
+    def do_GET(self) -> None:
+        time.sleep(self.latency)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(BODY)))
+        self.end_headers()
+        self.wfile.write(BODY)
+
+    def log_message(self, format: str, *args: object) -> None:
+        pass
+
+
+class LockedHttp:
+    """Make ``httplib2.Http`` safe to share by allowing one request at a time."""
+
+    def __init__(self) -> None:
+        self.http = httplib2.Http(timeout=10)
+        self.lock = threading.Lock()
+
+    def request(self, uri: str) -> Any:
+        with self.lock:
+            return self.http.request(uri)
+
+
+def measure(
+    label: str, request: Callable[[str], Any], url: str, count: int, threads: int
+) -> None:
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        for response, _ in executor.map(request, [url] * count):
+            assert response.status == 200
+    elapsed = time.perf_counter() - start
+    print(f"{label:<32} {count / elapsed:10.1f} req/s")
+
+
+def main(count: int, threads: int, latency: float) -> None:
+    Handler.latency = latency
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/gmail/v1/users/me/messages/1"
+    try:
+        measure("httplib2.Http, 1 thread", LockedHttp().request, url, count, 1)
+        measure(
+            f"httplib2.Http, {threads} threads",
+            LockedHttp().request,
+            url,
+            count,
+            threads,
+        )
+        pooled = PooledHttp(maxsize=threads)
+        measure("PooledHttp, 1 thread", pooled.request, url, count, 1)
+        measure(f"PooledHttp, {threads} threads", pooled.request, url, count, threads)
+        pooled.close()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument(
+        "--latency", type=float, default=0.005, help="Server delay per request"
+    )
+    args = parser.parse_args()
+    main(args.requests, args.threads, args.latency)
@@ -2,16 +2,34 @@
 
 from __future__ import annotations
 
+import argparse
+import copy
+import hashlib
 import json
 import logging
-import os
-from dataclasses import asdict
-from typing import Any, Callable, List
-
-from openai import OpenAI
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import replace
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
+from local_py.chat_context import DEFAULT_TOKEN_BUDGET, ChatContext
 from local_py.gmail_poller import Email, GmailPoller
+from local_py.llm_backend import BACKENDS, BackendProfile, load_backends
+from local_py.mail_index import MailIndex
+from local_py.metrics import NULL_METRICS, Metrics, MetricsServer
+from local_py.response_cache import DEFAULT_POLL_TTL, LRUCache, TTLCache
+
+# Tool calls of one turn run concurrently on this many threads.
+DEFAULT_TOOL_WORKERS = 4
+# Completions per user message that may request tools; the next must answer.
+MAX_TOOL_ROUNDS = 3
 
+SYSTEM_PROMPT = (
+    "You are a helpful assistant. Use the gmail_poll tool to check for "
+    "unread emails when the user requests it. Large results only list message "
+    "IDs; use gmail_expand to read the emails you need."
+)
 
 # Description of the Gmail poll function exposed to the model.
 GMAIL_POLL_TOOL = [
@@ -35,89 +53,534 @@ GMAIL_POLL_TOOL = [
     }
 ]
 
+# Description of the function returning full details of polled emails.
+GMAIL_EXPAND_TOOL = [
+    {
+        "type": "function",
+        "function": {
+            "name": "gmail_expand",
+            "description": (
+                "Return the full details of emails found by gmail_poll by their IDs."
+            ),
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "ids": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "IDs of the emails to return.",
+                    }
+                },
+                "required": ["ids"],
+            },
+        },
+    }
+]
+
+# Description of the local mail index search, offered when an index is set.
+GMAIL_SEARCH_TOOL = [
+    {
+        "type": "function",
+        "function": {
+            "name": "gmail_search",
+            "description": (
+                "Search emails fetched earlier, including read ones, in a local "
+                "index. Fast, and does not mark anything as read. Returns the "
+                "match count, top senders and the newest matches."
+            ),
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "query": {
+                        "type": "string",
+                        "description": "Words that must all appear in the email.",
+                    },
+                    "sender": {
+                        "type": "string",
+                        "description": "Part of the sender's name or address.",
+                    },
+                    "label": {
+                        "type": "string",
+                        "description": "Gmail label ID, e.g. UNREAD or INBOX.",
+                    },
+                    "thread_id": {"type": "string"},
+                    "since": {
+                        "type": "string",
+                        "description": "ISO date; only emails sent on or after it.",
+                    },
+                    "until": {
+                        "type": "string",
+                        "description": "ISO date; only emails sent before it.",
+                    },
+                    "limit": {
+                        "type": "integer",
+                        "description": "Maximum number of emails to return.",
+                    },
+                },
+            },
+        },
+    }
+]
+
+SEARCH_PROMPT = (
+    " Answer questions about mail that was already fetched with gmail_search; "
+    "only call gmail_poll to check for new mail."
+)
+
+TOOLS: List[Dict[str, Any]] = [*GMAIL_POLL_TOOL, *GMAIL_EXPAND_TOOL]
+
+# Reply text and tool calls of one completion.
+Completion = Tuple[str, List[Dict[str, Any]]]
+
+
+def _print_token(text: str) -> None:
+    print(text, end="", flush=True)
+
 
 class ChatGmailAgent:
-    """Chat agent that can poll Gmail via tool calls."""
+    """Chat agent that can poll Gmail via tool calls.
+
+    Tool calls requested in one turn run concurrently, so the poller must be
+    safe to call from several threads, e.g. a
+    :class:`~local_py.gmail_poller.GmailPoller` using
+    :class:`~local_py.gmail_transport.PooledHttp`.
+    """
 
-    def __init__(self, poller: GmailPoller, client: Any | None = None) -> None:
+    def __init__(
+        self,
+        poller: GmailPoller,
+        client: Any | None = None,
+        *,
+        stream: bool = False,
+        backend: Optional[BackendProfile] = None,
+        tool_workers: int = DEFAULT_TOOL_WORKERS,
+        token_budget: int = DEFAULT_TOKEN_BUDGET,
+        poll_cache_ttl: float = DEFAULT_POLL_TTL,
+        completion_cache: Optional[LRUCache[str, Completion]] = None,
+        index: Optional[MailIndex] = None,
+        metrics: Optional[Metrics] = None,
+    ) -> None:
+        """Create a new :class:`ChatGmailAgent`.
+
+        Args:
+            poller: Poller backing the ``gmail_poll`` tool.
+            client: OpenAI client. Defaults to one created by *backend*.
+            stream: Print replies token by token as they arrive.
+            backend: Model, endpoint and connection settings. Defaults to
+                the OpenAI API with ``OPENAI_API_KEY``.
+            tool_workers: Maximum number of tool calls running at once.
+            token_budget: Estimated tokens of conversation history sent with
+                each request. Older turns are summarized to stay within it.
+            poll_cache_ttl: Seconds to reuse successful ``gmail_poll`` results
+                for the same sender. ``0`` disables the cache.
+            completion_cache: Cache of completions by exact request. It may
+                be shared between agents.
+            index: Local mail index searched by the ``gmail_search`` tool,
+                usually the one a background poller writes to. Cached
+                ``gmail_poll`` results are dropped once another process
+                indexes new mail.
+            metrics: Records the time spent waiting for the model and in
+                each tool, time to first token, turn time and token usage.
+        """
         self.poller = poller
-        api_key = os.environ.get("OPENAI_API_KEY")
-        self.client: Any = client or OpenAI(api_key=api_key) if api_key else OpenAI()
+        self.backend = backend or BackendProfile()
+        self.client: Any = client or self.backend.create_client()
+        self.stream = stream
+        self.tool_workers = tool_workers
+        # Seconds from sending the last request until its first token arrived.
+        self.last_ttft: Optional[float] = None
+        # Seconds from the last user message until its reply was complete.
+        self.last_turn_seconds: Optional[float] = None
+        self.index = index
+        self.tools = TOOLS + GMAIL_SEARCH_TOOL if index is not None else TOOLS
+        self.context = ChatContext(
+            SYSTEM_PROMPT + SEARCH_PROMPT if index is not None else SYSTEM_PROMPT,
+            token_budget=token_budget,
+        )
+        # Tokens reported by the API for the last user turn.
+        self.last_usage: Dict[str, int] = {}
+        self.poll_cache: Optional[TTLCache[Optional[str], List[Email]]] = (
+            TTLCache(poll_cache_ttl) if poll_cache_ttl > 0 else None
+        )
+        self.completion_cache = completion_cache
+        # Index version the poll cache was last checked against.
+        self._index_version = index.data_version() if index is not None else None
+        self.metrics = metrics if metrics is not None else NULL_METRICS
+
+    def notify_new_mail(self) -> None:
+        """Drop cached ``gmail_poll`` results after new mail arrived.
+
+        Called automatically when another process writes to :attr:`index`.
+        Without an index, only the TTL expires cached results unless the
+        caller invokes this, e.g. from a push notification handler. Safe to
+        call from any thread.
+        """
+        if self.poll_cache is not None:
+            self.poll_cache.invalidate()
 
     def _handle_gmail_poll(self, args: str) -> List[Email]:
         """Invoke :class:`GmailPoller` with the provided JSON arguments."""
-        params = json.loads(args or "{}")
-        return self.poller.poll(sender=params.get("sender"))
+        sender = json.loads(args or "{}").get("sender")
+        if self.poll_cache is None:
+            return self.poller.poll(sender=sender)
+        if self.index is not None:
+            version = self.index.data_version()
+            if version != self._index_version:
+                self._index_version = version
+                self.notify_new_mail()
+        emails = self.poll_cache.get(sender)
+        if emails is None:
+            emails = self.poller.poll(sender=sender)
+            # A failed poll returns what it got so far; ask Gmail again next
+            # time instead of hiding mail for the whole TTL.
+            if self.poller.last_error is None:
+                self.poll_cache.put(sender, emails)
+        return emails
 
     def run(
         self,
         input_fn: Callable[[str], str] = input,
         print_fn: Callable[[str], None] = print,
+        stream_fn: Callable[[str], None] = _print_token,
     ) -> None:
-        """Start the interactive chat loop."""
+        """Start the interactive chat loop.
+
+        Args:
+            input_fn: Reads the next user message.
+            print_fn: Prints a complete line.
+            stream_fn: Prints streamed reply fragments without a line break.
+        """
 
         logging.basicConfig(level=logging.INFO)
 
-        messages = [
-            {
-                "role": "system",
-                "content": (
-                    "You are a helpful assistant. Use the gmail_poll tool to check for "
-                    "unread emails when the user requests it."
-                ),
-            }
-        ]
+        pending: List[Tuple[Dict[str, Any], Future[Any]]] = []
+
+        def start_tool(call: Dict[str, Any]) -> None:
+            # Streamed calls start as soon as their arguments are complete,
+            # while the model is still writing the next one.
+            if call["function"]["name"] == "gmail_poll":
+                print_fn("Checking Gmail...")
+            pending.append((call, executor.submit(self._run_tool, call["function"])))
 
         print_fn("Type 'exit' to quit.")
-        while True:
-            user = input_fn("User > ")
-            if user.strip().lower() in {"exit", "quit"}:
-                break
-            messages.append({"role": "user", "content": user})
-
-            response = self.client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=messages,
-                tools=GMAIL_POLL_TOOL,
-                tool_choice="auto",
-            )
+        with ThreadPoolExecutor(
+            max_workers=self.tool_workers, thread_name_prefix="chat-tool"
+        ) as executor:
+            while True:
+                user = input_fn("User > ")
+                if user.strip().lower() in {"exit", "quit"}:
+                    break
+                self.context.add_user(user)
+                self.last_usage = {"prompt_tokens": 0, "completion_tokens": 0}
+                turn_start = time.perf_counter()
+
+                for round in range(MAX_TOOL_ROUNDS + 1):
+                    pending.clear()
+                    content, calls = self._complete(
+                        self.context.messages,
+                        stream_fn,
+                        on_tool_call=start_tool if round < MAX_TOOL_ROUNDS else None,
+                    )
+                    if not calls:
+                        break
+                    self.context.add_assistant(content, calls)
+                    self._record_tool_results(pending, print_fn)
+                self.context.add_assistant(content)
+                if not self.stream:
+                    print_fn(content)
+                self.last_turn_seconds = time.perf_counter() - turn_start
+                self.metrics.observe("chat_turn_seconds", self.last_turn_seconds)
+                logging.info(
+                    "Turn took %.2fs and used %d prompt and %d completion tokens; "
+                    "history is about %d tokens",
+                    self.last_turn_seconds,
+                    self.last_usage["prompt_tokens"],
+                    self.last_usage["completion_tokens"],
+                    self.context.tokens(),
+                )
+        for name, cache in (
+            ("Poll", self.poll_cache),
+            ("Completion", self.completion_cache),
+        ):
+            if cache is not None:
+                logging.info("%s cache: %s", name, cache.stats())
+
+    def _complete(
+        self,
+        messages: List[Dict[str, Any]],
+        stream_fn: Callable[[str], None],
+        on_tool_call: Optional[Callable[[Dict[str, Any]], None]] = None,
+    ) -> Completion:
+        """Request a completion and return its text and tool calls.
+
+        Tools are only offered when *on_tool_call* is given; it receives each
+        tool call as soon as it is complete.
+        """
+        kwargs: Dict[str, Any] = {
+            **self.backend.request_params(),
+            "messages": list(messages),
+        }
+        if on_tool_call is not None:
+            kwargs.update(tools=self.tools, tool_choice="auto")
+        if self.completion_cache is None:
+            with self.metrics.timer("chat_llm_seconds"):
+                return self._request(kwargs, stream_fn, on_tool_call)
+
+        key = hashlib.sha256(
+            json.dumps(kwargs, sort_keys=True).encode("utf-8")
+        ).hexdigest()
+        cached = self.completion_cache.get(key)
+        if cached is None:
+            with self.metrics.timer("chat_llm_seconds"):
+                content, calls = self._request(kwargs, stream_fn, on_tool_call)
+            self.completion_cache.put(key, copy.deepcopy((content, calls)))
+            return content, calls
+        content, calls = copy.deepcopy(cached)
+        self.last_ttft = 0.0
+        if self.stream and content:
+            stream_fn(content)
+            stream_fn("\n")
+        if on_tool_call is not None:
+            for call in calls:
+                on_tool_call(call)
+        return content, calls
+
+    def _request(
+        self,
+        kwargs: Dict[str, Any],
+        stream_fn: Callable[[str], None],
+        on_tool_call: Optional[Callable[[Dict[str, Any]], None]],
+    ) -> Completion:
+        start = time.perf_counter()
+        if not self.stream:
+            response = self.client.chat.completions.create(**kwargs)
+            self._record_ttft(start)
+            self._record_usage(getattr(response, "usage", None))
             message = response.choices[0].message
+            calls = [
+                {
+                    "id": call.id,
+                    "type": "function",
+                    "function": {
+                        "name": call.function.name,
+                        "arguments": call.function.arguments,
+                    },
+                }
+                for call in getattr(message, "tool_calls", None) or []
+            ]
+            if on_tool_call is not None:
+                for call in calls:
+                    on_tool_call(call)
+            return message.content or "", calls
+
+        parts: List[str] = []
+        calls = []
+        first = True
+        for chunk in self.client.chat.completions.create(
+            stream=True, stream_options={"include_usage": True}, **kwargs
+        ):
+            if not chunk.choices:
+                # The final chunk carries the token usage of the request.
+                self._record_usage(getattr(chunk, "usage", None))
+                continue
+            delta = chunk.choices[0].delta
+            if first:
+                self._record_ttft(start)
+                first = False
+            if delta.content:
+                parts.append(delta.content)
+                stream_fn(delta.content)
+            for fragment in getattr(delta, "tool_calls", None) or []:
+                if fragment.index >= len(calls):
+                    if calls and on_tool_call is not None:
+                        on_tool_call(calls[-1])
+                    calls.append(
+                        {
+                            "id": fragment.id,
+                            "type": "function",
+                            "function": {
+                                "name": fragment.function.name,
+                                "arguments": "",
+                            },
+                        }
+                    )
+                if fragment.function.arguments:
+                    calls[fragment.index]["function"]["arguments"] += (
+                        fragment.function.arguments
+                    )
+        if calls and on_tool_call is not None:
+            on_tool_call(calls[-1])
+        if parts:
+            stream_fn("\n")
+        return "".join(parts), calls
+
+    def _record_ttft(self, start: float) -> None:
+        self.last_ttft = time.perf_counter() - start
+        self.metrics.observe("chat_ttft_seconds", self.last_ttft)
+        logging.debug("Time to first token: %.3fs", self.last_ttft)
+
+    def _record_usage(self, usage: Any) -> None:
+        if usage is None:
+            return
+        for key in ("prompt_tokens", "completion_tokens"):
+            self.last_usage[key] = self.last_usage.get(key, 0) + getattr(usage, key)
+            self.metrics.inc("chat_tokens_total", getattr(usage, key), kind=key)
+
+    def _run_tool(self, function: Dict[str, Any]) -> Any:
+        with self.metrics.timer("chat_tool_seconds", tool=function["name"]):
+            return self._call_tool(function)
 
-            if getattr(message, "tool_calls", None):
-                for call in message.tool_calls:
-                    if call.function.name == "gmail_poll":
-                        print_fn("Checking Gmail...")
-                        emails = self._handle_gmail_poll(call.function.arguments)
-                        count = len(emails)
-                        print_fn(
-                            f"Found {count} unread email{'s' if count != 1 else ''}."
-                        )
-                        content = json.dumps([asdict(email) for email in emails])
-                        messages.append(
-                            {
-                                "role": "tool",
-                                "tool_call_id": call.id,
-                                "content": content,
-                            }
-                        )
-
-                followup = self.client.chat.completions.create(
-                    model="gpt-4o-mini", messages=messages
+    def _call_tool(self, function: Dict[str, Any]) -> Any:
+        name = function["name"]
+        if name == "gmail_poll":
+            return self._handle_gmail_poll(function["arguments"])
+        if name == "gmail_search" and self.index is not None:
+            return self.index.search(**json.loads(function["arguments"] or "{}"))
+        if name == "gmail_expand":
+            return self.context.expand(json.loads(function["arguments"])["ids"])
+        raise ValueError(f"Unknown tool {name!r}")
+
+    def _record_tool_results(
+        self,
+        pending: List[Tuple[Dict[str, Any], Future[Any]]],
+        print_fn: Callable[[str], None],
+    ) -> None:
+        """Wait for started tool calls and add their results to the context."""
+        for call, future in pending:
+            try:
+                result = future.result()
+            except Exception as exc:
+                logging.warning("Tool %s failed: %s", call["function"]["name"], exc)
+                self.context.add_tool_result(
+                    call["id"], json.dumps({"error": str(exc)})
                 )
-                reply = followup.choices[0].message.content or ""
-                messages.append({"role": "assistant", "content": reply})
-                print_fn(reply)
                 continue
+            if call["function"]["name"] == "gmail_poll":
+                count = len(result)
+                print_fn(f"Found {count} unread email{'s' if count != 1 else ''}.")
+                self.context.add_emails(call["id"], result)
+            else:
+                self.context.add_tool_result(call["id"], json.dumps(result))
 
-            reply = message.content or ""
-            messages.append({"role": "assistant", "content": reply})
-            print_fn(reply)
 
+def main(
+    stream: bool = False,
+    token_budget: int = DEFAULT_TOKEN_BUDGET,
+    poll_cache_ttl: float = DEFAULT_POLL_TTL,
+    completion_cache_size: int = 0,
+    backend: Optional[BackendProfile] = None,
+    mail_index: Optional[Path] = None,
+    metrics_port: Optional[int] = None,
+    trace: bool = False,
+) -> None:
+    index = MailIndex(mail_index) if mail_index is not None else None
+    metrics = Metrics(tracing=trace) if metrics_port is not None or trace else None
+    server: Optional[MetricsServer] = None
+    if metrics is not None and metrics_port is not None:
+        server = MetricsServer(metrics, port=metrics_port)
+        server.start()
+    from local_py.gmail_transport import PooledHttp
 
-def main() -> None:
-    poller = GmailPoller()
-    ChatGmailAgent(poller).run()
+    # Tool calls run concurrently, so use the thread-safe transport.
+    poller = GmailPoller(transport=PooledHttp, index=index, metrics=metrics)
+    agent = ChatGmailAgent(
+        poller,
+        stream=stream,
+        token_budget=token_budget,
+        poll_cache_ttl=poll_cache_ttl,
+        completion_cache=(
+            LRUCache(completion_cache_size) if completion_cache_size > 0 else None
+        ),
+        backend=backend,
+        index=index,
+        metrics=metrics,
+    )
+    try:
+        agent.run()
+    finally:
+        if server is not None:
+            server.stop()
+        if metrics is not None:
+            metrics.log_json()
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Chat with an agent that reads Gmail")
+    parser.add_argument(
+        "--stream", action="store_true", help="Print replies as tokens arrive"
+    )
+    parser.add_argument(
+        "--token-budget",
+        type=int,
+        default=DEFAULT_TOKEN_BUDGET,
+        help="Estimated tokens of history sent with each request",
+    )
+    parser.add_argument(
+        "--poll-cache-ttl",
+        type=float,
+        default=DEFAULT_POLL_TTL,
+        help="Seconds to reuse gmail_poll results; 0 disables",
+    )
+    parser.add_argument(
+        "--completion-cache-size",
+        type=int,
+        default=0,
+        help="Completions to cache by exact request; 0 disables",
+    )
+    parser.add_argument(
+        "--backend",
+        default="openai",
+        help=f"Backend profile name (built in: {', '.join(BACKENDS)})",
+    )
+    parser.add_argument(
+        "--backends", type=Path, help="JSON file with additional backend profiles"
+    )
+    parser.add_argument("--model", help="Override the profile's model")
+    parser.add_argument("--base-url", help="Override the profile's endpoint")
+    parser.add_argument(
+        "--timeout", type=float, help="Override the profile's response timeout"
+    )
+    parser.add_argument(
+        "--max-tokens", type=int, help="Override the profile's max tokens per reply"
+    )
+    parser.add_argument(
+        "--mail-index",
+        type=Path,
+        help="SQLite file indexing fetched mail for the gmail_search tool",
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        help="Serve Prometheus metrics on this port at /metrics",
+    )
+    parser.add_argument(
+        "--trace",
+        action="store_true",
+        help="Record OpenTelemetry spans for model requests and tool calls",
+    )
+    args = parser.parse_args()
+    backends = load_backends(args.backends) if args.backends else BACKENDS
+    if args.backend not in backends:
+        parser.error(
+            f"unknown backend {args.backend!r}; available: {', '.join(backends)}"
+        )
+    overrides = {
+        name: value
+        for name, value in (
+            ("model", args.model),
+            ("base_url", args.base_url),
+            ("timeout", args.timeout),
+            ("max_tokens", args.max_tokens),
+        )
+        if value is not None
+    }
+    main(
+        stream=args.stream,
+        token_budget=args.token_budget,
+        poll_cache_ttl=args.poll_cache_ttl,
+        completion_cache_size=args.completion_cache_size,
+        backend=replace(backends[args.backend], **overrides),
+        mail_index=args.mail_index,
+        metrics_port=args.metrics_port,
+        trace=args.trace,
+    )
@@ -0,0 +1,338 @@
+"""Non-blocking Gmail poller built on :mod:`aiohttp`."""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, AsyncIterator, Dict, List, Optional
+
+from .gmail_poller import (
+    CREDENTIALS_PATH,
+    DEFAULT_MAX_RESULTS,
+    LIST_FIELDS,
+    MAX_MODIFY_IDS,
+    MAX_RESULTS_LIMIT,
+    TOKEN_PATH,
+    Attachment,
+    Email,
+    FetchProfile,
+    credentials_expiring,
+    decode_base64url,
+    email_from_message,
+    get_credentials,
+    parse_payload,
+)
+from .gmail_quota import QuotaLimiter, get_limiter, quota_units
+from .metrics import NULL_METRICS, Metrics
+
+if TYPE_CHECKING:
+    import aiohttp
+
+GMAIL_API_ROOT = "https://gmail.googleapis.com/gmail/v1"
+DEFAULT_MAX_CONCURRENCY = 10
+
+
+class AsyncGmailPoller:
+    """Poll the Gmail REST API for unread messages without blocking the loop.
+
+    Message bodies are fetched concurrently, bounded by ``max_concurrency``.
+    The public interface mirrors :class:`~local_py.gmail_poller.GmailPoller`
+    with coroutine and async generator variants of ``poll`` and
+    ``iter_unread``.
+    """
+
+    def __init__(
+        self,
+        *,
+        token_path: Path | str = TOKEN_PATH,
+        credentials_path: Path | str = CREDENTIALS_PATH,
+        credentials: Any | None = None,
+        session: aiohttp.ClientSession | None = None,
+        base_url: str = GMAIL_API_ROOT,
+        timeout: float = 10.0,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        max_results: int = DEFAULT_MAX_RESULTS,
+        profile: Optional[FetchProfile] = None,
+        limiter: Optional[QuotaLimiter] = None,
+        metrics: Optional[Metrics] = None,
+    ) -> None:
+        """Create a new :class:`AsyncGmailPoller`.
+
+        Args:
+            token_path: Path to the OAuth token JSON file. Only read when
+                *credentials* is not provided, in which case the credentials
+                are shared process-wide (see
+                :func:`~local_py.gmail_poller.get_credentials`).
+            credentials_path: Path to the OAuth client credentials.
+            credentials: Pre-loaded ``google.oauth2`` credentials. Refreshed in
+                a worker thread shortly before they expire.
+            session: Shared :class:`aiohttp.ClientSession`. When omitted, one
+                is created on first use and closed by :meth:`close`.
+            base_url: Root URL of the Gmail v1 REST API.
+            timeout: Timeout in seconds for each Gmail API request.
+            max_concurrency: Maximum number of requests in flight at once.
+            max_results: Page size requested from ``messages.list``.
+            profile: How much of each message to download. Defaults to the
+                ``metadata`` format.
+            limiter: Meters every Gmail call by its quota units and delays
+                calls that would exceed the per-user limit. Without
+                *credentials*, defaults to the limiter shared by all pollers
+                of *token_path*.
+            metrics: Records the latency of every Gmail call by method, time
+                spent waiting for quota and the number of messages fetched.
+        """
+
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+        if max_results < 1:
+            raise ValueError("max_results must be at least 1")
+        self.token_path = Path(token_path)
+        self.credentials_path = Path(credentials_path)
+        self.credentials: Any = credentials
+        self._shared_auth = credentials is None
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.max_results = min(max_results, MAX_RESULTS_LIMIT)
+        self.profile = profile or FetchProfile()
+        self.limiter = limiter
+        if limiter is None and credentials is None:
+            self.limiter = get_limiter(self.token_path)
+        self.metrics = metrics if metrics is not None else NULL_METRICS
+        self._session = session
+        self._owns_session = session is None
+        self._timeout: Any = None
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._auth_lock = asyncio.Lock()
+        # Error swallowed by the most recent :meth:`poll`, or ``None``.
+        self.last_error: Optional[Exception] = None
+        # Quota units this poller has charged to :attr:`limiter`, which other
+        # pollers may share.
+        self.units = 0
+
+    async def __aenter__(self) -> "AsyncGmailPoller":
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        """Close the HTTP session if it was created by this poller."""
+        if self._owns_session and self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def watch(
+        self, topic_name: str, label_ids: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        """Ask Gmail to publish mailbox changes to a Cloud Pub/Sub topic.
+
+        See :meth:`local_py.gmail_poller.GmailPoller.watch`.
+        """
+        return await self._request(
+            "POST",
+            "watch",
+            quota="users.watch",
+            json={
+                "topicName": topic_name,
+                "labelIds": label_ids or ["INBOX"],
+                "labelFilterBehavior": "INCLUDE",
+            },
+        )
+
+    async def poll(self, sender: Optional[str] = None) -> List[Email]:
+        """Return unread messages, marking them as read.
+
+        Errors are logged, stored in :attr:`last_error` and the messages
+        collected before the failure are returned.
+        """
+        emails: List[Email] = []
+        self.last_error = None
+        try:
+            async for email in self.iter_unread(sender):
+                emails.append(email)
+        except Exception as exc:  # pragma: no cover - network failure
+            logging.warning("Failed to poll Gmail: %s", exc)
+            self.last_error = exc
+        return emails
+
+    async def iter_unread(
+        self, sender: Optional[str] = None, *, ack: bool = True
+    ) -> AsyncIterator[Email]:
+        """Yield unread messages page by page as they are downloaded.
+
+        The IDs of every unread message are listed first. Each page is then
+        fetched concurrently and marked as read before its messages are
+        yielded, unless *ack* is ``False``; then the caller must call
+        :meth:`acknowledge` once a message has been handled. API errors
+        propagate to the caller.
+        """
+        query = f"from:{sender} is:unread" if sender else "is:unread"
+        # Page tokens are positions in the ``is:unread`` results, so marking
+        # a page read before listing the next would make it skip messages.
+        ids: List[str] = []
+        page_token: Optional[str] = None
+        while True:
+            params: Dict[str, Any] = {
+                "q": query,
+                "maxResults": self.max_results,
+                "fields": LIST_FIELDS,
+            }
+            if page_token:
+                params["pageToken"] = page_token
+            result = await self._request(
+                "GET", "messages", quota="users.messages.list", params=params
+            )
+            ids.extend(msg["id"] for msg in result.get("messages", []))
+            page_token = result.get("nextPageToken")
+            if not page_token:
+                break
+        for start in range(0, len(ids), self.max_results):
+            emails = await self._fetch_messages(ids[start : start + self.max_results])
+            self.metrics.inc("gmail_messages_fetched_total", len(emails))
+            if ack:
+                await self.acknowledge([email.id for email in emails])
+            for email in emails:
+                yield email
+
+    async def _fetch_messages(self, ids: List[str]) -> List[Email]:
+        """Fetch *ids* concurrently, skipping messages that fail to download."""
+        params = self.profile.request_params()
+        results = await asyncio.gather(
+            *(
+                self._request(
+                    "GET",
+                    f"messages/{message_id}",
+                    quota="users.messages.get",
+                    params=params,
+                )
+                for message_id in ids
+            ),
+            return_exceptions=True,
+        )
+        emails: List[Email] = []
+        for message_id, result in zip(ids, results):
+            if isinstance(result, BaseException):
+                logging.warning("Failed to fetch message %s: %s", message_id, result)
+                continue
+            emails.append(email_from_message(result))
+        return emails
+
+    async def load_body(self, email: Email) -> Email:
+        """Download the body and attachment list of *email* if still missing.
+
+        See :meth:`local_py.gmail_poller.GmailPoller.load_body`.
+        """
+        if email.encoded_body is None:
+            message = await self._request(
+                "GET",
+                f"messages/{email.id}",
+                quota="users.messages.get",
+                params={"format": "full", "fields": "payload"},
+            )
+            email.encoded_body, email.attachments = parse_payload(
+                message.get("payload", {})
+            )
+        return email
+
+    async def load_attachment(self, email: Email, attachment: Attachment) -> memoryview:
+        """Download the data of *attachment* of *email* unless already loaded.
+
+        See :meth:`local_py.gmail_poller.GmailPoller.load_attachment`.
+        """
+        if attachment.data is not None:
+            return attachment.view()
+        result = await self._request(
+            "GET",
+            f"messages/{email.id}/attachments/{attachment.attachment_id}",
+            quota="users.messages.attachments.get",
+            params={"fields": "data"},
+        )
+        attachment.data = decode_base64url(result["data"])
+        return attachment.view()
+
+    async def acknowledge(self, ids: List[str]) -> None:
+        """Mark *ids* as read once they have been handled."""
+        await self._mark_read(ids)
+
+    async def _mark_read(self, ids: List[str]) -> None:
+        """Remove the ``UNREAD`` label from *ids* with ``messages.batchModify``."""
+        for start in range(0, len(ids), MAX_MODIFY_IDS):
+            try:
+                await self._request(
+                    "POST",
+                    "messages/batchModify",
+                    quota="users.messages.batchModify",
+                    json={
+                        "ids": ids[start : start + MAX_MODIFY_IDS],
+                        "removeLabelIds": ["UNREAD"],
+                    },
+                )
+            except Exception as exc:  # pragma: no cover - network failure
+                logging.warning("Failed to mark messages as read: %s", exc)
+
+    async def _request(
+        self,
+        method: str,
+        path: str,
+        *,
+        quota: str,
+        params: Optional[Dict[str, Any]] = None,
+        json: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Any]:
+        """Send an authorized request to ``users/me/<path>`` and decode JSON.
+
+        *quota* names the Gmail API method called, whose quota units are
+        taken from :attr:`limiter` before sending.
+        """
+        if self.limiter is not None:
+            wait = self.limiter.reserve(quota)
+            self.units += quota_units(quota)
+            if wait > 0:
+                self.metrics.observe("gmail_quota_wait_seconds", wait, method=quota)
+                await asyncio.sleep(wait)
+        headers = {"Authorization": f"Bearer {await self._access_token()}"}
+        session = self._ensure_session()
+        async with self._semaphore:
+            with self.metrics.timer("gmail_request_seconds", method=quota):
+                async with session.request(
+                    method,
+                    f"{self.base_url}/users/me/{path}",
+                    params=params,
+                    json=json,
+                    headers=headers,
+                    timeout=self._timeout,
+                ) as response:
+                    response.raise_for_status()
+                    if response.content_length == 0:
+                        return {}
+                    return await response.json()
+
+    def _ensure_session(self) -> aiohttp.ClientSession:
+        # Imported on first use, so the blocking poller never loads aiohttp.
+        import aiohttp
+
+        if self._timeout is None:
+            self._timeout = aiohttp.ClientTimeout(total=self.timeout)
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_concurrency)
+            )
+        return self._session
+
+    async def _access_token(self) -> str:
+        """Return a valid access token, loading or refreshing it off the loop."""
+        if self.credentials is not None and not credentials_expiring(self.credentials):
+            return self.credentials.token
+        async with self._auth_lock:
+            loop = asyncio.get_running_loop()
+            if self._shared_auth:
+                self.credentials = await loop.run_in_executor(
+                    None, get_credentials, self.token_path, self.credentials_path
+                )
+            elif credentials_expiring(self.credentials):
+                from google.auth.transport.requests import Request
+
+                await loop.run_in_executor(None, self.credentials.refresh, Request())
+        return self.credentials.token
@@ -0,0 +1,183 @@
+"""Bounded chat history for agents that pass Gmail messages to a model."""
+
+from __future__ import annotations
+
+import json
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence
+
+from .gmail_poller import Email
+
+# Tokens of history sent with each request, excluding the system prompt.
+DEFAULT_TOKEN_BUDGET = 6000
+# ``gmail_poll`` results estimated above this are replaced by counts and IDs.
+DEFAULT_TOOL_RESULT_TOKENS = 400
+# The running summary of dropped turns is cut to roughly this size.
+DEFAULT_SUMMARY_TOKENS = 300
+# Emails kept for :meth:`ChatContext.expand`, oldest evicted first.
+MAX_EXPANDABLE = 1000
+
+# Rough size of one token for English text and JSON.
+_CHARS_PER_TOKEN = 4
+# Per-message framing added by the chat format.
+_MESSAGE_OVERHEAD = 4
+# Characters of each message quoted in the default summary.
+_SUMMARY_QUOTE = 120
+
+Message = Dict[str, Any]
+
+
+def estimate_tokens(message: Message) -> int:
+    """Return an approximate token count for one chat *message*."""
+    size = len(message.get("content") or "")
+    if message.get("tool_calls"):
+        size += len(json.dumps(message["tool_calls"]))
+    return size // _CHARS_PER_TOKEN + _MESSAGE_OVERHEAD
+
+
+def summarize_turns(turns: Sequence[Sequence[Message]]) -> str:
+    """Default summary of dropped turns: the start of each request and reply."""
+    lines = []
+    for turn in turns:
+        for message in turn:
+            content = (message.get("content") or "").strip()
+            if message["role"] == "user":
+                lines.append(f"User: {content[:_SUMMARY_QUOTE]}")
+            elif message["role"] == "assistant" and content:
+                lines.append(f"Assistant: {content[:_SUMMARY_QUOTE]}")
+    return "\n".join(lines)
+
+
+class ChatContext:
+    """Chat history kept within a token budget.
+
+    Messages are grouped into turns, each starting with a user message. When
+    the history exceeds *token_budget*, the oldest turns are dropped and
+    folded into a running summary sent after the system prompt. The current
+    turn is never dropped. Large ``gmail_poll`` results are stored as a count
+    and message IDs; the full messages stay available through :meth:`expand`.
+
+    Token counts are estimates from the message length, which is close enough
+    to keep requests well inside the model's context.
+    """
+
+    def __init__(
+        self,
+        system_prompt: str,
+        *,
+        token_budget: int = DEFAULT_TOKEN_BUDGET,
+        tool_result_tokens: int = DEFAULT_TOOL_RESULT_TOKENS,
+        summary_tokens: int = DEFAULT_SUMMARY_TOKENS,
+        summarize: Callable[[Sequence[Sequence[Message]]], str] = summarize_turns,
+    ) -> None:
+        """Create a new :class:`ChatContext`.
+
+        Args:
+            system_prompt: Instructions sent first with every request.
+            token_budget: Maximum estimated tokens of history per request.
+            tool_result_tokens: Larger ``gmail_poll`` results are compressed.
+            summary_tokens: Maximum estimated tokens of the running summary.
+            summarize: Turns dropped turns into summary text.
+        """
+        if token_budget < 1 or tool_result_tokens < 1 or summary_tokens < 1:
+            raise ValueError("token budgets must be positive")
+        self.system_prompt = system_prompt
+        self.token_budget = token_budget
+        self.tool_result_tokens = tool_result_tokens
+        self.summary_tokens = summary_tokens
+        self.summarize = summarize
+        self.summary = ""
+        self._turns: List[List[Message]] = []
+        self._emails: OrderedDict[str, Email] = OrderedDict()
+
+    @property
+    def messages(self) -> List[Message]:
+        """Messages to send with the next request."""
+        messages: List[Message] = [{"role": "system", "content": self.system_prompt}]
+        if self.summary:
+            messages.append(
+                {
+                    "role": "system",
+                    "content": f"Summary of the earlier conversation:\n{self.summary}",
+                }
+            )
+        for turn in self._turns:
+            messages.extend(turn)
+        return messages
+
+    def tokens(self) -> int:
+        """Return the estimated size of :attr:`messages`."""
+        return sum(estimate_tokens(message) for message in self.messages)
+
+    def add_user(self, content: str) -> None:
+        """Start a new turn with a user message and trim old turns."""
+        self._turns.append([{"role": "user", "content": content}])
+        self.fit()
+
+    def add_assistant(
+        self, content: str, tool_calls: Optional[List[Dict[str, Any]]] = None
+    ) -> None:
+        """Record a reply, optionally requesting *tool_calls*."""
+        message: Message = {"role": "assistant", "content": content}
+        if tool_calls:
+            message["tool_calls"] = tool_calls
+        self._append(message)
+
+    def add_tool_result(self, tool_call_id: str, content: str) -> None:
+        """Record the raw result of a tool call."""
+        self._append({"role": "tool", "tool_call_id": tool_call_id, "content": content})
+
+    def add_emails(self, tool_call_id: str, emails: Sequence[Email]) -> None:
+        """Record the result of a ``gmail_poll`` call, compressed if large."""
+        for email in emails:
+            self._emails[email.id] = email
+            self._emails.move_to_end(email.id)
+        while len(self._emails) > MAX_EXPANDABLE:
+            self._emails.popitem(last=False)
+        content = json.dumps([email.to_dict() for email in emails])
+        if len(content) // _CHARS_PER_TOKEN > self.tool_result_tokens:
+            content = json.dumps(
+                {
+                    "count": len(emails),
+                    "ids": [email.id for email in emails],
+                    "note": "Call gmail_expand with IDs to read these emails.",
+                }
+            )
+        self.add_tool_result(tool_call_id, content)
+
+    def expand(self, ids: Iterable[str]) -> List[Dict[str, Any]]:
+        """Return full details of previously polled emails by ID.
+
+        Unknown IDs are reported with an ``error`` entry.
+        """
+        results = []
+        for id in ids:
+            email = self._emails.get(id)
+            if email is None:
+                results.append({"id": id, "error": "unknown email ID"})
+            else:
+                results.append(email.to_dict())
+        return results
+
+    def fit(self) -> None:
+        """Drop and summarize the oldest turns until within the budget."""
+        history = sum(
+            estimate_tokens(message) for turn in self._turns for message in turn
+        )
+        dropped: List[List[Message]] = []
+        while len(self._turns) > 1 and history > self.token_budget:
+            turn = self._turns.pop(0)
+            history -= sum(estimate_tokens(message) for message in turn)
+            dropped.append(turn)
+        if dropped:
+            summary = "\n".join(filter(None, [self.summary, self.summarize(dropped)]))
+            limit = self.summary_tokens * _CHARS_PER_TOKEN
+            if len(summary) > limit:
+                # Keep the most recent whole lines.
+                summary = summary[-limit:].partition("\n")[2]
+            self.summary = summary
+
+    def _append(self, message: Message) -> None:
+        if not self._turns:
+            raise ValueError("add a user message first")
+        self._turns[-1].append(message)
@@ -0,0 +1,232 @@
+"""Concurrent processing of fetched Gmail messages by pluggable handlers."""
+
+from __future__ import annotations
+
+import asyncio
+import importlib
+import logging
+from abc import ABC, abstractmethod
+from concurrent.futures import Executor
+from typing import (
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Sequence,
+    Type,
+    TypeVar,
+)
+
+from .gmail_poller import Email
+
+DEFAULT_WORKERS = 4
+DEFAULT_QUEUE_SIZE = 100
+# Handled IDs are acknowledged in groups to save ``batchModify`` calls.
+DEFAULT_ACK_BATCH_SIZE = 100
+
+# Handler plugins by name, filled by :func:`register_handler`.
+HANDLERS: Dict[str, Type["EmailHandler"]] = {}
+
+H = TypeVar("H", bound=Type["EmailHandler"])
+
+
+class EmailHandler(ABC):
+    """Plugin that processes one message at a time.
+
+    The pipeline calls :meth:`handle` from several workers at once, so
+    handlers must be safe to use concurrently. Raising marks the message as
+    failed; it is not acknowledged, so it stays unread and is delivered again
+    by the next poll. A full listing finds it again; an incremental
+    :class:`~local_py.gmail_poller.GmailPoller` keeps it in its retry set.
+    """
+
+    @abstractmethod
+    async def handle(self, email: Email) -> None:
+        """Process *email*."""
+
+    async def flush(self) -> None:
+        """Finish work buffered by :meth:`handle`.
+
+        The pipeline awaits this before acknowledging handled messages, so
+        handlers that batch their output must persist it here and raise if
+        they cannot; the messages then stay unread.
+        """
+
+
+class BlockingEmailHandler(EmailHandler):
+    """Handler whose work blocks, run in a thread or process pool.
+
+    Subclasses implement :meth:`handle_blocking`. Pass a
+    :class:`~concurrent.futures.ProcessPoolExecutor` for CPU-heavy work; the
+    handler and messages must then be picklable.
+    """
+
+    def __init__(self, executor: Optional[Executor] = None) -> None:
+        """Create a new handler running in *executor*.
+
+        Args:
+            executor: Pool for :meth:`handle_blocking`. Defaults to the event
+                loop's default thread pool.
+        """
+        self.executor = executor
+
+    async def handle(self, email: Email) -> None:
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.executor, self.handle_blocking, email)
+
+    @abstractmethod
+    def handle_blocking(self, email: Email) -> None:
+        """Process *email* synchronously."""
+
+
+def register_handler(name: str) -> Callable[[H], H]:
+    """Class decorator registering an :class:`EmailHandler` under *name*."""
+
+    def register(cls: H) -> H:
+        if name in HANDLERS:
+            raise ValueError(f"Handler {name!r} is already registered")
+        HANDLERS[name] = cls
+        return cls
+
+    return register
+
+
+def load_handler(spec: str) -> EmailHandler:
+    """Instantiate the handler named *spec*.
+
+    *spec* is either a name registered with :func:`register_handler` or an
+    import path of the form ``package.module:ClassName``.
+    """
+    if ":" in spec:
+        module_name, _, class_name = spec.partition(":")
+        cls = getattr(importlib.import_module(module_name), class_name)
+    elif spec in HANDLERS:
+        cls = HANDLERS[spec]
+    else:
+        raise ValueError(
+            f"Unknown handler {spec!r}; registered: {', '.join(sorted(HANDLERS))}"
+        )
+    return cls()
+
+
+@register_handler("log")
+class LoggingHandler(EmailHandler):
+    """Log the ID and snippet of every message."""
+
+    async def handle(self, email: Email) -> None:
+        logging.info("New email %s: %s", email.id, email.snippet)
+
+
+class EmailPipeline:
+    """Run fetched messages through handlers on a pool of workers.
+
+    Messages flow from the fetch stream into a bounded queue consumed by
+    *workers* concurrent tasks. When the queue is full the stream is not
+    advanced, so slow handlers throttle fetching. Each message is passed to
+    every handler in order and only acknowledged once all of them succeed
+    and have flushed (see :meth:`EmailHandler.flush`).
+    """
+
+    def __init__(
+        self,
+        handlers: Sequence[EmailHandler],
+        *,
+        workers: int = DEFAULT_WORKERS,
+        queue_size: int = DEFAULT_QUEUE_SIZE,
+        ack_batch_size: int = DEFAULT_ACK_BATCH_SIZE,
+    ) -> None:
+        """Create a new :class:`EmailPipeline`.
+
+        Args:
+            handlers: Plugins applied to every message, in order.
+            workers: Number of messages handled concurrently.
+            queue_size: Fetched messages buffered ahead of the workers.
+            ack_batch_size: Handled messages acknowledged per call.
+        """
+        if not handlers:
+            raise ValueError("at least one handler is required")
+        if workers < 1 or queue_size < 1 or ack_batch_size < 1:
+            raise ValueError("workers, queue_size and ack_batch_size must be positive")
+        self.handlers = list(handlers)
+        self.workers = workers
+        self.queue_size = queue_size
+        self.ack_batch_size = ack_batch_size
+        # Messages whose handlers raised, over the pipeline's lifetime.
+        self.failures = 0
+
+    async def process(
+        self,
+        emails: AsyncIterator[Email],
+        ack: Callable[[List[str]], Awaitable[None]],
+    ) -> int:
+        """Handle every message from *emails* and return how many were received.
+
+        Handled message IDs are passed to *ack*. If *emails* raises, messages
+        already received are still handled and acknowledged before the error
+        propagates.
+        """
+        queue: asyncio.Queue[Email] = asyncio.Queue(self.queue_size)
+        handled: List[str] = []
+
+        async def flush() -> None:
+            if not handled:
+                return
+            batch = handled[:]
+            handled.clear()
+            try:
+                for handler in self.handlers:
+                    await handler.flush()
+                await ack(batch)
+            except Exception as exc:
+                # The messages stay unacknowledged and are retried later.
+                logging.warning("Failed to acknowledge %d emails: %s", len(batch), exc)
+
+        async def work() -> None:
+            while True:
+                email = await queue.get()
+                try:
+                    if await self._handle(email):
+                        handled.append(email.id)
+                        if len(handled) >= self.ack_batch_size:
+                            await flush()
+                finally:
+                    queue.task_done()
+
+        tasks = [asyncio.create_task(work()) for _ in range(self.workers)]
+        received = 0
+        drain = True
+        try:
+            async for email in emails:
+                received += 1
+                await queue.put(email)
+        except asyncio.CancelledError:
+            drain = False
+            raise
+        finally:
+            try:
+                if drain:
+                    await queue.join()
+            finally:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+            if drain:
+                await flush()
+        return received
+
+    async def _handle(self, email: Email) -> bool:
+        for handler in self.handlers:
+            try:
+                await handler.handle(email)
+            except Exception as exc:
+                self.failures += 1
+                logging.warning(
+                    "Handler %s failed for email %s: %s",
+                    type(handler).__name__,
+                    email.id,
+                    exc,
+                )
+                return False
+        return True
@@ -0,0 +1,317 @@
+"""Classify and summarize polled messages with a chat model, many per request."""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+from dataclasses import dataclass
+from typing import Any, Callable, Collection, Dict, List, Optional, Sequence
+
+from .email_pipeline import EmailHandler
+from .gmail_poller import Email
+from .llm_backend import BackendProfile
+from .metrics import NULL_METRICS, Metrics
+from .response_cache import LRUCache
+
+DEFAULT_BATCH_SIZE = 20
+DEFAULT_CONCURRENCY = 4
+DEFAULT_FLUSH_INTERVAL = 1.0
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_RETRY_DELAY = 0.5
+# Results remembered by message ID, enough for a few days of mail.
+DEFAULT_CACHE_SIZE = 10000
+# Longer subjects and snippets are cut to keep batches within the context.
+MAX_FIELD_CHARS = 300
+
+CATEGORIES = ("action", "reply", "fyi", "newsletter", "notification", "spam")
+PRIORITIES = ("high", "normal", "low")
+
+SYSTEM_PROMPT = """You triage emails. The user sends a JSON array of emails, \
+each with an id, sender, subject and snippet. For every email choose a \
+category from: {categories}; a priority from: {priorities}; and write a \
+one-sentence summary. Reply with a JSON object of the form \
+{{"results": [{{"id": "...", "category": "...", "priority": "...", \
+"summary": "..."}}]}} holding exactly one entry per email."""
+
+
+@dataclass(frozen=True)
+class Triage:
+    """Classification of one message by the model."""
+
+    category: str
+    priority: str
+    summary: str
+
+
+class TriageError(Exception):
+    """Messages that could not be triaged within the allowed attempts."""
+
+    def __init__(self, message_ids: Sequence[str]) -> None:
+        shown = ", ".join(message_ids[:5])
+        more = f" and {len(message_ids) - 5} more" if len(message_ids) > 5 else ""
+        super().__init__(f"Failed to triage emails {shown}{more}")
+        self.message_ids = list(message_ids)
+
+
+def triage_item(email: Email) -> Dict[str, str]:
+    """Return the fields of *email* sent to the model."""
+    headers = email.headers or {}
+    return {
+        "id": email.id,
+        "from": headers.get("From", "")[:MAX_FIELD_CHARS],
+        "subject": headers.get("Subject", "")[:MAX_FIELD_CHARS],
+        "snippet": email.snippet[:MAX_FIELD_CHARS],
+    }
+
+
+def parse_triage(
+    content: str,
+    message_ids: Collection[str],
+    categories: Collection[str] = CATEGORIES,
+) -> Dict[str, Triage]:
+    """Return the valid results in the model reply *content* by message ID.
+
+    Entries for unknown IDs or with a category or priority outside the
+    allowed values are dropped, as is everything if the reply is not the
+    expected JSON, so the affected messages count as failed.
+    """
+    try:
+        payload = json.loads(content)
+    except ValueError:
+        return {}
+    items = payload.get("results") if isinstance(payload, dict) else None
+    if not isinstance(items, list):
+        return {}
+    results: Dict[str, Triage] = {}
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        message_id = str(item.get("id"))
+        category = str(item.get("category", "")).lower()
+        priority = str(item.get("priority", "")).lower()
+        summary = item.get("summary")
+        if (
+            message_id in message_ids
+            and category in categories
+            and priority in PRIORITIES
+            and isinstance(summary, str)
+        ):
+            results[message_id] = Triage(category, priority, summary.strip())
+    return results
+
+
+class TriageHandler(EmailHandler):
+    """Pipeline handler classifying and summarizing messages in batches.
+
+    Asking the model about one message per request, as a chat turn does,
+    pays the request latency and the instructions once per message. This
+    handler buffers messages instead and sends up to *batch_size* of them in
+    one completion request with JSON output, running at most *concurrency*
+    requests at a time. Messages missing from a reply, or with an invalid
+    entry, are retried on their own up to *max_attempts* times in all;
+    entries that were valid are kept. Results are cached by message ID, so a
+    message fetched again is not sent to the model twice; a copy arriving
+    while the message is still being triaged waits for that outcome.
+
+    Like :class:`~local_py.postgres_sink.PostgresSink`, a batch is sent when
+    it is full, *flush_interval* seconds after its first message, and when
+    the pipeline is about to acknowledge messages. :meth:`flush` raises
+    :class:`TriageError` for messages that still failed, which keeps them
+    unread. Use it from the command line with
+    ``--handler local_py.email_triage:TriageHandler``; the endpoint is
+    configured by ``OPENAI_API_BASE`` and ``OPENAI_API_KEY``.
+    """
+
+    def __init__(
+        self,
+        client: Any | None = None,
+        *,
+        backend: Optional[BackendProfile] = None,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+        retry_delay: float = DEFAULT_RETRY_DELAY,
+        categories: Sequence[str] = CATEGORIES,
+        cache: Optional[LRUCache[str, Triage]] = None,
+        on_result: Optional[Callable[[Email, Triage], None]] = None,
+        metrics: Optional[Metrics] = None,
+    ) -> None:
+        """Create a new :class:`TriageHandler`.
+
+        Args:
+            client: OpenAI client. Defaults to one created by *backend*.
+            backend: Model, endpoint and connection settings. Defaults to
+                :class:`~local_py.llm_backend.BackendProfile`, whose
+                connection pool should be at least *concurrency* large.
+            batch_size: Messages sent in one request.
+            concurrency: Requests in flight at once.
+            flush_interval: Seconds a message may wait for its batch to fill.
+            max_attempts: Requests made for a message before giving up.
+            retry_delay: Seconds before the first retry, doubled after each.
+            categories: Categories the model chooses from.
+            cache: Results by message ID. Defaults to a new
+                :class:`~local_py.response_cache.LRUCache` of
+                :data:`DEFAULT_CACHE_SIZE` entries.
+            on_result: Called with every message and its result, including
+                results taken from the cache. Results are also logged.
+            metrics: Records requests, their duration, retries and failures.
+        """
+        if batch_size < 1 or concurrency < 1 or max_attempts < 1:
+            raise ValueError(
+                "batch_size, concurrency and max_attempts must be positive"
+            )
+        if flush_interval <= 0 or retry_delay < 0:
+            raise ValueError(
+                "flush_interval must be positive and retry_delay not negative"
+            )
+        if not categories:
+            raise ValueError("at least one category is required")
+        self.backend = backend or BackendProfile()
+        self.client: Any = client or self.backend.create_client()
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.categories = tuple(categories)
+        self.cache: LRUCache[str, Triage] = (
+            cache if cache is not None else LRUCache(DEFAULT_CACHE_SIZE)
+        )
+        self.on_result = on_result
+        self.metrics = metrics if metrics is not None else NULL_METRICS
+        self.prompt = SYSTEM_PROMPT.format(
+            categories=", ".join(self.categories), priorities=", ".join(PRIORITIES)
+        )
+        self._buffer: Dict[str, Email] = {}
+        # Result of every buffered or in-flight message, or ``None`` once it
+        # has failed on every attempt.
+        self._outcomes: Dict[str, asyncio.Future[Optional[Triage]]] = {}
+        self._batches: set[asyncio.Task[None]] = set()
+        # Messages given up on since the last flush.
+        self._failed: List[str] = []
+        self._timer: Optional[asyncio.Task[None]] = None
+        self._slots = asyncio.Semaphore(concurrency)
+
+    async def handle(self, email: Email) -> None:
+        cached = self.cache.get(email.id)
+        if cached is not None:
+            self._report(email, cached)
+            return
+        outcome = self._outcomes.get(email.id)
+        if outcome is not None:
+            # Another copy is being triaged. Share its outcome rather than
+            # letting this one be acknowledged before the model has answered.
+            if email.id in self._buffer:
+                self._dispatch()
+            triage = await asyncio.shield(outcome)
+            if triage is None:
+                raise TriageError([email.id])
+            self._report(email, triage)
+            return
+        self._outcomes[email.id] = asyncio.get_running_loop().create_future()
+        self._buffer[email.id] = email
+        if len(self._buffer) >= self.batch_size:
+            self._dispatch()
+            # Batches waiting for a request slot hold fetched messages, so
+            # stop taking more once there is a full round of them.
+            while len(self._batches) > 2 * self.concurrency:
+                await asyncio.wait(self._batches, return_when=asyncio.FIRST_COMPLETED)
+        elif self._timer is None or self._timer.done():
+            self._timer = asyncio.create_task(self._dispatch_later())
+
+    async def flush(self) -> None:
+        """Send the buffer and wait for every batch in progress.
+
+        Raises:
+            TriageError: Some messages failed on every attempt. They are not
+                retried by later flushes, but by a later fetch.
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._buffer:
+            self._dispatch()
+        if self._batches:
+            await asyncio.gather(*self._batches)
+        if self._failed:
+            failed, self._failed = self._failed, []
+            raise TriageError(failed)
+
+    def _dispatch(self) -> None:
+        emails, self._buffer = self._buffer, {}
+        task = asyncio.create_task(self._triage(emails))
+        self._batches.add(task)
+        task.add_done_callback(self._batches.discard)
+
+    async def _dispatch_later(self) -> None:
+        await asyncio.sleep(self.flush_interval)
+        self._timer = None
+        if self._buffer:
+            self._dispatch()
+
+    async def _triage(self, emails: Dict[str, Email]) -> None:
+        pending = dict(emails)
+        try:
+            for attempt in range(self.max_attempts):
+                if attempt:
+                    self.metrics.inc("triage_retries_total", len(pending))
+                    await asyncio.sleep(self.retry_delay * 2 ** (attempt - 1))
+                try:
+                    async with self._slots:
+                        self.metrics.inc("triage_requests_total")
+                        with self.metrics.timer("triage_request_seconds"):
+                            results = await asyncio.to_thread(
+                                self._complete, list(pending.values())
+                            )
+                except Exception as exc:
+                    logging.warning(
+                        "Triage request for %d emails failed: %s", len(pending), exc
+                    )
+                    continue
+                for message_id, triage in results.items():
+                    self.cache.put(message_id, triage)
+                    self._report(pending.pop(message_id), triage)
+                    self._settle(message_id, triage)
+                if not pending:
+                    return
+            self.metrics.inc("triage_failures_total", len(pending))
+            self._failed.extend(pending)
+        finally:
+            for message_id in emails:
+                self._settle(message_id, None)
+
+    def _settle(self, message_id: str, triage: Optional[Triage]) -> None:
+        """Pass the outcome of *message_id* to copies waiting for it."""
+        outcome = self._outcomes.pop(message_id, None)
+        if outcome is not None and not outcome.done():
+            outcome.set_result(triage)
+
+    def _complete(self, emails: List[Email]) -> Dict[str, Triage]:
+        """Ask the model about *emails* and return the valid results."""
+        response = self.client.chat.completions.create(
+            messages=[
+                {"role": "system", "content": self.prompt},
+                {
+                    "role": "user",
+                    "content": json.dumps([triage_item(email) for email in emails]),
+                },
+            ],
+            response_format={"type": "json_object"},
+            temperature=0,
+            **self.backend.request_params(),
+        )
+        content = response.choices[0].message.content or ""
+        return parse_triage(content, {email.id for email in emails}, self.categories)
+
+    def _report(self, email: Email, triage: Triage) -> None:
+        logging.info(
+            "Triaged email %s as %s (%s): %s",
+            email.id,
+            triage.category,
+            triage.priority,
+            triage.summary,
+        )
+        if self.on_result is not None:
+            self.on_result(email, triage)
@@ -2,19 +2,35 @@
 
 from __future__ import annotations
 
+import base64
+import json
 import logging
 import os
-from dataclasses import dataclass
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+from functools import lru_cache
 from pathlib import Path
-from typing import Any, List, Optional
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterator, List, Optional, Tuple
 
-import httplib2
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
-from google_auth_httplib2 import AuthorizedHttp
-from semantic_kernel.functions import kernel_function
+from .gmail_quota import QuotaLimiter, get_limiter, quota_units
+from .message_store import MessageStore
+from .metrics import NULL_METRICS, Metrics
+from .sk_compat import kernel_function
+
+if TYPE_CHECKING:
+    from google.oauth2.credentials import Credentials
+
+    # mail_index imports Email from this module.
+    from .mail_index import MailIndex
+
+# The Google client libraries take a large share of startup time, so they are
+# imported where they are first needed: google-auth when a token is read,
+# google-auth-oauthlib only for the interactive flow, and httplib2 and
+# googleapiclient when a service is built.
 
 TOKEN_PATH = Path(os.environ.get("GMAIL_TOKEN_PATH", "token.json"))
 # Copy credentials.sample.json to credentials.json and fill in your
@@ -26,14 +42,291 @@ CREDENTIALS_PATH = Path(
     )
 )
 SCOPES = ["https://www.googleapis.com/auth/gmail.modify"]
+# Gmail accepts at most 100 calls per batch request but recommends no more
+# than 50 to avoid rate limiting.
+DEFAULT_BATCH_SIZE = 50
+MAX_BATCH_SIZE = 100
+# ``messages.list`` returns 100 messages per page by default and at most 500.
+DEFAULT_MAX_RESULTS = 100
+MAX_RESULTS_LIMIT = 500
+# Name of the :class:`MessageStore` cursor holding the last seen historyId.
+HISTORY_CURSOR = "history_id"
+# Cursor holding the sender :data:`HISTORY_CURSOR` was built for; ``""`` for
+# every sender.
+HISTORY_SENDER_CURSOR = "history_sender"
+# Statuses Gmail uses to signal that the caller is over its quota.
+RATE_LIMIT_STATUSES = {403, 429}
+# ``messages.batchModify`` accepts at most 1000 message IDs per call.
+MAX_MODIFY_IDS = 1000
+# ``messages.get`` formats, from least to most data downloaded.
+MESSAGE_FORMATS = ("minimal", "metadata", "full")
+DEFAULT_METADATA_HEADERS = ("From", "Subject", "Date")
+# Partial response masks so Gmail only sends the fields that are parsed.
+MESSAGE_FIELDS = {
+    "minimal": "id,threadId,labelIds,snippet",
+    "metadata": "id,threadId,labelIds,snippet,payload/headers",
+    "full": "id,threadId,labelIds,snippet,payload",
+}
+LIST_FIELDS = "messages/id,nextPageToken"
+HISTORY_FIELDS = "history/messagesAdded/message/id,nextPageToken,historyId"
+# Refresh access tokens this many seconds before they expire, so a refresh
+# never lands in the middle of a poll.
+REFRESH_MARGIN = 5 * 60
+
+# Process-wide caches shared by every poller, keyed by resolved token path.
+_auth_lock = threading.Lock()
+_token_locks: Dict[Path, threading.Lock] = {}
+_credentials: Dict[Path, Credentials] = {}
+_services: Dict[Tuple[Path, float, Callable[..., Any]], Any] = {}
+
+
+@dataclass(slots=True)
+class Attachment:
+    """Attachment of a message. Its data is downloaded on demand."""
+
+    attachment_id: str
+    filename: str
+    mime_type: str
+    size: int
+    data: Optional[bytes] = field(default=None, repr=False, compare=False)
+
+    def view(self) -> memoryview:
+        """Return a zero-copy view of the data loaded by ``load_attachment``."""
+        if self.data is None:
+            raise ValueError(f"Attachment {self.filename!r} has not been loaded")
+        return memoryview(self.data)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Return the attachment metadata, without its data."""
+        return {
+            "attachment_id": self.attachment_id,
+            "filename": self.filename,
+            "mime_type": self.mime_type,
+            "size": self.size,
+        }
 
 
-@dataclass
+@dataclass(slots=True)
 class Email:
-    """Simple representation of an email message."""
+    """Simple representation of an email message.
+
+    Only ``id`` and ``snippet`` are always set; the other fields depend on the
+    :class:`FetchProfile` the message was fetched with. The body and
+    ``attachments`` are only filled by the ``full`` format or on demand by
+    :meth:`GmailPoller.load_body`. Slots keep each instance small, and the
+    body stays base64url encoded as Gmail sent it until :attr:`body` is read.
+    """
 
     id: str
     snippet: str
+    thread_id: Optional[str] = None
+    label_ids: Optional[List[str]] = None
+    headers: Optional[Dict[str, str]] = None
+    attachments: Optional[List[Attachment]] = None
+    # Encoded ``text/plain`` parts; ``None`` until the body is downloaded.
+    encoded_body: Optional[Tuple[str, ...]] = field(default=None, repr=False)
+
+    @property
+    def body(self) -> Optional[str]:
+        """Plain text body, decoded on every access, or ``None`` if not loaded."""
+        if self.encoded_body is None:
+            return None
+        return "".join(
+            decode_base64url(part).decode("utf-8", "replace")
+            for part in self.encoded_body
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Return the fields that are set, ready for JSON serialization."""
+        data: Dict[str, Any] = {"id": self.id, "snippet": self.snippet}
+        if self.thread_id is not None:
+            data["thread_id"] = self.thread_id
+        if self.label_ids is not None:
+            data["label_ids"] = self.label_ids
+        if self.headers is not None:
+            data["headers"] = self.headers
+        if self.encoded_body is not None:
+            data["body"] = self.body
+        if self.attachments is not None:
+            data["attachments"] = [item.to_dict() for item in self.attachments]
+        return data
+
+
+@dataclass(frozen=True)
+class FetchProfile:
+    """How much of each message ``messages.get`` downloads.
+
+    Attributes:
+        format: ``minimal`` (labels and snippet), ``metadata`` (plus
+            *headers*) or ``full`` (the whole MIME payload, including the
+            body and attachment list).
+        headers: Headers requested in the ``metadata`` format.
+    """
+
+    format: str = "metadata"
+    headers: Tuple[str, ...] = DEFAULT_METADATA_HEADERS
+
+    def __post_init__(self) -> None:
+        if self.format not in MESSAGE_FORMATS:
+            raise ValueError(f"format must be one of {', '.join(MESSAGE_FORMATS)}")
+        object.__setattr__(self, "headers", tuple(self.headers))
+
+    def with_sender(self) -> FetchProfile:
+        """Return a profile that also downloads the ``From`` header."""
+        if self.format == "full":
+            return self
+        if self.format == "metadata" and any(
+            name.lower() == "from" for name in self.headers
+        ):
+            return self
+        return FetchProfile("metadata", (*self.headers, "From"))
+
+    def request_params(self) -> Dict[str, Any]:
+        """Return ``messages.get`` parameters, including a ``fields`` mask."""
+        params: Dict[str, Any] = {
+            "format": self.format,
+            "fields": MESSAGE_FIELDS[self.format],
+        }
+        if self.format == "metadata":
+            params["metadataHeaders"] = list(self.headers)
+        return params
+
+
+def load_credentials(token_path: Path, credentials_path: Path) -> Credentials:
+    """Return valid OAuth credentials, refreshing or creating the token file.
+
+    The interactive OAuth flow only runs when *token_path* holds no token that
+    can be refreshed.
+    """
+    from google.auth.transport.requests import Request
+    from google.oauth2.credentials import Credentials
+
+    creds: Credentials | None = None
+    if token_path.exists():
+        creds = Credentials.from_authorized_user_file(str(token_path), SCOPES)
+    if not creds or not creds.valid:
+        if creds and creds.expired and creds.refresh_token:
+            creds.refresh(Request())
+        else:
+            from google_auth_oauthlib.flow import InstalledAppFlow
+
+            flow = InstalledAppFlow.from_client_secrets_file(
+                str(credentials_path), SCOPES
+            )
+            creds = flow.run_local_server(port=0)
+        token_path.write_text(creds.to_json())
+    return creds
+
+
+def credentials_expiring(creds: Any, margin: float = REFRESH_MARGIN) -> bool:
+    """Return whether *creds* are invalid or expire within *margin* seconds."""
+    if not creds.valid:
+        return True
+    expiry = getattr(creds, "expiry", None)
+    if expiry is None:
+        return False
+    # google-auth stores expiry as a naive UTC datetime.
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    return expiry - now < timedelta(seconds=margin)
+
+
+def get_credentials(
+    token_path: Path | str = TOKEN_PATH,
+    credentials_path: Path | str = CREDENTIALS_PATH,
+) -> Credentials:
+    """Return process-wide cached credentials for *token_path*.
+
+    The token file is read once per process. Credentials that expire within
+    :data:`REFRESH_MARGIN` are refreshed and written back; concurrent callers
+    wait for that single refresh instead of each sending their own.
+    """
+    token_path = Path(token_path)
+    key = token_path.resolve()
+    with _auth_lock:
+        lock = _token_locks.setdefault(key, threading.Lock())
+    with lock:
+        creds = _credentials.get(key)
+        if creds is None:
+            creds = load_credentials(token_path, Path(credentials_path))
+            _credentials[key] = creds
+        if credentials_expiring(creds) and creds.refresh_token:
+            from google.auth.transport.requests import Request
+
+            creds.refresh(Request())
+            token_path.write_text(creds.to_json())
+        return creds
+
+
+def get_service(
+    token_path: Path | str = TOKEN_PATH,
+    credentials_path: Path | str = CREDENTIALS_PATH,
+    timeout: float = 10.0,
+    transport: Optional[Callable[..., Any]] = None,
+) -> Any:
+    """Return a Gmail API service for *token_path*.
+
+    Services are built from the discovery document bundled with
+    ``google-api-python-client``, parsed once per process, so no discovery
+    request is ever sent. Services whose transport is marked ``thread_safe``
+    are cached and shared process-wide; every other call builds a new
+    service, so pollers running in different threads never share an
+    ``httplib2.Http``.
+
+    Args:
+        token_path: Path to the OAuth token JSON file.
+        credentials_path: Path to the OAuth client credentials.
+        timeout: Timeout in seconds for each request.
+        transport: Factory called with ``timeout=`` that returns an
+            ``httplib2.Http`` compatible object. Defaults to
+            ``httplib2.Http``, which must not be shared between threads; use
+            :class:`~local_py.gmail_transport.PooledHttp` for a service that
+            is polled from several threads.
+    """
+    import httplib2
+
+    transport = transport or httplib2.Http
+    shared = getattr(transport, "thread_safe", False)
+    key = (Path(token_path).resolve(), timeout, transport)
+    service = None
+    if shared:
+        with _auth_lock:
+            service = _services.get(key)
+    if service is None:
+        from google_auth_httplib2 import AuthorizedHttp
+        from googleapiclient.discovery import build_from_document
+
+        creds = get_credentials(token_path, credentials_path)
+        authed_http = AuthorizedHttp(creds, http=transport(timeout=timeout))
+        service = build_from_document(_discovery_document(), http=authed_http)
+        if shared:
+            with _auth_lock:
+                service = _services.setdefault(key, service)
+    return service
+
+
+def clear_auth_cache() -> None:
+    """Forget cached credentials, services and the discovery document."""
+    with _auth_lock:
+        _credentials.clear()
+        _services.clear()
+    _discovery_document.cache_clear()
+
+
+def discovery_document() -> Dict[str, Any]:
+    """Return a copy of the bundled Gmail v1 discovery document.
+
+    Pass it to ``googleapiclient.discovery.build_from_document`` with a
+    different ``rootUrl`` to build a service for another endpoint, such as a
+    local fake server.
+    """
+    return dict(_discovery_document())
+
+
+@lru_cache(maxsize=None)
+def _discovery_document() -> Dict[str, Any]:
+    from googleapiclient.discovery_cache import get_static_doc
+
+    return json.loads(get_static_doc("gmail", "v1"))
 
 
 class GmailPoller:
@@ -46,6 +339,16 @@ class GmailPoller:
         credentials_path: Path | str = CREDENTIALS_PATH,
         service: Any | None = None,
         timeout: float = 10.0,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        incremental: bool = False,
+        max_results: int = DEFAULT_MAX_RESULTS,
+        store: Optional[MessageStore] = None,
+        mark_read: bool = True,
+        transport: Optional[Callable[..., Any]] = None,
+        profile: Optional[FetchProfile] = None,
+        index: Optional[MailIndex] = None,
+        limiter: Optional[QuotaLimiter] = None,
+        metrics: Optional[Metrics] = None,
     ) -> None:
         """Create a new :class:`GmailPoller`.
 
@@ -55,34 +358,120 @@ class GmailPoller:
             credentials_path: Path to the OAuth client credentials. Defaults to
                 :data:`CREDENTIALS_PATH`.
             service: Pre-authorized Gmail API service. If provided, authorization
-                is skipped.
+                is skipped. Otherwise the credentials for *token_path*, and
+                with a thread-safe *transport* the service, are shared with
+                other pollers in the process (see :func:`get_service`).
             timeout: Timeout in seconds for Gmail API requests.
+            batch_size: Number of ``messages.get`` calls grouped into a single
+                batch HTTP request. Capped at :data:`MAX_BATCH_SIZE`.
+            incremental: When ``True``, only the first poll lists every unread
+                message. Later polls ask the History API for messages added
+                since the previously seen ``historyId``. Listed messages that
+                are not acknowledged, e.g. because fetching or handling them
+                failed, are kept in a retry set and fetched again by the next
+                poll, since the history cursor has already moved past them.
+                Messages dropped by the sender filter are not retried, so the
+                cursor belongs to the sender it was built for: polling with a
+                different sender, or with none, starts over with a full
+                listing. Give each sender its own *store* to avoid that.
+            max_results: Page size requested from ``messages.list``. Capped at
+                :data:`MAX_RESULTS_LIMIT`; bounds how many messages are held in
+                memory at once by :meth:`iter_unread`.
+            store: Persistent record of processed messages. Recorded IDs are
+                skipped before fetching, and in incremental mode the
+                ``historyId`` cursor and the retry set are saved so restarts
+                resume cheaply without losing messages.
+            mark_read: Remove the ``UNREAD`` label from fetched messages. May
+                be disabled when *store* tracks what has been processed.
+            transport: HTTP transport factory passed to :func:`get_service`,
+                e.g. :class:`~local_py.gmail_transport.PooledHttp`.
+            profile: How much of each message to download. Defaults to the
+                ``metadata`` format with :data:`DEFAULT_METADATA_HEADERS`.
+            index: Local search index that every fetched message and loaded
+                body is written to.
+            limiter: Meters every Gmail call by its quota units and delays
+                calls that would exceed the per-user limit. Without a
+                *service*, defaults to the limiter shared by all pollers of
+                *token_path* (see :func:`~local_py.gmail_quota.get_limiter`);
+                with one, calls are not limited unless a limiter is given.
+            metrics: Records the latency of every Gmail call by method, time
+                spent waiting for quota and the number of messages fetched.
         """
 
+        if batch_size < 1:
+            raise ValueError("batch_size must be at least 1")
+        if max_results < 1:
+            raise ValueError("max_results must be at least 1")
         self.token_path = Path(token_path)
         self.credentials_path = Path(credentials_path)
         self.timeout = timeout
-        self.service: Any = service or self._authorize(
-            self.token_path, self.credentials_path, timeout
+        self.batch_size = min(batch_size, MAX_BATCH_SIZE)
+        self.incremental = incremental
+        self.max_results = min(max_results, MAX_RESULTS_LIMIT)
+        self.store = store
+        self.mark_read = mark_read
+        self.profile = profile or FetchProfile()
+        self.index = index
+        self.limiter = limiter
+        if limiter is None and service is None:
+            self.limiter = get_limiter(self.token_path)
+        self.metrics = metrics if metrics is not None else NULL_METRICS
+        self._history_id = store.get_cursor(HISTORY_CURSOR) if store else None
+        self._history_sender = (
+            store.get_cursor(HISTORY_SENDER_CURSOR) if store else None
+        )
+        # Incrementally listed IDs awaiting :meth:`acknowledge`, in listing
+        # order. Acknowledgements may come from another thread.
+        self._retry: Dict[str, None] = dict.fromkeys(
+            store.pending_ids() if store else []
+        )
+        self._retry_lock = threading.Lock()
+        # Error swallowed by the most recent :meth:`poll`, or ``None``.
+        self.last_error: Optional[Exception] = None
+        # Quota units this poller has charged to :attr:`limiter`, which other
+        # pollers may share. Calls may come from several threads.
+        self.units = 0
+        self._units_lock = threading.Lock()
+        # Only refresh credentials proactively when this poller owns them.
+        self._shared_auth = service is None
+        self.service: Any = service or get_service(
+            self.token_path, self.credentials_path, timeout, transport
         )
 
-    @staticmethod
-    def _authorize(token_path: Path, credentials_path: Path, timeout: float) -> Any:
-        """Return an authorized Gmail API service."""
-        creds: Credentials | None = None
-        if token_path.exists():
-            creds = Credentials.from_authorized_user_file(str(token_path), SCOPES)
-        if not creds or not creds.valid:
-            if creds and creds.expired and creds.refresh_token:
-                creds.refresh(Request())
-            else:
-                flow = InstalledAppFlow.from_client_secrets_file(
-                    str(credentials_path), SCOPES
-                )
-                creds = flow.run_local_server(port=0)
-            token_path.write_text(creds.to_json())
-        authed_http = AuthorizedHttp(creds, http=httplib2.Http(timeout=timeout))
-        return build("gmail", "v1", http=authed_http)
+    @property
+    def history_id(self) -> Optional[str]:
+        """Mailbox ``historyId`` the next incremental poll starts from."""
+        return self._history_id
+
+    @history_id.setter
+    def history_id(self, value: Optional[str]) -> None:
+        self._history_id = value
+        if self.store is not None:
+            self.store.set_cursor(HISTORY_CURSOR, value)
+
+    def watch(
+        self, topic_name: str, label_ids: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        """Ask Gmail to publish mailbox changes to a Cloud Pub/Sub topic.
+
+        Args:
+            topic_name: Fully qualified topic, ``projects/<id>/topics/<name>``.
+            label_ids: Only report changes to these labels. Defaults to
+                ``INBOX``.
+
+        Returns:
+            The watch response holding the current ``historyId`` and the
+            ``expiration`` time in milliseconds since the epoch.
+        """
+        request = self.service.users().watch(
+            userId="me",
+            body={
+                "topicName": topic_name,
+                "labelIds": label_ids or ["INBOX"],
+                "labelFilterBehavior": "INCLUDE",
+            },
+        )
+        return self._execute(request, "users.watch")
 
     @kernel_function(
         description="Poll Gmail for unread messages, optionally filtered by sender."
@@ -91,26 +480,442 @@ class GmailPoller:
         """Return unread messages.
 
         If *sender* is provided, only messages from that address are returned.
-        Messages are marked as read so they are not returned again.
+        Messages are marked as read so they are not returned again. Errors are
+        logged, stored in :attr:`last_error` and the messages collected before
+        the failure are returned.
         """
-        query = f"from:{sender} is:unread" if sender else "is:unread"
+        emails: List[Email] = []
+        self.last_error = None
         try:
-            result = (
-                self.service.users().messages().list(userId="me", q=query).execute()
-            )
+            for email in self.iter_unread(sender):
+                emails.append(email)
         except Exception as exc:  # pragma: no cover - network failure
             logging.warning("Failed to poll Gmail: %s", exc)
-            return []
-        messages = result.get("messages", [])
-        emails: List[Email] = []
-        for msg in messages:
-            full = (
-                self.service.users().messages().get(userId="me", id=msg["id"]).execute()
+            self.last_error = exc
+        return emails
+
+    def iter_unread(
+        self, sender: Optional[str] = None, *, ack: bool = True
+    ) -> Iterator[Email]:
+        """Yield unread messages page by page as they are downloaded.
+
+        The IDs of every unread message are listed first. Then every page of
+        up to :attr:`max_results` IDs is fetched in batches and acknowledged
+        with :meth:`acknowledge` before its messages are yielded, so only one
+        page of messages is held in memory at a time. Unlike :meth:`poll`, API
+        errors propagate to the caller, including rate limit errors for single
+        messages, which are raised once the page's other messages are yielded.
+
+        Args:
+            sender: Only yield messages from this address.
+            ack: Acknowledge each page before yielding it. When ``False`` the
+                caller must call :meth:`acknowledge` once a message has been
+                handled; unacknowledged messages are yielded again by the next
+                poll.
+        """
+        if self._shared_auth:
+            get_credentials(self.token_path, self.credentials_path)
+        for ids, filter_sender in self._iter_id_pages(sender):
+            emails, error = self._fetch_messages(ids, sender=filter_sender)
+            self.metrics.inc("gmail_messages_fetched_total", len(emails))
+            if self.index is not None:
+                self.index.add(emails)
+            if ack:
+                self.acknowledge([email.id for email in emails])
+            yield from emails
+            if error is not None:
+                # The messages fetched before Gmail refused are handled; the
+                # rest stay unread for the next poll.
+                raise error
+
+    def acknowledge(self, ids: List[str]) -> None:
+        """Record *ids* as processed.
+
+        The messages are marked as read unless :attr:`mark_read` is off, and
+        recorded in :attr:`store` if there is one.
+        """
+        if self.mark_read:
+            self._mark_read(ids)
+            if self.index is not None:
+                self.index.remove_label(ids, "UNREAD")
+        if self.store is not None:
+            self.store.mark_seen(ids)
+        self._release(ids)
+
+    def _iter_id_pages(
+        self, sender: Optional[str]
+    ) -> Iterator[tuple[List[str], Optional[str]]]:
+        """Yield pages of unseen message IDs and the sender they must match.
+
+        In incremental mode the History API is used once a ``historyId`` is
+        known. History records cannot be filtered by sender, so the sender is
+        yielded for the caller to check against the fetched ``From`` header.
+        Messages in the retry set are yielded first, and every yielded ID is
+        added to it before the cursor moves past it.
+        """
+        listed: set[str] = set()
+
+        def unseen(ids: List[str]) -> List[str]:
+            ids = [message_id for message_id in ids if message_id not in listed]
+            listed.update(ids)
+            if self.store is not None:
+                fresh = self.store.filter_unseen(ids)
+                # Processed by an earlier run that stopped before releasing.
+                self._release(sorted(set(ids).difference(fresh)))
+                ids = fresh
+            if self.incremental:
+                self._hold(ids)
+            return ids
+
+        def pages(ids: List[str]) -> Iterator[tuple[List[str], Optional[str]]]:
+            for start in range(0, len(ids), self.max_results):
+                yield ids[start : start + self.max_results], sender
+
+        if (
+            self.incremental
+            and self.history_id is not None
+            and self._history_sender != (sender or "")
+        ):
+            # History since the cursor lacks what the old sender filter
+            # dropped; those messages are still unread, so list them again.
+            logging.info(
+                "History ID %s was recorded for another sender; "
+                "falling back to a full listing",
+                self.history_id,
+            )
+            self.history_id = None
+        if self.incremental and self.history_id is not None:
+            try:
+                ids, history_id = self._list_history_ids()
+            except Exception as exc:
+                if http_status(exc) != 404:
+                    raise
+                logging.info(
+                    "History ID %s expired; falling back to a full listing",
+                    self.history_id,
+                )
+                self.history_id = None
+            else:
+                ids = unseen([*self._retry_ids(), *ids])
+                self.history_id = history_id
+                yield from pages(ids)
+                return
+        if self.incremental:
+            yield from pages(unseen(self._retry_ids()))
+        full_history_id: Optional[str] = None
+        if self.incremental:
+            # Record the cursor before listing so nothing that arrives while
+            # listing is missed by the next incremental poll.
+            profile = self._execute(
+                self.service.users().getProfile(userId="me"), "users.getProfile"
             )
-            emails.append(Email(id=full["id"], snippet=full.get("snippet", "")))
-            self.service.users().messages().modify(
+            full_history_id = profile["historyId"]
+        query = f"from:{sender} is:unread" if sender else "is:unread"
+        messages = self.service.users().messages()
+        # Every page is listed before any message is marked as read: page
+        # tokens are positions in the ``is:unread`` results, so reading
+        # earlier pages would make later ones skip messages.
+        ids = []
+        page_token: Optional[str] = None
+        while True:
+            request = messages.list(
                 userId="me",
-                id=full["id"],
-                body={"removeLabelIds": ["UNREAD"]},  # pragma: no cover - network
-            ).execute()
-        return emails
+                q=query,
+                maxResults=self.max_results,
+                pageToken=page_token,
+                fields=LIST_FIELDS,
+            )
+            result = self._execute(request, "users.messages.list")
+            ids.extend(msg["id"] for msg in result.get("messages", []))
+            page_token = result.get("nextPageToken")
+            if not page_token:
+                break
+        ids = unseen(ids)
+        for start in range(0, len(ids), self.max_results):
+            yield ids[start : start + self.max_results], None
+        if self.incremental:
+            # Stored before the sender, so an interruption in between makes
+            # the next poll list everything again instead of skipping mail.
+            self.history_id = full_history_id
+            self._history_sender = sender or ""
+            if self.store is not None:
+                self.store.set_cursor(HISTORY_SENDER_CURSOR, self._history_sender)
+
+    def _list_history_ids(self) -> tuple[List[str], Optional[str]]:
+        """Return IDs of unread messages added since :attr:`history_id`.
+
+        The ``historyId`` to continue from is returned alongside, for the
+        caller to store once the IDs are safe in the retry set.
+        """
+        ids: Dict[str, None] = {}
+        history = self.service.users().history()
+        page_token: Optional[str] = None
+        while True:
+            request = history.list(
+                userId="me",
+                startHistoryId=self.history_id,
+                historyTypes=["messageAdded"],
+                labelId="UNREAD",
+                pageToken=page_token,
+                fields=HISTORY_FIELDS,
+            )
+            result = self._execute(request, "users.history.list")
+            for record in result.get("history", []):
+                for added in record.get("messagesAdded", []):
+                    ids[added["message"]["id"]] = None
+            page_token = result.get("nextPageToken")
+            if not page_token:
+                break
+        return list(ids), result.get("historyId", self.history_id)
+
+    def _retry_ids(self) -> List[str]:
+        with self._retry_lock:
+            return list(self._retry)
+
+    def _hold(self, ids: List[str]) -> None:
+        """Add *ids* to the retry set until they are acknowledged."""
+        with self._retry_lock:
+            new = [message_id for message_id in ids if message_id not in self._retry]
+            self._retry.update(dict.fromkeys(new))
+        if new and self.store is not None:
+            self.store.add_pending(new)
+
+    def _release(self, ids: List[str]) -> None:
+        """Remove *ids* from the retry set."""
+        with self._retry_lock:
+            gone = [message_id for message_id in ids if message_id in self._retry]
+            for message_id in gone:
+                del self._retry[message_id]
+        if gone and self.store is not None:
+            self.store.remove_pending(gone)
+
+    def _fetch_messages(
+        self, ids: List[str], sender: Optional[str] = None
+    ) -> tuple[List[Email], Optional[Exception]]:
+        """Fetch *ids* using batch HTTP requests.
+
+        Messages that fail to download are logged and omitted from the result
+        so they stay unread and are retried on the next poll: a full listing
+        finds them again, and in incremental mode they stay in the retry set.
+        If *sender* is given, messages whose ``From`` header does not mention
+        it are dropped, as are deleted messages; neither is retried.
+
+        Returns:
+            The fetched messages, and the first rate limit or batch request
+            error, if any. No further batches are sent after such an error.
+        """
+        fetched: Dict[str, Email] = {}
+        dropped: List[str] = []
+        errors: List[Exception] = []
+        profile = self.profile.with_sender() if sender else self.profile
+        params = profile.request_params()
+
+        def on_response(request_id: str, response: Any, exception: Any) -> None:
+            if exception is not None:
+                logging.warning("Failed to fetch message %s: %s", request_id, exception)
+                status = http_status(exception)
+                if status == 404:
+                    dropped.append(request_id)
+                elif status in RATE_LIMIT_STATUSES:
+                    errors.append(exception)
+                return
+            if sender and not _from_matches(response, sender):
+                dropped.append(request_id)
+                return
+            fetched[request_id] = email_from_message(response)
+
+        messages = self.service.users().messages()
+        for start in range(0, len(ids), self.batch_size):
+            if errors:
+                break
+            batch = self.service.new_batch_http_request(callback=on_response)
+            chunk = ids[start : start + self.batch_size]
+            for message_id in chunk:
+                batch.add(
+                    messages.get(userId="me", id=message_id, **params),
+                    request_id=message_id,
+                )
+            try:
+                # Every call in a batch is charged separately.
+                self._execute(batch, "users.messages.get", len(chunk))
+            except Exception as exc:
+                logging.warning("Failed to fetch message batch: %s", exc)
+                errors.append(exc)
+        self._release(dropped)
+        emails = [fetched[message_id] for message_id in ids if message_id in fetched]
+        return emails, errors[0] if errors else None
+
+    def load_body(self, email: Email) -> Email:
+        """Download the body and attachment list of *email* if still missing.
+
+        Returns:
+            *email*, updated in place.
+        """
+        if email.encoded_body is None:
+            request = (
+                self.service.users()
+                .messages()
+                .get(userId="me", id=email.id, format="full", fields="payload")
+            )
+            message = self._execute(request, "users.messages.get")
+            email.encoded_body, email.attachments = parse_payload(
+                message.get("payload", {})
+            )
+            if self.index is not None:
+                self.index.add([email])
+        return email
+
+    def load_attachment(self, email: Email, attachment: Attachment) -> memoryview:
+        """Download the data of *attachment* of *email* unless already loaded.
+
+        The decoded bytes are kept on :attr:`Attachment.data`; the returned
+        view shares them without copying.
+        """
+        if attachment.data is not None:
+            return attachment.view()
+        request = (
+            self.service.users()
+            .messages()
+            .attachments()
+            .get(
+                userId="me",
+                messageId=email.id,
+                id=attachment.attachment_id,
+                fields="data",
+            )
+        )
+        result = self._execute(request, "users.messages.attachments.get")
+        attachment.data = decode_base64url(result["data"])
+        return attachment.view()
+
+    def _mark_read(self, ids: List[str]) -> None:
+        """Remove the ``UNREAD`` label from *ids* with ``messages.batchModify``."""
+        messages = self.service.users().messages()
+        for start in range(0, len(ids), MAX_MODIFY_IDS):
+            request = messages.batchModify(
+                userId="me",
+                body={
+                    "ids": ids[start : start + MAX_MODIFY_IDS],
+                    "removeLabelIds": ["UNREAD"],
+                },
+            )
+            try:
+                self._execute(request, "users.messages.batchModify")
+            except Exception as exc:  # pragma: no cover - network failure
+                logging.warning("Failed to mark messages as read: %s", exc)
+
+    def _execute(self, request: Any, method: str, count: int = 1) -> Any:
+        """Execute *request*, holding for :attr:`limiter` first, and time it.
+
+        Args:
+            request: Gmail API or batch HTTP request.
+            method: Gmail API method *request* calls, such as
+                ``users.messages.list``.
+            count: Number of calls of *method* in *request*.
+        """
+        if self.limiter is not None:
+            wait = self.limiter.acquire(method, count)
+            with self._units_lock:
+                self.units += quota_units(method) * count
+            if wait > 0:
+                self.metrics.observe("gmail_quota_wait_seconds", wait, method=method)
+        with self.metrics.timer("gmail_request_seconds", method=method):
+            return request.execute()
+
+
+def email_from_message(message: Dict[str, Any]) -> Email:
+    """Build an :class:`Email` from a ``messages.get`` response."""
+    label_ids = message.get("labelIds")
+    email = Email(
+        id=message["id"],
+        snippet=message.get("snippet", ""),
+        thread_id=message.get("threadId"),
+        # Label IDs and header names repeat across messages; share one copy.
+        label_ids=[sys.intern(label) for label in label_ids] if label_ids else None,
+    )
+    payload = message.get("payload")
+    if payload is not None:
+        email.headers = {
+            sys.intern(header["name"]): header["value"]
+            for header in payload.get("headers", [])
+        }
+        if "body" in payload or "parts" in payload:
+            email.encoded_body, email.attachments = parse_payload(payload)
+    return email
+
+
+def parse_payload(
+    payload: Dict[str, Any],
+) -> Tuple[Tuple[str, ...], List[Attachment]]:
+    """Return the encoded plain text parts and attachments of a ``full`` payload.
+
+    Text parts are left base64url encoded; :attr:`Email.body` decodes them.
+    """
+    texts: List[str] = []
+    attachments: List[Attachment] = []
+    parts = [payload]
+    while parts:
+        part = parts.pop(0)
+        parts.extend(part.get("parts", []))
+        body = part.get("body", {})
+        if body.get("attachmentId"):
+            attachments.append(
+                Attachment(
+                    attachment_id=body["attachmentId"],
+                    filename=part.get("filename", ""),
+                    mime_type=part.get("mimeType", ""),
+                    size=body.get("size", 0),
+                )
+            )
+        elif part.get("mimeType") == "text/plain" and body.get("data"):
+            texts.append(body["data"])
+    return tuple(texts), attachments
+
+
+def decode_base64url(data: str) -> bytes:
+    """Decode Gmail's unpadded base64url encoding."""
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def http_status(exc: BaseException) -> Optional[int]:
+    """Return the HTTP status carried by a Gmail API error, if any.
+
+    Handles both ``googleapiclient`` errors, which expose the response as
+    ``resp``, and ``aiohttp`` errors, which carry ``status`` directly.
+    """
+    status = getattr(getattr(exc, "resp", None), "status", None)
+    if status is None:
+        status = getattr(exc, "status", None)
+    return int(status) if status is not None else None
+
+
+def retry_after(exc: BaseException) -> Optional[float]:
+    """Return the delay in seconds requested by a ``Retry-After`` header.
+
+    The header may hold either a number of seconds or an HTTP date. ``None``
+    is returned when *exc* carries no usable header.
+    """
+    headers: Any = getattr(exc, "headers", None)
+    if headers is None:
+        headers = getattr(exc, "resp", None)
+    if not hasattr(headers, "get"):
+        return None
+    value = headers.get("retry-after") or headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _from_matches(message: Dict[str, Any], sender: str) -> bool:
+    """Return whether the ``From`` header of *message* mentions *sender*."""
+    for header in message.get("payload", {}).get("headers", []):
+        if header.get("name", "").lower() == "from":
+            return sender.lower() in header.get("value", "").lower()
+    return False
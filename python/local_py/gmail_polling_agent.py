@@ -1,37 +1,170 @@
 import asyncio
 import logging
-from typing import Optional
+import time
+from concurrent.futures import Executor
+from typing import AsyncIterator, List, Optional, Union
 
-from .gmail_poller import GmailPoller
+from .async_gmail_poller import AsyncGmailPoller
+from .email_pipeline import EmailPipeline
+from .gmail_poller import Email, GmailPoller
+from .gmail_quota import QuotaLimiter
+from .metrics import NULL_METRICS, Metrics
+from .polling_policy import FixedPollingPolicy, PollingPolicy
 
 
 class GmailPollingAgent:
-    """Continuously poll Gmail for new messages."""
+    """Continuously poll Gmail for new messages.
+
+    When the poller has a quota limiter, the delay chosen by the policy is
+    stretched so that polls costing as much as the last one stay below the
+    limiter's rate (see :meth:`pace`).
+    """
 
     def __init__(
         self,
-        poller: GmailPoller,
+        poller: Union[GmailPoller, AsyncGmailPoller],
         *,
         sender: Optional[str] = None,
         interval: int = 60,
+        executor: Optional[Executor] = None,
+        policy: Optional[PollingPolicy] = None,
+        pipeline: Optional[EmailPipeline] = None,
+        metrics: Optional[Metrics] = None,
     ) -> None:
+        """Create a new :class:`GmailPollingAgent`.
+
+        Args:
+            poller: Poller used to fetch unread messages. An
+                :class:`AsyncGmailPoller` is awaited natively; a blocking
+                :class:`GmailPoller` runs in *executor*.
+            sender: Only handle messages from this address.
+            interval: Polling interval in seconds.
+            executor: Executor for blocking poller calls. Defaults to the
+                event loop's default executor.
+            policy: Decides the delay between polls. Defaults to a fixed
+                *interval*.
+            pipeline: Hands messages to handler plugins on concurrent
+                workers and acknowledges them only once handled. Without
+                one, each message is logged as it arrives. Acknowledgements
+                run in *executor* while the next messages are fetched, so a
+                blocking poller needs a thread-safe transport such as
+                :class:`~local_py.gmail_transport.PooledHttp`.
+            metrics: Records the duration and message count of every poll,
+                failed polls, and how late each poll woke up.
+        """
         self.poller = poller
         self.sender = sender
         self.interval = interval
+        self.executor = executor
+        self.policy = policy or FixedPollingPolicy(interval)
+        self.pipeline = pipeline
+        self.metrics = metrics if metrics is not None else NULL_METRICS
+        # Quota units :attr:`poller` spent in the most recent :meth:`poll_once`,
+        # not counting other pollers sharing its limiter.
+        self.last_poll_units = 0
+
+    @property
+    def limiter(self) -> Optional[QuotaLimiter]:
+        """Quota limiter of :attr:`poller`, if it has one."""
+        limiter = getattr(self.poller, "limiter", None)
+        return limiter if isinstance(limiter, QuotaLimiter) else None
+
+    def pace(self, delay: float) -> float:
+        """Return *delay*, raised to the limiter's hint for another poll.
+
+        The hint is how long until the quota bucket holds the units the last
+        poll spent, so repeated polls never average more than the
+        limiter's rate.
+        """
+        limiter = self.limiter
+        if limiter is None:
+            return delay
+        hint = limiter.delay(self.last_poll_units)
+        if hint > delay:
+            logging.debug(
+                "Delaying next poll to %.1fs to stay within Gmail quota", hint
+            )
+            return hint
+        return delay
 
     async def run(self, interval: Optional[int] = None) -> None:
         """Start polling until cancelled.
 
         Args:
-            interval: Polling interval in seconds. Defaults to the value
-                provided at construction.
+            interval: Fixed polling interval in seconds. Overrides
+                :attr:`policy` when provided.
         """
-        delay = interval if interval is not None else self.interval
+        policy = FixedPollingPolicy(interval) if interval is not None else self.policy
         try:
             while True:
-                for email in self.poller.poll(sender=self.sender):
-                    logging.info("New email %s: %s", email.id, email.snippet)
+                count, error = 0, None
+                try:
+                    count = await self.poll_once()
+                except Exception as exc:
+                    logging.warning("Failed to poll Gmail: %s", exc)
+                    self.metrics.inc("poll_errors_total")
+                    error = exc
+                delay = self.pace(policy.next_delay(count, error))
+                due = time.monotonic() + delay
                 await asyncio.sleep(delay)
+                self.metrics.observe(
+                    "poll_loop_lag_seconds", max(0.0, time.monotonic() - due)
+                )
         except asyncio.CancelledError:
             logging.info("Polling cancelled")
             raise
+
+    async def poll_once(self) -> int:
+        """Handle every currently unread message and return how many there were.
+
+        Poller errors propagate to the caller after the messages received
+        before the failure have been handled.
+        """
+        limiter = self.limiter
+        before = self.poller.units if limiter is not None else 0
+        try:
+            with self.metrics.timer("poll_seconds"):
+                count = await self._poll()
+            self.metrics.observe("poll_messages", count)
+            return count
+        finally:
+            if limiter is not None:
+                self.last_poll_units = self.poller.units - before
+
+    async def _poll(self) -> int:
+        if self.pipeline is not None:
+            return await self.pipeline.process(
+                self._iter_unread(ack=False), self._acknowledge
+            )
+        count = 0
+        async for email in self._iter_unread():
+            logging.info("New email %s: %s", email.id, email.snippet)
+            count += 1
+        return count
+
+    async def _iter_unread(self, ack: bool = True) -> AsyncIterator[Email]:
+        """Yield unread messages without blocking the event loop.
+
+        Blocking pollers are advanced one message at a time in
+        :attr:`executor`, so the loop stays responsive while HTTP requests are
+        in flight.
+        """
+        stream = self.poller.iter_unread(sender=self.sender, ack=ack)
+        if hasattr(stream, "__aiter__"):
+            async for email in stream:
+                yield email
+            return
+        loop = asyncio.get_running_loop()
+        iterator = iter(stream)
+        while True:
+            email = await loop.run_in_executor(self.executor, next, iterator, None)
+            if email is None:
+                return
+            yield email
+
+    async def _acknowledge(self, ids: List[str]) -> None:
+        if isinstance(self.poller, AsyncGmailPoller):
+            await self.poller.acknowledge(ids)
+            return
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.executor, self.poller.acknowledge, ids)
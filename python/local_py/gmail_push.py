@@ -0,0 +1,184 @@
+"""Push-based Gmail delivery through Cloud Pub/Sub push notifications."""
+
+from __future__ import annotations
+
+import asyncio
+import base64
+import binascii
+import hmac
+import json
+import logging
+import time
+from typing import Any, Dict, Optional
+
+from aiohttp import web
+
+from .async_gmail_poller import AsyncGmailPoller
+from .gmail_polling_agent import GmailPollingAgent
+
+DEFAULT_PUSH_PATH = "/gmail/push"
+# Gmail watches expire after seven days; Google recommends renewing daily.
+WATCH_RENEWAL_INTERVAL = 24 * 60 * 60
+
+
+class PushNotificationReceiver:
+    """Small HTTP endpoint accepting Pub/Sub push deliveries for Gmail.
+
+    Every valid notification wakes up :meth:`wait`. Notifications that arrive
+    while nobody is waiting are coalesced, so a burst of changes triggers a
+    single fetch.
+    """
+
+    def __init__(
+        self,
+        *,
+        host: str = "127.0.0.1",
+        port: int = 8080,
+        path: str = DEFAULT_PUSH_PATH,
+        token: Optional[str] = None,
+    ) -> None:
+        """Create a new :class:`PushNotificationReceiver`.
+
+        Args:
+            host: Interface to listen on.
+            port: Port to listen on. ``0`` picks a free port, available from
+                :attr:`port` after :meth:`start`.
+            path: URL path of the push endpoint.
+            token: Shared secret expected in the ``token`` query parameter of
+                the push subscription URL. Requests without it are rejected.
+        """
+        self.host = host
+        self.port = port
+        self.path = path
+        self.token = token
+        self.last_notification: Optional[Dict[str, Any]] = None
+        self._event = asyncio.Event()
+        self._runner: Optional[web.AppRunner] = None
+
+    async def start(self) -> None:
+        """Start serving if not already running."""
+        if self._runner is not None:
+            return
+        app = web.Application()
+        app.router.add_post(self.path, self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        self.port = self._runner.addresses[0][1]
+        logging.info("Listening for Gmail push notifications on port %d", self.port)
+
+    async def stop(self) -> None:
+        """Stop serving."""
+        runner, self._runner = self._runner, None
+        if runner is not None:
+            await runner.cleanup()
+
+    async def wait(self) -> Dict[str, Any]:
+        """Wait for the next notification and return its decoded payload."""
+        await self._event.wait()
+        self._event.clear()
+        return self.last_notification or {}
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        if self.token is not None and not hmac.compare_digest(
+            request.query.get("token", ""), self.token
+        ):
+            return web.Response(status=403)
+        try:
+            envelope = await request.json()
+            data = base64.b64decode(envelope["message"]["data"])
+            notification = json.loads(data)
+        except (KeyError, TypeError, ValueError, binascii.Error):
+            return web.Response(status=400)
+        logging.debug("Gmail push notification: %s", notification)
+        self.last_notification = notification
+        self._event.set()
+        # Any 2xx acknowledges the Pub/Sub message so it is not redelivered.
+        return web.Response(status=204)
+
+
+class GmailPushAgent:
+    """Fetch new mail as soon as Gmail pushes a change notification.
+
+    The wrapped agent's poller should be an incremental
+    :class:`~local_py.gmail_poller.GmailPoller`, so each notification costs a
+    ``history.list`` call instead of a full listing. A slow timer poll keeps
+    running as a safety net in case notifications are lost. Every fetch is
+    reported to the agent's :attr:`~GmailPollingAgent.policy`, and after a
+    failure, such as a rate limit error with a ``Retry-After`` hint, the next
+    fetch waits as long as the policy asks; notifications arriving meanwhile
+    are coalesced into that fetch.
+    """
+
+    def __init__(
+        self,
+        agent: GmailPollingAgent,
+        receiver: PushNotificationReceiver,
+        *,
+        topic_name: str,
+        safety_interval: float = 900.0,
+        renewal_interval: float = WATCH_RENEWAL_INTERVAL,
+    ) -> None:
+        """Create a new :class:`GmailPushAgent`.
+
+        Args:
+            agent: Agent that fetches and handles messages.
+            receiver: Endpoint the Pub/Sub push subscription delivers to.
+            topic_name: Pub/Sub topic registered with ``users.watch``.
+            safety_interval: Poll at least this often without notifications.
+            renewal_interval: Seconds between ``users.watch`` renewals.
+        """
+        self.agent = agent
+        self.receiver = receiver
+        self.topic_name = topic_name
+        self.safety_interval = safety_interval
+        self.renewal_interval = renewal_interval
+        self._watch_renew_at = 0.0
+
+    async def run(self) -> None:
+        """Register the watch and fetch on every notification until cancelled."""
+        await self.receiver.start()
+        try:
+            while True:
+                if time.monotonic() >= self._watch_renew_at:
+                    await self._watch()
+                count, error = 0, None
+                try:
+                    count = await self.agent.poll_once()
+                except Exception as exc:
+                    logging.warning("Failed to fetch Gmail changes: %s", exc)
+                    error = exc
+                delay = self.agent.policy.next_delay(count, error)
+                if error is not None:
+                    await asyncio.sleep(self.agent.pace(delay))
+                try:
+                    await asyncio.wait_for(
+                        self.receiver.wait(), timeout=self.safety_interval
+                    )
+                except asyncio.TimeoutError:
+                    logging.debug("No push notification; running safety poll")
+        except asyncio.CancelledError:
+            logging.info("Push agent cancelled")
+            raise
+        finally:
+            await self.receiver.stop()
+
+    async def _watch(self) -> None:
+        poller = self.agent.poller
+        try:
+            if isinstance(poller, AsyncGmailPoller):
+                response = await poller.watch(self.topic_name)
+            else:
+                response = await asyncio.get_running_loop().run_in_executor(
+                    self.agent.executor, poller.watch, self.topic_name
+                )
+        except Exception as exc:
+            # Retry on the next wake-up; the safety poll keeps mail flowing.
+            logging.warning("Failed to register Gmail watch: %s", exc)
+            return
+        logging.info(
+            "Gmail watch registered until %s (historyId %s)",
+            response.get("expiration"),
+            response.get("historyId"),
+        )
+        self._watch_renew_at = time.monotonic() + self.renewal_interval
@@ -0,0 +1,166 @@
+"""Client-side accounting of Gmail API quota units."""
+
+from __future__ import annotations
+
+import threading
+import time
+from collections import Counter
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+# Quota units Gmail charges per call of each method.
+QUOTA_UNITS: Dict[str, int] = {
+    "users.getProfile": 1,
+    "users.watch": 100,
+    "users.stop": 50,
+    "users.history.list": 2,
+    "users.labels.list": 1,
+    "users.messages.list": 5,
+    "users.messages.get": 5,
+    "users.messages.modify": 5,
+    "users.messages.batchModify": 50,
+    "users.messages.attachments.get": 5,
+    "users.messages.send": 100,
+    "users.threads.list": 10,
+    "users.threads.get": 10,
+}
+# Charged for methods missing from :data:`QUOTA_UNITS`.
+DEFAULT_METHOD_UNITS = 10
+# Gmail allows each user 250 units per second, averaged over a short window.
+PER_USER_LIMIT = 250.0
+# Sustained rate of :class:`QuotaLimiter`, leaving headroom below the limit.
+DEFAULT_QUOTA_RATE = 200.0
+
+
+def quota_units(method: str) -> int:
+    """Return the quota units one call of Gmail API *method* costs."""
+    return QUOTA_UNITS.get(method, DEFAULT_METHOD_UNITS)
+
+
+class QuotaLimiter:
+    """Token bucket metering Gmail calls by the quota units they cost.
+
+    The bucket refills at *rate* units per second up to *burst* units. A call
+    takes its units immediately and waits while the bucket is in debt, so
+    calls costing more than *burst*, such as a batch of 100 ``messages.get``,
+    still pass and delay the calls after them instead. The limiter is safe to
+    share between threads and between pollers of the same mailbox.
+    """
+
+    def __init__(
+        self,
+        rate: float = DEFAULT_QUOTA_RATE,
+        *,
+        burst: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], Any] = time.sleep,
+    ) -> None:
+        """Create a new :class:`QuotaLimiter`.
+
+        Args:
+            rate: Units per second allowed on average.
+            burst: Units that may be spent at once after an idle period.
+                Defaults to one second of *rate*.
+            clock: Monotonic time source, replaceable in tests.
+            sleep: Blocking sleep used by :meth:`acquire`.
+        """
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        burst = rate if burst is None else burst
+        if burst <= 0:
+            raise ValueError("burst must be positive")
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self.sleep = sleep
+        self._lock = threading.Lock()
+        self._tokens = burst
+        self._updated = clock()
+        self._calls: Counter[str] = Counter()
+        self._units: Counter[str] = Counter()
+        self._throttled = 0
+        self._wait_seconds = 0.0
+
+    @property
+    def units(self) -> int:
+        """Total units spent through this limiter."""
+        with self._lock:
+            return sum(self._units.values())
+
+    def reserve(self, method: str, count: int = 1) -> float:
+        """Take the units of *count* calls of *method* without waiting.
+
+        Returns:
+            Seconds the caller must wait before sending the calls.
+        """
+        units = quota_units(method) * count
+        with self._lock:
+            self._refill()
+            self._tokens -= units
+            wait = max(0.0, -self._tokens / self.rate)
+            self._calls[method] += count
+            self._units[method] += units
+            if wait > 0:
+                self._throttled += 1
+                self._wait_seconds += wait
+        return wait
+
+    def acquire(self, method: str, count: int = 1) -> float:
+        """Block until *count* calls of *method* fit in the quota.
+
+        Returns:
+            Seconds spent waiting.
+        """
+        wait = self.reserve(method, count)
+        if wait > 0:
+            self.sleep(wait)
+        return wait
+
+    def delay(self, units: float) -> float:
+        """Return seconds until *units* can be spent without waiting.
+
+        Callers scheduling periodic work pass the cost of one run to learn
+        how long to wait so that their average stays below :attr:`rate`.
+        """
+        with self._lock:
+            self._refill()
+            return max(0.0, (min(units, self.burst) - self._tokens) / self.rate)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return usage counters and the units currently available.
+
+        ``throttled`` counts reservations that had to wait and
+        ``wait_seconds`` their total wait. ``available`` is negative while
+        the bucket is in debt.
+        """
+        with self._lock:
+            self._refill()
+            return {
+                "calls": sum(self._calls.values()),
+                "units": sum(self._units.values()),
+                "throttled": self._throttled,
+                "wait_seconds": self._wait_seconds,
+                "available": self._tokens,
+                "units_by_method": dict(self._units),
+            }
+
+    def _refill(self) -> None:
+        now = self.clock()
+        elapsed = max(0.0, now - self._updated)
+        self._updated = now
+        self._tokens = min(self.burst, self._tokens + elapsed * self.rate)
+
+
+@lru_cache(maxsize=None)
+def _shared_limiter(token_path: Path) -> QuotaLimiter:
+    return QuotaLimiter()
+
+
+def get_limiter(token_path: Path | str) -> QuotaLimiter:
+    """Return the process-wide :class:`QuotaLimiter` for the user of *token_path*.
+
+    Quota is charged per user, so every poller authorized by the same token
+    shares one limiter.
+    """
+    return _shared_limiter(Path(token_path).resolve())
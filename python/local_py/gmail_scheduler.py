@@ -0,0 +1,250 @@
+"""Poll many Gmail mailboxes from one event loop with a shared worker pool."""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field, replace
+from functools import partial
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from .gmail_poller import GmailPoller
+from .gmail_polling_agent import GmailPollingAgent
+from .message_store import DEFAULT_RETENTION, MessageStore
+from .metrics import NULL_METRICS, Metrics
+from .polling_policy import AdaptivePollingPolicy, FixedPollingPolicy, PollingPolicy
+
+DEFAULT_MAX_WORKERS = 4
+
+
+@dataclass
+class MailboxConfig:
+    """Polling settings for one mailbox.
+
+    Attributes:
+        name: Unique label used in logs and :meth:`GmailScheduler.lag_report`.
+        token_path: OAuth token for the mailbox.
+        sender: Only handle messages from this address.
+        interval: Seconds between the end of one poll and the next.
+        jitter: Fraction of the delay added or subtracted at random so
+            mailboxes with equal intervals do not poll in lockstep.
+        adaptive: Use an :class:`AdaptivePollingPolicy` starting at
+            *interval* instead of a fixed delay.
+        state_path: SQLite :class:`MessageStore` remembering processed
+            messages and the sync cursor across restarts.
+    """
+
+    name: str
+    token_path: Path
+    sender: Optional[str] = None
+    interval: float = 60.0
+    jitter: float = 0.1
+    adaptive: bool = False
+    state_path: Optional[Path] = None
+
+    def __post_init__(self) -> None:
+        self.token_path = Path(self.token_path)
+        if self.state_path is not None:
+            self.state_path = Path(self.state_path)
+        if self.interval <= 0:
+            raise ValueError(f"{self.name}: interval must be positive")
+        if not 0 <= self.jitter < 1:
+            raise ValueError(f"{self.name}: jitter must be in [0, 1)")
+
+    def policy(self) -> PollingPolicy:
+        """Return a fresh polling policy for this mailbox."""
+        if not self.adaptive:
+            return FixedPollingPolicy(self.interval)
+        return AdaptivePollingPolicy(
+            self.interval,
+            min_interval=min(self.interval, 5.0),
+            max_interval=max(self.interval, 900.0),
+        )
+
+
+@dataclass
+class MailboxStats:
+    """Running counters for one scheduled mailbox.
+
+    ``lag`` is how long a poll started after it was due, including time spent
+    waiting for a free worker.
+    """
+
+    polls: int = 0
+    errors: int = 0
+    messages: int = 0
+    last_lag: float = 0.0
+    max_lag: float = 0.0
+    total_lag: float = field(default=0.0, repr=False)
+
+    @property
+    def mean_lag(self) -> float:
+        return self.total_lag / self.polls if self.polls else 0.0
+
+
+def load_mailbox_configs(path: Path | str) -> List[MailboxConfig]:
+    """Load mailbox settings from a JSON list of :class:`MailboxConfig` fields.
+
+    Relative ``token_path`` and ``state_path`` entries are resolved against
+    the file's directory.
+    """
+    path = Path(path)
+    entries: List[Dict[str, Any]] = json.loads(path.read_text())
+    configs = []
+    for entry in entries:
+        config = MailboxConfig(**entry)
+        if not config.token_path.is_absolute():
+            config.token_path = path.parent / config.token_path
+        if config.state_path is not None and not config.state_path.is_absolute():
+            config.state_path = path.parent / config.state_path
+        configs.append(config)
+    names = [config.name for config in configs]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Duplicate mailbox names in {path}")
+    return configs
+
+
+class GmailScheduler:
+    """Run a :class:`GmailPollingAgent` per mailbox on one event loop.
+
+    Blocking Gmail calls for every mailbox share a single bounded thread pool,
+    and at most ``max_workers`` polls run at once.
+    """
+
+    def __init__(
+        self,
+        configs: List[MailboxConfig],
+        *,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+        poller_factory: Optional[Callable[[MailboxConfig], Any]] = None,
+        report_interval: Optional[float] = None,
+        rng: Optional[random.Random] = None,
+        metrics: Optional[Metrics] = None,
+    ) -> None:
+        """Create a new :class:`GmailScheduler`.
+
+        Args:
+            configs: Mailboxes to poll.
+            max_workers: Size of the shared worker pool.
+            poller_factory: Builds the poller for a mailbox. Defaults to an
+                incremental :class:`GmailPoller` for ``config.token_path``,
+                backed by a :class:`MessageStore` at ``config.state_path``.
+            report_interval: If set, log :meth:`lag_report` this often.
+            rng: Random source for start offsets and jitter.
+            metrics: Shared by every mailbox's poller and agent; poll lag is
+                recorded per mailbox.
+        """
+        if max_workers < 1:
+            raise ValueError("max_workers must be at least 1")
+        self.metrics = metrics if metrics is not None else NULL_METRICS
+        factory = poller_factory or partial(_default_poller, metrics=self.metrics)
+        self.configs = configs
+        self.max_workers = max_workers
+        self.report_interval = report_interval
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="gmail-poll"
+        )
+        self.agents: Dict[str, GmailPollingAgent] = {
+            config.name: GmailPollingAgent(
+                factory(config),
+                sender=config.sender,
+                executor=self.executor,
+                policy=config.policy(),
+                metrics=self.metrics,
+            )
+            for config in configs
+        }
+        self.stats: Dict[str, MailboxStats] = {
+            config.name: MailboxStats() for config in configs
+        }
+        self._rng = rng or random.Random()
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    async def run(self) -> None:
+        """Poll every mailbox until cancelled."""
+        self._slots = asyncio.Semaphore(self.max_workers)
+        tasks = [self._run_mailbox(config) for config in self.configs]
+        if self.report_interval is not None:
+            tasks.append(self._report(self.report_interval))
+        try:
+            await asyncio.gather(*tasks)
+        except asyncio.CancelledError:
+            logging.info("Scheduler cancelled")
+            raise
+        finally:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def lag_report(self) -> Dict[str, MailboxStats]:
+        """Return a snapshot of per-mailbox counters keyed by mailbox name."""
+        return {name: replace(stats) for name, stats in self.stats.items()}
+
+    def _next_delay(
+        self, config: MailboxConfig, count: int, error: Optional[Exception]
+    ) -> float:
+        agent = self.agents[config.name]
+        delay = agent.policy.next_delay(count, error)
+        return agent.pace(
+            delay * (1 + self._rng.uniform(-config.jitter, config.jitter))
+        )
+
+    async def _run_mailbox(self, config: MailboxConfig) -> None:
+        agent = self.agents[config.name]
+        stats = self.stats[config.name]
+        assert self._slots is not None
+        # Stagger the first polls across one interval.
+        due = time.monotonic() + self._rng.uniform(0, config.interval)
+        while True:
+            await asyncio.sleep(max(0.0, due - time.monotonic()))
+            async with self._slots:
+                lag = max(0.0, time.monotonic() - due)
+                count, error = 0, None
+                try:
+                    count = await agent.poll_once()
+                    stats.messages += count
+                except Exception as exc:
+                    error = exc
+                    stats.errors += 1
+                    logging.warning("Failed to poll mailbox %s: %s", config.name, exc)
+                stats.polls += 1
+                stats.last_lag = lag
+                stats.max_lag = max(stats.max_lag, lag)
+                stats.total_lag += lag
+                self.metrics.observe("poll_loop_lag_seconds", lag, mailbox=config.name)
+            due = time.monotonic() + self._next_delay(config, count, error)
+
+    async def _report(self, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            for name, stats in self.lag_report().items():
+                logging.info(
+                    "Mailbox %s: polls=%d errors=%d messages=%d lag=%.3fs max_lag=%.3fs",
+                    name,
+                    stats.polls,
+                    stats.errors,
+                    stats.messages,
+                    stats.last_lag,
+                    stats.max_lag,
+                )
+
+
+def _default_poller(config: MailboxConfig, metrics: Metrics) -> GmailPoller:
+    # Pollers run concurrently on the worker pool, and mailboxes with the
+    # same token share one service, so it must be safe to share.
+    from .gmail_transport import PooledHttp
+
+    store = None
+    if config.state_path:
+        # Scheduled pollers mark messages read, so old IDs are safe to forget.
+        store = MessageStore(config.state_path, retention=DEFAULT_RETENTION)
+    return GmailPoller(
+        token_path=config.token_path,
+        incremental=True,
+        store=store,
+        transport=PooledHttp,
+        metrics=metrics,
+    )
@@ -0,0 +1,94 @@
+"""HTTP transports for the Gmail API client."""
+
+from __future__ import annotations
+
+from typing import Any, Dict, Optional, Tuple
+
+import httplib2
+import urllib3
+
+# Connections kept open per host. Requests beyond this wait for a free one.
+DEFAULT_POOL_SIZE = 10
+
+
+class PooledHttp:
+    """Thread-safe ``httplib2.Http`` replacement backed by a urllib3 pool.
+
+    ``httplib2.Http`` holds one connection per host and must not be shared
+    between threads. This transport keeps up to *maxsize* keep-alive
+    connections per host and hands them out to concurrent callers, so threads
+    can share one Gmail service without paying a TLS handshake per request.
+    Only the parts of the ``httplib2.Http`` interface used by
+    ``googleapiclient`` and ``google_auth_httplib2`` are provided.
+    """
+
+    # Lets :func:`~local_py.gmail_poller.get_service` share services using it.
+    thread_safe = True
+
+    def __init__(
+        self,
+        timeout: Optional[float] = 10.0,
+        *,
+        maxsize: int = DEFAULT_POOL_SIZE,
+    ) -> None:
+        """Create a new :class:`PooledHttp`.
+
+        Args:
+            timeout: Connect and read timeout in seconds applied to every
+                request. ``None`` waits forever.
+            maxsize: Maximum open connections per host.
+        """
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+        self.timeout = timeout
+        self.maxsize = maxsize
+        self.follow_redirects = True
+        self.redirect_codes = httplib2.REDIRECT_CODES
+        self._pool = urllib3.PoolManager(maxsize=maxsize, block=True)
+
+    def request(
+        self,
+        uri: str,
+        method: str = "GET",
+        body: Any = None,
+        headers: Optional[Dict[str, str]] = None,
+        redirections: int = httplib2.DEFAULT_MAX_REDIRECTS,
+        connection_type: Any = None,
+        timeout: Optional[float] = None,
+    ) -> Tuple[httplib2.Response, bytes]:
+        """Send a request and return the response and its body like httplib2.
+
+        *timeout* overrides :attr:`timeout` for this request only.
+        *connection_type* is accepted for compatibility and ignored.
+        """
+        seconds = self.timeout if timeout is None else timeout
+        retries = urllib3.Retry(
+            total=None,
+            connect=0,
+            read=0,
+            status=0,
+            other=0,
+            redirect=redirections if self.follow_redirects else 0,
+            raise_on_redirect=False,
+        )
+        try:
+            response = self._pool.request(
+                method,
+                uri,
+                body=body,
+                headers=headers,
+                timeout=urllib3.Timeout(connect=seconds, read=seconds),
+                retries=retries,
+            )
+        except urllib3.exceptions.HTTPError as exc:
+            reason = getattr(exc, "reason", exc)
+            if isinstance(reason, urllib3.exceptions.TimeoutError):
+                raise TimeoutError(str(reason)) from exc
+            raise ConnectionError(str(reason)) from exc
+        info = {name.lower(): value for name, value in response.headers.items()}
+        info["status"] = str(response.status)
+        return httplib2.Response(info), response.data
+
+    def close(self) -> None:
+        """Close every pooled connection."""
+        self._pool.clear()
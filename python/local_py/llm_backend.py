@@ -0,0 +1,117 @@
+"""Chat model backends: model, endpoint and HTTP client settings."""
+
+from __future__ import annotations
+
+import json
+import os
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, Optional
+
+if TYPE_CHECKING:
+    from openai import OpenAI
+
+DEFAULT_MODEL = "gpt-4o-mini"
+# Connections kept open to the model endpoint.
+DEFAULT_MAX_CONNECTIONS = 10
+# Local servers accept any key, but the OpenAI client insists on one.
+_LOCAL_API_KEY = "sk-local"
+
+
+@dataclass(frozen=True)
+class BackendProfile:
+    """Where chat completions are sent and how.
+
+    Attributes:
+        model: Model name passed with every request.
+        base_url: OpenAI-compatible endpoint. ``None`` uses
+            ``OPENAI_API_BASE`` if set, otherwise the OpenAI API.
+        api_key_env: Environment variable holding the API key.
+        timeout: Seconds to wait for a response, or between streamed chunks.
+        connect_timeout: Seconds to wait for a connection.
+        max_tokens: Upper bound on tokens generated per request.
+        max_connections: Pooled connections to the endpoint.
+        keepalive: Seconds an idle connection stays open for reuse. ``0``
+            opens a new connection for every request.
+        max_retries: Retries of failed requests by the OpenAI client.
+    """
+
+    model: str = DEFAULT_MODEL
+    base_url: Optional[str] = None
+    api_key_env: str = "OPENAI_API_KEY"
+    timeout: float = 60.0
+    connect_timeout: float = 5.0
+    max_tokens: Optional[int] = None
+    max_connections: int = DEFAULT_MAX_CONNECTIONS
+    keepalive: float = 30.0
+    max_retries: int = 2
+
+    def __post_init__(self) -> None:
+        if self.timeout <= 0 or self.connect_timeout <= 0:
+            raise ValueError("timeouts must be positive")
+        if self.max_tokens is not None and self.max_tokens < 1:
+            raise ValueError("max_tokens must be positive")
+        if self.max_connections < 1:
+            raise ValueError("max_connections must be at least 1")
+        if self.keepalive < 0 or self.max_retries < 0:
+            raise ValueError("keepalive and max_retries must not be negative")
+
+    def create_client(self) -> OpenAI:
+        """Return an OpenAI client with its own pooled HTTP client."""
+        # openai takes longer to import than the rest of the chat agent.
+        import httpx
+        from openai import OpenAI
+
+        base_url = self.base_url or os.environ.get("OPENAI_API_BASE")
+        api_key = os.environ.get(self.api_key_env)
+        if api_key is None and base_url is not None:
+            api_key = _LOCAL_API_KEY
+        http_client = httpx.Client(
+            timeout=httpx.Timeout(self.timeout, connect=self.connect_timeout),
+            limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_connections if self.keepalive else 0,
+                keepalive_expiry=self.keepalive,
+            ),
+        )
+        return OpenAI(
+            api_key=api_key,
+            base_url=base_url,
+            max_retries=self.max_retries,
+            http_client=http_client,
+        )
+
+    def request_params(self) -> Dict[str, Any]:
+        """Return ``chat.completions.create`` parameters for this backend."""
+        params: Dict[str, Any] = {"model": self.model}
+        if self.max_tokens is not None:
+            params["max_tokens"] = self.max_tokens
+        return params
+
+
+# Built-in profiles selectable by name.
+BACKENDS: Dict[str, BackendProfile] = {
+    "openai": BackendProfile(),
+    # LM Studio, llama.cpp and Ollama serve the OpenAI API locally. Local
+    # models are slower to start answering, but connecting is cheap.
+    "local": BackendProfile(
+        model="local-model",
+        base_url="http://localhost:1234/v1",
+        timeout=300.0,
+        connect_timeout=2.0,
+        max_retries=0,
+    ),
+}
+
+
+def load_backends(path: Path | str) -> Dict[str, BackendProfile]:
+    """Load named profiles from a JSON object of :class:`BackendProfile` fields.
+
+    The result also contains the built-in :data:`BACKENDS`; profiles in the
+    file replace built-in ones of the same name.
+    """
+    entries: Dict[str, Dict[str, Any]] = json.loads(Path(path).read_text())
+    backends = dict(BACKENDS)
+    for name, entry in entries.items():
+        backends[name] = BackendProfile(**entry)
+    return backends
@@ -0,0 +1,254 @@
+"""Local full-text index of fetched Gmail messages."""
+
+from __future__ import annotations
+
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+from .gmail_poller import Email
+from .sk_compat import kernel_function
+
+# Matches returned by :meth:`MailIndex.search` unless asked for more.
+DEFAULT_SEARCH_LIMIT = 20
+# Upper bound on matches returned at once, to keep tool results small.
+MAX_SEARCH_LIMIT = 100
+# Senders listed in the summary of a search.
+TOP_SENDERS = 5
+
+_SCHEMA = (
+    (
+        "CREATE TABLE IF NOT EXISTS messages ("
+        "id TEXT PRIMARY KEY, thread_id TEXT, sender TEXT, subject TEXT, "
+        "date REAL NOT NULL, snippet TEXT NOT NULL, body TEXT)"
+    ),
+    "CREATE INDEX IF NOT EXISTS messages_sender ON messages (sender, date)",
+    "CREATE INDEX IF NOT EXISTS messages_date ON messages (date)",
+    "CREATE INDEX IF NOT EXISTS messages_thread ON messages (thread_id)",
+    (
+        "CREATE TABLE IF NOT EXISTS labels ("
+        "label TEXT NOT NULL, id TEXT NOT NULL, PRIMARY KEY (label, id)) WITHOUT ROWID"
+    ),
+    "CREATE INDEX IF NOT EXISTS labels_id ON labels (id)",
+    (
+        "CREATE VIRTUAL TABLE IF NOT EXISTS message_text USING fts5("
+        "id UNINDEXED, sender, subject, snippet, body)"
+    ),
+)
+
+
+class MailIndex:
+    """SQLite index of messages for searches that never touch the Gmail API.
+
+    Messages are indexed by sender, date, label and thread, and their sender,
+    subject, snippet and body are searchable with FTS5. Reads never change
+    the state of the mailbox. The index is safe to share between threads, and
+    other processes may read it while a poller writes to it.
+    """
+
+    def __init__(self, path: Path | str = ":memory:") -> None:
+        """Open or create the index at *path*.
+
+        Args:
+            path: SQLite database file, or ``":memory:"`` for a throwaway index.
+        """
+        self.path = str(path)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            for statement in _SCHEMA:
+                self._conn.execute(statement)
+
+    def close(self) -> None:
+        """Close the underlying database connection."""
+        with self._lock:
+            self._conn.close()
+
+    def add(self, emails: Iterable[Email]) -> None:
+        """Insert or update *emails*.
+
+        Fields that a message was fetched without, such as the body, keep the
+        value indexed earlier.
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            for email in emails:
+                self._conn.execute(
+                    "INSERT INTO messages VALUES (:id, :thread_id, :sender, "
+                    ":subject, coalesce(:date, :now), :snippet, :body) "
+                    "ON CONFLICT (id) DO UPDATE SET "
+                    "thread_id = coalesce(excluded.thread_id, thread_id), "
+                    "sender = coalesce(excluded.sender, sender), "
+                    "subject = coalesce(excluded.subject, subject), "
+                    "date = coalesce(:date, date), "
+                    "snippet = excluded.snippet, "
+                    "body = coalesce(excluded.body, body)",
+                    {**_row(email), "now": now},
+                )
+                if email.label_ids is not None:
+                    self._conn.execute("DELETE FROM labels WHERE id = ?", (email.id,))
+                    self._conn.executemany(
+                        "INSERT INTO labels VALUES (?, ?)",
+                        [(label, email.id) for label in email.label_ids],
+                    )
+                self._conn.execute("DELETE FROM message_text WHERE id = ?", (email.id,))
+                self._conn.execute(
+                    "INSERT INTO message_text "
+                    "SELECT id, sender, subject, snippet, body FROM messages "
+                    "WHERE id = ?",
+                    (email.id,),
+                )
+
+    def data_version(self) -> int:
+        """Return a number that changes whenever another connection writes.
+
+        Commits made through this index leave it unchanged, so a reader can
+        tell when a poller in another process has indexed new mail.
+        """
+        with self._lock:
+            return self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def remove_label(self, ids: List[str], label: str) -> None:
+        """Drop *label* from the indexed messages *ids*."""
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "DELETE FROM labels WHERE label = ? AND id = ?",
+                [(label, message_id) for message_id in ids],
+            )
+
+    @kernel_function(
+        description=(
+            "Search locally indexed emails by text, sender, label, thread or "
+            "date. Returns the number of matches, the top senders and the most "
+            "recent matches. Does not contact Gmail or change read state."
+        )
+    )
+    def search(
+        self,
+        query: Optional[str] = None,
+        sender: Optional[str] = None,
+        label: Optional[str] = None,
+        thread_id: Optional[str] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        limit: int = DEFAULT_SEARCH_LIMIT,
+    ) -> Dict[str, Any]:
+        """Return a summary and the newest messages matching every filter.
+
+        Args:
+            query: Words that must all appear in the sender, subject, snippet
+                or body.
+            sender: Substring of the ``From`` header.
+            label: Gmail label ID such as ``UNREAD`` or ``INBOX``.
+            thread_id: Only messages of this thread.
+            since: ISO date or time; only messages sent at or after it.
+            until: ISO date or time; only messages sent before it.
+            limit: Maximum number of messages returned, up to
+                :data:`MAX_SEARCH_LIMIT`.
+
+        Returns:
+            ``count`` of all matches, ``top_senders`` with their message
+            counts, and ``messages``, newest first.
+        """
+        clauses: List[str] = []
+        params: List[Any] = []
+        if query:
+            clauses.append(
+                "m.id IN (SELECT id FROM message_text WHERE message_text MATCH ?)"
+            )
+            params.append(_fts_query(query))
+        if sender:
+            clauses.append("m.sender LIKE ? ESCAPE '\\'")
+            params.append(f"%{_escape_like(sender)}%")
+        if label:
+            clauses.append("m.id IN (SELECT id FROM labels WHERE label = ?)")
+            params.append(label)
+        if thread_id:
+            clauses.append("m.thread_id = ?")
+            params.append(thread_id)
+        if since:
+            clauses.append("m.date >= ?")
+            params.append(_timestamp(since))
+        if until:
+            clauses.append("m.date < ?")
+            params.append(_timestamp(until))
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        limit = max(1, min(limit, MAX_SEARCH_LIMIT))
+        with self._lock:
+            count = self._conn.execute(
+                f"SELECT count(*) FROM messages m {where}", params
+            ).fetchone()[0]
+            senders = self._conn.execute(
+                f"SELECT m.sender, count(*) AS n FROM messages m {where} "
+                "GROUP BY m.sender ORDER BY n DESC, m.sender LIMIT ?",
+                [*params, TOP_SENDERS],
+            ).fetchall()
+            rows = self._conn.execute(
+                "SELECT m.*, (SELECT group_concat(label, ' ') FROM labels l "
+                f"WHERE l.id = m.id) AS labels FROM messages m {where} "
+                "ORDER BY m.date DESC LIMIT ?",
+                [*params, limit],
+            ).fetchall()
+        return {
+            "count": count,
+            "top_senders": [
+                {"sender": row["sender"], "count": row["n"]} for row in senders
+            ],
+            "messages": [_message(row) for row in rows],
+        }
+
+
+def _row(email: Email) -> Dict[str, Any]:
+    """Return the ``messages`` columns of *email*; unknown ones are ``None``."""
+    headers = {name.lower(): value for name, value in (email.headers or {}).items()}
+    date: Optional[float] = None
+    if "date" in headers:
+        try:
+            date = parsedate_to_datetime(headers["date"]).timestamp()
+        except (TypeError, ValueError):
+            pass
+    return {
+        "id": email.id,
+        "thread_id": email.thread_id,
+        "sender": headers.get("from"),
+        "subject": headers.get("subject"),
+        "date": date,
+        "snippet": email.snippet,
+        "body": email.body,
+    }
+
+
+def _message(row: sqlite3.Row) -> Dict[str, Any]:
+    message = {
+        "id": row["id"],
+        "thread_id": row["thread_id"],
+        "from": row["sender"],
+        "subject": row["subject"],
+        "date": datetime.fromtimestamp(row["date"], timezone.utc).isoformat(),
+        "snippet": row["snippet"],
+        "labels": row["labels"].split() if row["labels"] else [],
+    }
+    return {key: value for key, value in message.items() if value is not None}
+
+
+def _fts_query(text: str) -> str:
+    """Quote every word so user input cannot break the FTS5 query syntax."""
+    return " ".join('"' + word.replace('"', '""') + '"' for word in text.split())
+
+
+def _escape_like(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _timestamp(value: str) -> float:
+    moment = datetime.fromisoformat(value)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.timestamp()
@@ -0,0 +1,143 @@
+"""Persistent record of processed Gmail messages and sync cursors."""
+
+from __future__ import annotations
+
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Iterable, List, Optional
+
+# Suggested retention for processed IDs when messages are also marked read.
+# Incremental syncs only revisit recent messages, so old entries just take up
+# space; a full listing only finds messages that are still unread.
+DEFAULT_RETENTION = 30 * 24 * 60 * 60
+# SQLite limits the number of bound parameters per statement.
+_QUERY_CHUNK = 500
+
+
+class MessageStore:
+    """SQLite store of processed message IDs and named sync cursors.
+
+    The store lets a poller skip messages it has already handled without
+    relying on the Gmail ``UNREAD`` label, and lets it resume an incremental
+    sync after a restart, including messages it listed but had not yet
+    processed. It is safe to share between threads.
+    """
+
+    def __init__(
+        self,
+        path: Path | str = ":memory:",
+        *,
+        retention: Optional[float] = None,
+    ) -> None:
+        """Open or create the store at *path*.
+
+        Args:
+            path: SQLite database file, or ``":memory:"`` for a throwaway store.
+            retention: Seconds to remember processed IDs. Older entries are
+                compacted away on open. ``None`` keeps them forever. Only
+                set it when handled messages are also marked read: a full
+                listing returns every unread message, and one whose ID was
+                pruned is handled again.
+        """
+        self.path = str(path)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS seen ("
+                "id TEXT PRIMARY KEY, seen_at REAL NOT NULL) WITHOUT ROWID"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS cursors ("
+                "name TEXT PRIMARY KEY, value TEXT NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS pending (id TEXT PRIMARY KEY)"
+            )
+        if retention is not None:
+            self.prune(retention)
+
+    def close(self) -> None:
+        """Close the underlying database connection."""
+        with self._lock:
+            self._conn.close()
+
+    def filter_unseen(self, ids: Iterable[str]) -> List[str]:
+        """Return the IDs in *ids* that have not been recorded, in order."""
+        candidates = list(ids)
+        seen: set[str] = set()
+        with self._lock:
+            for start in range(0, len(candidates), _QUERY_CHUNK):
+                chunk = candidates[start : start + _QUERY_CHUNK]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT id FROM seen WHERE id IN ({placeholders})", chunk
+                )
+                seen.update(row[0] for row in rows)
+        return [message_id for message_id in candidates if message_id not in seen]
+
+    def mark_seen(self, ids: Iterable[str]) -> None:
+        """Record *ids* as processed in a single transaction."""
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO seen (id, seen_at) VALUES (?, ?)",
+                ((message_id, now) for message_id in ids),
+            )
+
+    def add_pending(self, ids: Iterable[str]) -> None:
+        """Record *ids* as listed but not yet processed."""
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO pending (id) VALUES (?)",
+                ((message_id,) for message_id in ids),
+            )
+
+    def remove_pending(self, ids: Iterable[str]) -> None:
+        """Forget *ids* recorded by :meth:`add_pending`."""
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "DELETE FROM pending WHERE id = ?",
+                ((message_id,) for message_id in ids),
+            )
+
+    def pending_ids(self) -> List[str]:
+        """Return the IDs recorded by :meth:`add_pending`, oldest first."""
+        with self._lock:
+            rows = self._conn.execute("SELECT id FROM pending ORDER BY rowid")
+            return [row[0] for row in rows]
+
+    def get_cursor(self, name: str) -> Optional[str]:
+        """Return the cursor stored under *name*, if any."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM cursors WHERE name = ?", (name,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def set_cursor(self, name: str, value: Optional[str]) -> None:
+        """Store *value* under *name*, or delete the cursor if it is ``None``."""
+        with self._lock, self._conn:
+            if value is None:
+                self._conn.execute("DELETE FROM cursors WHERE name = ?", (name,))
+            else:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO cursors (name, value) VALUES (?, ?)",
+                    (name, value),
+                )
+
+    def prune(self, max_age: float) -> int:
+        """Forget IDs recorded more than *max_age* seconds ago.
+
+        Returns:
+            The number of IDs removed.
+        """
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "DELETE FROM seen WHERE seen_at < ?", (time.time() - max_age,)
+            )
+        return cursor.rowcount
@@ -0,0 +1,280 @@
+"""Lightweight counters, gauges and histograms for the pollers and agents."""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, ContextManager, Dict, List, Optional, Self, Tuple
+
+# Upper bounds of histogram buckets for metrics named ``*_seconds``.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Upper bounds of histogram buckets for every other metric, e.g. counts.
+COUNT_BUCKETS = (0, 1, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class _Histogram:
+    __slots__ = ("bounds", "count", "counts", "sum")
+
+    def __init__(self, bounds: Tuple[float, ...]) -> None:
+        self.bounds = bounds
+        # One slot per bound plus one for values above the last.
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        """Return ``(le, count)`` pairs as Prometheus expects them."""
+        total = 0
+        buckets = []
+        for bound, count in zip((*self.bounds, "+Inf"), self.counts):
+            total += count
+            buckets.append((str(bound), total))
+        return buckets
+
+
+class _Timer:
+    """Observe the seconds spent in a ``with`` block, optionally as a span."""
+
+    __slots__ = ("labels", "metrics", "name", "span", "start")
+
+    def __init__(self, metrics: Metrics, name: str, labels: Dict[str, str]) -> None:
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+        self.span: Optional[ContextManager[Any]] = None
+        self.start = 0.0
+
+    def __enter__(self) -> Self:
+        if self.metrics.tracer is not None:
+            self.span = self.metrics.tracer.start_as_current_span(
+                self.name, attributes=self.labels
+            )
+            self.span.__enter__()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.metrics.observe(self.name, time.perf_counter() - self.start, **self.labels)
+        if self.span is not None:
+            self.span.__exit__(*exc_info)  # type: ignore[arg-type]
+
+
+class Metrics:
+    """Thread-safe registry of counters, gauges and histograms.
+
+    Every method returns immediately on a disabled registry, and
+    :meth:`timer` hands out a shared no-op context manager, so instrumented
+    code costs next to nothing unless metrics were asked for. Histograms use
+    :data:`LATENCY_BUCKETS` for names ending in ``_seconds`` and
+    :data:`COUNT_BUCKETS` otherwise.
+    """
+
+    def __init__(self, enabled: bool = True, *, tracing: bool = False) -> None:
+        """Create a new :class:`Metrics` registry.
+
+        Args:
+            enabled: Record anything at all.
+            tracing: Also open an OpenTelemetry span for every :meth:`timer`.
+                Spans go wherever the OpenTelemetry SDK is configured to send
+                them; without an SDK they are discarded.
+        """
+        self.enabled = enabled
+        self.tracer: Any = None
+        if enabled and tracing:
+            from opentelemetry import trace
+
+            self.tracer = trace.get_tracer("local_py")
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[Labels, float]] = {}
+        self._gauges: Dict[str, Dict[Labels, float]] = {}
+        self._histograms: Dict[str, Dict[Labels, _Histogram]] = {}
+
+    def inc(self, name: str, amount: float = 1, **labels: str) -> None:
+        """Add *amount* to counter *name*."""
+        if not self.enabled:
+            return
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def set(self, name: str, value: float, **labels: str) -> None:
+        """Set gauge *name* to *value*."""
+        if not self.enabled:
+            return
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._gauges.setdefault(name, {})[key] = value
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        """Record *value* in histogram *name*."""
+        if not self.enabled:
+            return
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                bounds = LATENCY_BUCKETS if name.endswith("_seconds") else COUNT_BUCKETS
+                histogram = series[key] = _Histogram(bounds)
+            histogram.observe(value)
+
+    def timer(self, name: str, **labels: str) -> ContextManager[Any]:
+        """Return a context manager observing its duration in histogram *name*."""
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, name, labels)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Return every series keyed by name and labels, ready for JSON.
+
+        Histograms are reported with their ``count``, ``sum`` and cumulative
+        ``buckets``.
+        """
+        with self._lock:
+            return {
+                "counters": _flatten(self._counters, lambda value: value),
+                "gauges": _flatten(self._gauges, lambda value: value),
+                "histograms": _flatten(
+                    self._histograms,
+                    lambda h: {
+                        "count": h.count,
+                        "sum": h.sum,
+                        "buckets": dict(h.cumulative()),
+                    },
+                ),
+            }
+
+    def render_prometheus(self) -> str:
+        """Return every series in the Prometheus text exposition format."""
+        lines: List[str] = []
+        with self._lock:
+            for kind, families in (
+                ("counter", self._counters),
+                ("gauge", self._gauges),
+            ):
+                for name, series in sorted(families.items()):
+                    lines.append(f"# TYPE {name} {kind}")
+                    for key, value in series.items():
+                        lines.append(f"{name}{_format_labels(key)} {value}")
+            for name, histograms in sorted(self._histograms.items()):
+                lines.append(f"# TYPE {name} histogram")
+                for key, histogram in histograms.items():
+                    for bound, count in histogram.cumulative():
+                        labels = _format_labels((*key, ("le", bound)))
+                        lines.append(f"{name}_bucket{labels} {count}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {histogram.sum}")
+                    lines.append(f"{name}_count{_format_labels(key)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def log_json(self, level: int = logging.INFO) -> None:
+        """Log :meth:`snapshot` as a single JSON line."""
+        if self.enabled:
+            logging.log(level, "metrics %s", json.dumps(self.snapshot()))
+
+
+_NULL_TIMER: ContextManager[Any] = nullcontext()
+
+# Shared disabled registry used when no :class:`Metrics` is passed in.
+NULL_METRICS = Metrics(enabled=False)
+
+
+def _flatten(families: Dict[str, Dict[Labels, Any]], render: Any) -> Dict[str, Any]:
+    return {
+        f"{name}{_format_labels(key)}": render(value)
+        for name, series in sorted(families.items())
+        for key, value in series.items()
+    }
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    pairs = ",".join(
+        '{}="{}"'.format(
+            name,
+            value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"),
+        )
+        for name, value in labels
+    )
+    return "{" + pairs + "}"
+
+
+class MetricsServer:
+    """Serve a registry at ``/metrics`` (Prometheus text) and ``/metrics.json``."""
+
+    def __init__(
+        self, metrics: Metrics, host: str = "127.0.0.1", port: int = 9100
+    ) -> None:
+        """Create a new :class:`MetricsServer`; call :meth:`start` to listen.
+
+        Args:
+            metrics: Registry to expose.
+            host: Interface to listen on.
+            port: TCP port; ``0`` picks a free one, see :attr:`port`.
+        """
+        self.metrics = metrics
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def port(self) -> int:
+        """Port the server listens on."""
+        return self._server.server_port
+
+    def start(self) -> None:
+        """Serve requests on a daemon thread."""
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="metrics", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop serving and close the socket."""
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _handler(self) -> type[BaseHTTPRequestHandler]:
+        metrics = self.metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                if self.path == "/metrics":
+                    body = metrics.render_prometheus().encode()
+                    content_type = "text/plain; version=0.0.4"
+                elif self.path == "/metrics.json":
+                    body = json.dumps(metrics.snapshot()).encode()
+                    content_type = "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format: str, *args: object) -> None:
+                pass
+
+        return Handler
+
+
+async def log_periodically(metrics: Metrics, interval: float) -> None:
+    """Log a JSON :meth:`Metrics.snapshot` every *interval* seconds until cancelled."""
+    while True:
+        await asyncio.sleep(interval)
+        metrics.log_json()
@@ -2,20 +2,166 @@ import argparse
 import asyncio
 import logging
 import os
+from pathlib import Path
+from typing import List, Optional
 
-from .gmail_poller import GmailPoller
+from .async_gmail_poller import DEFAULT_MAX_CONCURRENCY, AsyncGmailPoller
+from .email_pipeline import (
+    DEFAULT_QUEUE_SIZE,
+    DEFAULT_WORKERS,
+    EmailPipeline,
+    load_handler,
+)
+from .gmail_poller import MESSAGE_FORMATS, FetchProfile, GmailPoller
 from .gmail_polling_agent import GmailPollingAgent
+from .gmail_scheduler import DEFAULT_MAX_WORKERS, GmailScheduler, load_mailbox_configs
+from .mail_index import MailIndex
+from .message_store import DEFAULT_RETENTION, MessageStore
+from .metrics import Metrics, MetricsServer, log_periodically
+from .polling_policy import AdaptivePollingPolicy, PollingPolicy
 
 
-async def main(interval: int) -> None:
+async def main(
+    interval: int,
+    *,
+    use_async: bool = False,
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+    mailboxes: Optional[Path] = None,
+    workers: int = DEFAULT_MAX_WORKERS,
+    report_interval: float = 60.0,
+    adaptive: bool = False,
+    min_interval: float = 5.0,
+    max_interval: float = 900.0,
+    push_topic: Optional[str] = None,
+    push_host: str = "127.0.0.1",
+    push_port: int = 8080,
+    state_db: Optional[Path] = None,
+    mark_read: bool = True,
+    pooled_http: bool = False,
+    message_format: str = "metadata",
+    handlers: Optional[List[str]] = None,
+    handler_workers: int = DEFAULT_WORKERS,
+    queue_size: int = DEFAULT_QUEUE_SIZE,
+    mail_index: Optional[Path] = None,
+    metrics_port: Optional[int] = None,
+    metrics_log_interval: Optional[float] = None,
+    trace: bool = False,
+) -> None:
     """Poll Gmail for new messages and log them."""
     logging.basicConfig(level=logging.INFO)
 
-    poller = GmailPoller()
+    metrics: Optional[Metrics] = None
+    if metrics_port is not None or metrics_log_interval is not None or trace:
+        metrics = Metrics(tracing=trace)
+    if metrics is not None and metrics_port is not None:
+        MetricsServer(metrics, port=metrics_port).start()
+    if metrics is not None and metrics_log_interval is not None:
+        # asyncio.run cancels the task on exit; keep a reference until then.
+        reporter = asyncio.create_task(  # noqa: F841
+            log_periodically(metrics, metrics_log_interval)
+        )
+
+    if mailboxes is not None:
+        scheduler = GmailScheduler(
+            load_mailbox_configs(mailboxes),
+            max_workers=workers,
+            report_interval=report_interval,
+            metrics=metrics,
+        )
+        await scheduler.run()
+        return
+
+    sender = os.environ.get("GMAIL_SENDER")
+    store = None
+    if state_db is not None:
+        # Unread messages reappear in full listings, so without marking them
+        # read every processed ID must be kept.
+        retention = DEFAULT_RETENTION if mark_read else None
+        store = MessageStore(state_db, retention=retention)
+    index = MailIndex(mail_index) if mail_index is not None else None
+    transport = None
+    # Handlers acknowledge messages from executor threads while the poller
+    # fetches the next ones, so the service must be safe to share.
+    if pooled_http or handlers:
+        # Modules only some modes need are imported by those modes, which
+        # keeps startup and --help fast.
+        from .gmail_transport import PooledHttp
+
+        transport = PooledHttp
+    profile = FetchProfile(message_format)
+    pipeline: Optional[EmailPipeline] = None
+    if handlers:
+        pipeline = EmailPipeline(
+            [load_handler(spec) for spec in handlers],
+            workers=handler_workers,
+            queue_size=queue_size,
+        )
+    policy: Optional[PollingPolicy] = None
+    if adaptive:
+        policy = AdaptivePollingPolicy(
+            interval, min_interval=min_interval, max_interval=max_interval
+        )
+    if use_async:
+        async with AsyncGmailPoller(
+            max_concurrency=max_concurrency, profile=profile, metrics=metrics
+        ) as poller:
+            await GmailPollingAgent(
+                poller,
+                sender=sender,
+                interval=interval,
+                policy=policy,
+                pipeline=pipeline,
+                metrics=metrics,
+            ).run()
+        return
+
+    if push_topic is not None:
+        from .gmail_push import GmailPushAgent, PushNotificationReceiver
+
+        # Push mode relies on cheap history lookups for every notification;
+        # the timer poll at --interval is only a safety net.
+        agent = GmailPollingAgent(
+            GmailPoller(
+                incremental=True,
+                store=store,
+                mark_read=mark_read,
+                transport=transport,
+                profile=profile,
+                index=index,
+                metrics=metrics,
+            ),
+            sender=sender,
+            interval=interval,
+            policy=policy,
+            pipeline=pipeline,
+            metrics=metrics,
+        )
+        receiver = PushNotificationReceiver(
+            host=push_host,
+            port=push_port,
+            token=os.environ.get("GMAIL_PUSH_TOKEN"),
+        )
+        await GmailPushAgent(
+            agent, receiver, topic_name=push_topic, safety_interval=interval
+        ).run()
+        return
+
+    # With a state database the poller can resume from the saved historyId.
     agent = GmailPollingAgent(
-        poller,
-        sender=os.environ.get("GMAIL_SENDER"),
+        GmailPoller(
+            incremental=store is not None,
+            store=store,
+            mark_read=mark_read,
+            transport=transport,
+            profile=profile,
+            index=index,
+            metrics=metrics,
+        ),
+        sender=sender,
         interval=interval,
+        policy=policy,
+        pipeline=pipeline,
+        metrics=metrics,
     )
     await agent.run()
 
@@ -23,5 +169,211 @@ async def main(interval: int) -> None:
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Poll Gmail for new messages")
     parser.add_argument("--interval", type=int, default=60, help="Polling interval in seconds")
+    parser.add_argument(
+        "--async-client",
+        action="store_true",
+        help="Use the non-blocking aiohttp Gmail client",
+    )
+    parser.add_argument(
+        "--max-concurrency",
+        type=int,
+        default=DEFAULT_MAX_CONCURRENCY,
+        help="Maximum concurrent Gmail requests with --async-client",
+    )
+    parser.add_argument(
+        "--mailboxes",
+        type=Path,
+        help="JSON file listing mailboxes to poll from a single process",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=DEFAULT_MAX_WORKERS,
+        help="Worker pool size shared by all mailboxes with --mailboxes",
+    )
+    parser.add_argument(
+        "--report-interval",
+        type=float,
+        default=60.0,
+        help="Seconds between per-mailbox lag reports with --mailboxes",
+    )
+    parser.add_argument(
+        "--adaptive",
+        action="store_true",
+        help="Poll faster while mail arrives and back off when idle or failing",
+    )
+    parser.add_argument(
+        "--min-interval",
+        type=float,
+        default=5.0,
+        help="Shortest delay in seconds with --adaptive",
+    )
+    parser.add_argument(
+        "--max-interval",
+        type=float,
+        default=900.0,
+        help="Longest backoff delay in seconds with --adaptive",
+    )
+    parser.add_argument(
+        "--push-topic",
+        help="Pub/Sub topic for Gmail push notifications (projects/<id>/topics/<name>)",
+    )
+    parser.add_argument(
+        "--push-host",
+        default="127.0.0.1",
+        help="Interface for the push notification receiver",
+    )
+    parser.add_argument(
+        "--push-port",
+        type=int,
+        default=8080,
+        help="Port for the push notification receiver",
+    )
+    parser.add_argument(
+        "--state-db",
+        type=Path,
+        help="SQLite file remembering processed messages across restarts",
+    )
+    parser.add_argument(
+        "--no-mark-read",
+        dest="mark_read",
+        action="store_false",
+        help="Leave messages unread; requires --state-db to avoid reprocessing",
+    )
+    parser.add_argument(
+        "--pooled-http",
+        action="store_true",
+        help="Send Gmail requests over a thread-safe pool of keep-alive connections",
+    )
+    parser.add_argument(
+        "--format",
+        dest="message_format",
+        choices=MESSAGE_FORMATS,
+        default="metadata",
+        help="How much of each message to download",
+    )
+    parser.add_argument(
+        "--handler",
+        dest="handlers",
+        action="append",
+        help=(
+            "Handler plugin for each message, by registered name or "
+            "module:Class (repeatable); enables the concurrent pipeline"
+        ),
+    )
+    parser.add_argument(
+        "--handler-workers",
+        type=int,
+        default=DEFAULT_WORKERS,
+        help="Messages handled concurrently with --handler",
+    )
+    parser.add_argument(
+        "--queue-size",
+        type=int,
+        default=DEFAULT_QUEUE_SIZE,
+        help="Fetched messages buffered ahead of the handlers",
+    )
+    parser.add_argument(
+        "--mail-index",
+        type=Path,
+        help="SQLite file indexing every fetched message for local search",
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        help="Serve Prometheus metrics on this port at /metrics",
+    )
+    parser.add_argument(
+        "--metrics-log-interval",
+        type=float,
+        help="Log all metrics as one JSON line this often, in seconds",
+    )
+    parser.add_argument(
+        "--trace",
+        action="store_true",
+        help="Record OpenTelemetry spans for every Gmail call and poll",
+    )
     args = parser.parse_args()
-    asyncio.run(main(args.interval))
+    # Parsing again into a namespace that already holds every option keeps
+    # argparse from filling in defaults, leaving only the options given.
+    explicit = parser.parse_args(
+        namespace=argparse.Namespace(**dict.fromkeys(vars(args)))
+    )
+    given = {dest for dest, value in vars(explicit).items() if value is not None}
+    if not args.mark_read and args.state_db is None:
+        parser.error("--no-mark-read requires --state-db")
+    # Options only the blocking single-mailbox poller understands; the other
+    # modes would silently ignore them.
+    poller_options = {
+        "--push-topic": args.push_topic is not None,
+        "--state-db": args.state_db is not None,
+        "--no-mark-read": not args.mark_read,
+        "--pooled-http": args.pooled_http,
+        "--mail-index": args.mail_index is not None,
+    }
+    if args.mailboxes is not None:
+        # Each mailbox in the file configures its own polling and state.
+        unsupported = {
+            **poller_options,
+            "--async-client": args.async_client,
+            "--format": args.message_format != "metadata",
+            "--handler": bool(args.handlers),
+            "--handler-workers": "handler_workers" in given,
+            "--queue-size": "queue_size" in given,
+            "--max-concurrency": "max_concurrency" in given,
+            "--adaptive": args.adaptive,
+            "--min-interval": "min_interval" in given,
+            "--max-interval": "max_interval" in given,
+            "--interval": "interval" in given,
+        }
+        used = [flag for flag, given in unsupported.items() if given]
+        if used:
+            parser.error(f"{', '.join(used)} not supported with --mailboxes")
+    elif args.async_client:
+        used = [flag for flag, given in poller_options.items() if given]
+        if used:
+            parser.error(f"{', '.join(used)} not supported with --async-client")
+    # Options that only take effect together with another one.
+    requirements = {
+        "--workers": ("workers", "--mailboxes", args.mailboxes is not None),
+        "--report-interval": (
+            "report_interval",
+            "--mailboxes",
+            args.mailboxes is not None,
+        ),
+        "--max-concurrency": ("max_concurrency", "--async-client", args.async_client),
+        "--handler-workers": ("handler_workers", "--handler", bool(args.handlers)),
+        "--queue-size": ("queue_size", "--handler", bool(args.handlers)),
+        "--min-interval": ("min_interval", "--adaptive", args.adaptive),
+        "--max-interval": ("max_interval", "--adaptive", args.adaptive),
+    }
+    for flag, (dest, required, present) in requirements.items():
+        if dest in given and not present:
+            parser.error(f"{flag} requires {required}")
+    asyncio.run(
+        main(
+            args.interval,
+            use_async=args.async_client,
+            max_concurrency=args.max_concurrency,
+            mailboxes=args.mailboxes,
+            workers=args.workers,
+            report_interval=args.report_interval,
+            adaptive=args.adaptive,
+            min_interval=args.min_interval,
+            max_interval=args.max_interval,
+            push_topic=args.push_topic,
+            push_host=args.push_host,
+            push_port=args.push_port,
+            state_db=args.state_db,
+            mark_read=args.mark_read,
+            pooled_http=args.pooled_http,
+            message_format=args.message_format,
+            handlers=args.handlers,
+            handler_workers=args.handler_workers,
+            queue_size=args.queue_size,
+            mail_index=args.mail_index,
+            metrics_port=args.metrics_port,
+            metrics_log_interval=args.metrics_log_interval,
+            trace=args.trace,
+        )
+    )
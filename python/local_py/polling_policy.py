@@ -0,0 +1,90 @@
+"""Policies deciding how long a polling agent waits between polls."""
+
+from __future__ import annotations
+
+from abc import ABC, abstractmethod
+from typing import Optional
+
+from .gmail_poller import RATE_LIMIT_STATUSES, http_status, retry_after
+
+
+class PollingPolicy(ABC):
+    """Decide the delay before the next poll from the outcome of the last one."""
+
+    @abstractmethod
+    def next_delay(self, count: int, error: Optional[BaseException] = None) -> float:
+        """Return seconds to wait before polling again.
+
+        Args:
+            count: Number of messages handled by the last poll.
+            error: Exception raised by the last poll, if it failed.
+        """
+
+
+class FixedPollingPolicy(PollingPolicy):
+    """Always wait the same interval."""
+
+    def __init__(self, interval: float) -> None:
+        self.interval = interval
+
+    def next_delay(self, count: int, error: Optional[BaseException] = None) -> float:
+        return self.interval
+
+
+class AdaptivePollingPolicy(PollingPolicy):
+    """Poll quickly while mail is flowing and back off when idle or failing.
+
+    After a poll that returned messages the delay drops to *min_interval*
+    (burst mode), since more mail often follows. Every empty poll multiplies
+    the delay by *backoff*, and each consecutive failure waits *interval*
+    times another factor of *backoff*, both capped at *max_interval*. Failures
+    carrying a ``Retry-After`` hint wait at least that long, even above the
+    cap; rate limit errors without a hint wait *max_interval*.
+    """
+
+    def __init__(
+        self,
+        interval: float = 60.0,
+        *,
+        min_interval: float = 5.0,
+        max_interval: float = 900.0,
+        backoff: float = 2.0,
+    ) -> None:
+        """Create a new :class:`AdaptivePollingPolicy`.
+
+        Args:
+            interval: Starting delay and base of the error backoff.
+            min_interval: Delay used right after messages arrive.
+            max_interval: Upper bound for backoff delays.
+            backoff: Factor applied per empty poll or consecutive failure.
+        """
+        if not 0 < min_interval <= interval <= max_interval:
+            raise ValueError("expected 0 < min_interval <= interval <= max_interval")
+        if backoff < 1:
+            raise ValueError("backoff must be at least 1")
+        self.interval = interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.delay = interval
+        self.failures = 0
+
+    def next_delay(self, count: int, error: Optional[BaseException] = None) -> float:
+        if error is not None:
+            self.failures += 1
+            delay = min(
+                self.max_interval, self.interval * self.backoff**self.failures
+            )
+            hint = retry_after(error)
+            if hint is not None:
+                delay = max(delay, hint)
+            elif http_status(error) in RATE_LIMIT_STATUSES:
+                # Without a hint, skip straight to the cap when rate limited.
+                delay = self.max_interval
+            return delay
+        self.failures = 0
+        if count > 0:
+            self.delay = self.min_interval
+        else:
+            self.delay = min(self.max_interval, self.delay * self.backoff)
+        return self.delay
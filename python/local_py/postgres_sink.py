@@ -0,0 +1,317 @@
+"""Bulk ingest of polled messages into PostgreSQL."""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Mapping, Optional, Sequence
+
+import psycopg
+from psycopg import sql
+from psycopg.conninfo import make_conninfo
+from psycopg.types.json import Jsonb
+
+from .email_pipeline import EmailHandler
+from .gmail_poller import Email
+
+DEFAULT_TABLE = "emails"
+DEFAULT_BATCH_SIZE = 1000
+DEFAULT_FLUSH_INTERVAL = 1.0
+DEFAULT_POOL_SIZE = 4
+# Batches of at least this many rows are loaded with COPY into a staging
+# table; smaller ones with a single multi-row INSERT, which saves the extra
+# round trips of the staging table.
+COPY_THRESHOLD = 50
+
+COLUMNS = (
+    "id",
+    "thread_id",
+    "snippet",
+    "label_ids",
+    "headers",
+    "body",
+    "attachments",
+)
+
+Row = Sequence[Any]
+
+
+def conninfo_from_env(environ: Optional[Mapping[str, str]] = None) -> str:
+    """Return a libpq connection string from ``PG_HOST``, ``PG_PORT`` and friends.
+
+    Reads the variables of ``.env-sample``: ``PG_HOST``, ``PG_PORT``,
+    ``PG_USER``, ``PG_PASS`` and ``DB_NAME``. Unset ones are left to libpq's
+    own defaults.
+    """
+    environ = os.environ if environ is None else environ
+    params = {
+        "host": environ.get("PG_HOST"),
+        "port": environ.get("PG_PORT"),
+        "user": environ.get("PG_USER"),
+        "password": environ.get("PG_PASS"),
+        "dbname": environ.get("DB_NAME"),
+    }
+    return make_conninfo(**{key: value for key, value in params.items() if value})
+
+
+def email_row(email: Email) -> Row:
+    """Return the column values of *email* in :data:`COLUMNS` order."""
+    body = email.body
+    return (
+        email.id,
+        email.thread_id,
+        email.snippet,
+        email.label_ids,
+        Jsonb(email.headers) if email.headers is not None else None,
+        # PostgreSQL text cannot hold NUL characters.
+        body.replace("\x00", "") if body is not None else None,
+        Jsonb([item.to_dict() for item in email.attachments])
+        if email.attachments is not None
+        else None,
+    )
+
+
+class ConnectionPool:
+    """Small pool of autocommit :class:`psycopg.AsyncConnection` objects.
+
+    Connections are opened on demand up to *max_size* and reused afterwards;
+    callers beyond that wait for one to be returned. Connections left broken
+    by an error are closed instead of returned.
+    """
+
+    def __init__(self, conninfo: str, *, max_size: int = DEFAULT_POOL_SIZE) -> None:
+        """Create a new :class:`ConnectionPool`.
+
+        Args:
+            conninfo: libpq connection string, see :func:`conninfo_from_env`.
+            max_size: Maximum open connections.
+        """
+        if max_size < 1:
+            raise ValueError("max_size must be at least 1")
+        self.conninfo = conninfo
+        self.max_size = max_size
+        self._idle: List[psycopg.AsyncConnection[Any]] = []
+        self._slots = asyncio.Semaphore(max_size)
+
+    @asynccontextmanager
+    async def connection(self) -> AsyncIterator[psycopg.AsyncConnection[Any]]:
+        """Borrow a connection for the duration of an ``async with`` block."""
+        async with self._slots:
+            if self._idle:
+                conn = self._idle.pop()
+            else:
+                conn = await psycopg.AsyncConnection.connect(
+                    self.conninfo, autocommit=True
+                )
+            try:
+                yield conn
+            finally:
+                if conn.closed or conn.broken:
+                    await conn.close()
+                else:
+                    self._idle.append(conn)
+
+    async def close(self) -> None:
+        """Close every idle connection."""
+        idle, self._idle = self._idle, []
+        for conn in idle:
+            await conn.close()
+
+
+class PostgresSink(EmailHandler):
+    """Pipeline handler upserting every message into a PostgreSQL table.
+
+    :meth:`handle` only buffers the row. The buffer is written when it
+    holds *batch_size* messages, *flush_interval* seconds after its first
+    message, and whenever the pipeline is about to acknowledge messages, so
+    a message is only marked as read once its row is committed. Writes are
+    upserts keyed on the message ID, so messages fetched again after a
+    failure or restart update their row instead of duplicating it. Fields
+    missing from a later fetch, such as the body of a ``metadata`` fetch,
+    keep their stored value.
+
+    Use it from the command line with
+    ``--handler local_py.postgres_sink:PostgresSink``; the connection is
+    configured by the ``PG_*`` and ``DB_NAME`` variables (see
+    :func:`conninfo_from_env`).
+    """
+
+    def __init__(
+        self,
+        conninfo: Optional[str] = None,
+        *,
+        table: str = DEFAULT_TABLE,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+        pool: Optional[ConnectionPool] = None,
+        pool_size: int = DEFAULT_POOL_SIZE,
+        create_table: bool = True,
+    ) -> None:
+        """Create a new :class:`PostgresSink`.
+
+        Args:
+            conninfo: libpq connection string. Defaults to
+                :func:`conninfo_from_env`.
+            table: Table written to.
+            batch_size: Buffered messages that trigger a write.
+            flush_interval: Seconds a message may wait in the buffer.
+            pool: Connection pool to share with other sinks. Defaults to a
+                new pool of *pool_size* connections.
+            pool_size: Maximum connections of the default pool, and with it
+                the number of batches written concurrently.
+            create_table: Create *table* on the first write if it is missing.
+        """
+        if batch_size < 1:
+            raise ValueError("batch_size must be at least 1")
+        if flush_interval <= 0:
+            raise ValueError("flush_interval must be positive")
+        self.table = table
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.pool = pool or ConnectionPool(
+            conninfo if conninfo is not None else conninfo_from_env(),
+            max_size=pool_size,
+        )
+        self.create_table = create_table
+        # Rows waiting for a write, keyed by message ID so that a message
+        # handled twice before a flush is written once.
+        self._buffer: Dict[str, Row] = {}
+        self._writes: set[asyncio.Task[None]] = set()
+        self._timer: Optional[asyncio.Task[None]] = None
+        self._setup_lock = asyncio.Lock()
+        self._ready = not create_table
+
+    async def handle(self, email: Email) -> None:
+        self._buffer[email.id] = email_row(email)
+        if len(self._buffer) >= self.batch_size:
+            await self.flush()
+        elif self._timer is None or self._timer.done():
+            self._timer = asyncio.create_task(self._flush_later())
+
+    async def flush(self) -> None:
+        """Write the buffer and wait for every write in progress.
+
+        Raises:
+            psycopg.Error: A write failed. Its rows are put back into the
+                buffer and retried by the next flush.
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._buffer:
+            rows, self._buffer = self._buffer, {}
+            task = asyncio.create_task(self._write_batch(rows))
+            self._writes.add(task)
+            task.add_done_callback(self._writes.discard)
+        if self._writes:
+            await asyncio.gather(*self._writes)
+
+    async def close(self) -> None:
+        """Flush the buffer and close the pool's connections."""
+        try:
+            await self.flush()
+        finally:
+            await self.pool.close()
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.flush_interval)
+        self._timer = None
+        try:
+            await self.flush()
+        except Exception as exc:
+            logging.warning("Failed to write emails to PostgreSQL: %s", exc)
+
+    async def _write_batch(self, rows: Dict[str, Row]) -> None:
+        try:
+            await self._write(list(rows.values()))
+        except BaseException:
+            # Newer rows for the same messages take precedence.
+            for message_id, row in rows.items():
+                self._buffer.setdefault(message_id, row)
+            raise
+
+    async def _write(self, rows: List[Row]) -> None:
+        """Upsert *rows* in one transaction."""
+        async with self.pool.connection() as conn:
+            if not self._ready:
+                await self._setup(conn)
+            async with conn.transaction(), conn.cursor() as cursor:
+                if len(rows) >= COPY_THRESHOLD:
+                    await self._copy(cursor, rows)
+                else:
+                    await self._insert(cursor, rows)
+
+    async def _setup(self, conn: psycopg.AsyncConnection[Any]) -> None:
+        async with self._setup_lock:
+            if self._ready:
+                return
+            await conn.execute(
+                sql.SQL(
+                    """
+                    CREATE TABLE IF NOT EXISTS {} (
+                        id text PRIMARY KEY,
+                        thread_id text,
+                        snippet text NOT NULL,
+                        label_ids text[],
+                        headers jsonb,
+                        body text,
+                        attachments jsonb,
+                        ingested_at timestamptz NOT NULL DEFAULT now(),
+                        updated_at timestamptz NOT NULL DEFAULT now()
+                    )
+                    """
+                ).format(sql.Identifier(self.table))
+            )
+            self._ready = True
+
+    async def _insert(self, cursor: psycopg.AsyncCursor[Any], rows: List[Row]) -> None:
+        row = sql.SQL("({})").format(
+            sql.SQL(", ").join(sql.Placeholder() * len(COLUMNS))
+        )
+        query = sql.SQL("INSERT INTO {} ({}) VALUES {} {}").format(
+            sql.Identifier(self.table),
+            sql.SQL(", ").join(map(sql.Identifier, COLUMNS)),
+            sql.SQL(", ").join([row] * len(rows)),
+            self._on_conflict(),
+        )
+        await cursor.execute(query, [value for row in rows for value in row])
+
+    async def _copy(self, cursor: psycopg.AsyncCursor[Any], rows: List[Row]) -> None:
+        # Temporary tables are private to the connection, so concurrent
+        # writers each get their own staging table.
+        staging = sql.Identifier(f"{self.table}_staging")
+        columns = sql.SQL(", ").join(map(sql.Identifier, COLUMNS))
+        await cursor.execute(
+            sql.SQL(
+                "CREATE TEMP TABLE IF NOT EXISTS {} "
+                "(LIKE {} INCLUDING DEFAULTS) ON COMMIT DELETE ROWS"
+            ).format(staging, sql.Identifier(self.table))
+        )
+        copy = sql.SQL("COPY {} ({}) FROM STDIN").format(staging, columns)
+        async with cursor.copy(copy) as writer:
+            for row in rows:
+                await writer.write_row(row)
+        await cursor.execute(
+            sql.SQL("INSERT INTO {} ({}) SELECT {} FROM {} {}").format(
+                sql.Identifier(self.table),
+                columns,
+                columns,
+                staging,
+                self._on_conflict(),
+            )
+        )
+
+    def _on_conflict(self) -> sql.Composed:
+        table = sql.Identifier(self.table)
+        updates = [
+            sql.SQL("{0} = COALESCE(EXCLUDED.{0}, {1}.{0})").format(
+                sql.Identifier(column), table
+            )
+            for column in COLUMNS
+            if column != "id"
+        ]
+        return sql.SQL("ON CONFLICT (id) DO UPDATE SET {}, updated_at = now()").format(
+            sql.SQL(", ").join(updates)
+        )
@@ -0,0 +1,120 @@
+"""Small in-memory caches for tool results and model completions."""
+
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Generic, Hashable, Optional, Tuple, TypeVar
+
+# ``gmail_poll`` results are reused for this many seconds.
+DEFAULT_POLL_TTL = 30.0
+# Completions remembered by :class:`LRUCache` unless configured otherwise.
+DEFAULT_COMPLETION_CACHE_SIZE = 256
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class _Cache(Generic[K, V]):
+    """Thread-safe ordered mapping that counts hits and misses."""
+
+    def __init__(self) -> None:
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[K, Tuple[float, V]] = OrderedDict()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def invalidate(self, key: Optional[K] = None) -> None:
+        """Forget *key*, or every entry when *key* is ``None``."""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit and miss counts and the current number of entries."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+            }
+
+
+class TTLCache(_Cache[K, V]):
+    """Cache whose entries expire *ttl* seconds after they were stored."""
+
+    def __init__(
+        self, ttl: float, *, clock: Callable[[], float] = time.monotonic
+    ) -> None:
+        """Create a new :class:`TTLCache`.
+
+        Args:
+            ttl: Seconds an entry stays valid.
+            clock: Monotonic time source, replaceable in tests.
+        """
+        if ttl <= 0:
+            raise ValueError("ttl must be positive")
+        super().__init__()
+        self.ttl = ttl
+        self.clock = clock
+
+    def get(self, key: K) -> Optional[V]:
+        """Return the live value for *key*, or ``None``."""
+        now = self.clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: K, value: V) -> None:
+        """Store *value* under *key* for :attr:`ttl` seconds."""
+        now = self.clock()
+        with self._lock:
+            self._entries[key] = (now + self.ttl, value)
+            # Entries are kept in expiry order, so expired ones are at the
+            # front; drop them so keys that are never read again go away.
+            self._entries.move_to_end(key)
+            while next(iter(self._entries.values()))[0] <= now:
+                self._entries.popitem(last=False)
+
+
+class LRUCache(_Cache[K, V]):
+    """Cache holding at most *maxsize* entries, evicting the least recently used."""
+
+    def __init__(self, maxsize: int = DEFAULT_COMPLETION_CACHE_SIZE) -> None:
+        """Create a new :class:`LRUCache` holding up to *maxsize* entries."""
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+        super().__init__()
+        self.maxsize = maxsize
+
+    def get(self, key: K) -> Optional[V]:
+        """Return the value for *key*, or ``None``, marking it recently used."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: K, value: V) -> None:
+        """Store *value* under *key*, evicting the oldest entry when full."""
+        with self._lock:
+            self._entries[key] = (0.0, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
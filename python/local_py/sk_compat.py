@@ -0,0 +1,51 @@
+"""Semantic Kernel function registration without importing Semantic Kernel.
+
+Importing ``semantic_kernel`` takes over a second, which pollers and agents
+that never meet a kernel should not pay. :func:`kernel_function` marks
+methods like ``semantic_kernel.functions.kernel_function`` does, but only
+applies the real decorator once ``semantic_kernel`` has been imported by
+someone else, which any code building a kernel must have done.
+"""
+
+from __future__ import annotations
+
+import functools
+import sys
+from typing import Any, Callable, Optional, TypeVar
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+
+class _KernelMethod:
+    """Method descriptor decorating its function on first use with a kernel."""
+
+    def __init__(self, func: Callable[..., Any], description: Optional[str]) -> None:
+        self.func = func
+        self.description = description
+        self.decorated = False
+        # Keep the name, docstring and signature visible on the class.
+        functools.update_wrapper(self, func)  # type: ignore[arg-type]
+
+    def __get__(self, instance: Any, owner: Optional[type] = None) -> Any:
+        if not self.decorated and "semantic_kernel" in sys.modules:
+            from semantic_kernel.functions import kernel_function
+
+            kernel_function(description=self.description)(self.func)
+            self.decorated = True
+        if instance is None:
+            return self.func
+        return self.func.__get__(instance, owner)
+
+
+def kernel_function(description: Optional[str] = None) -> Callable[[F], F]:
+    """Mark a method as a Semantic Kernel function with *description*.
+
+    Accessing the method once ``semantic_kernel`` is imported gives the same
+    bound method as ``semantic_kernel.functions.kernel_function`` would, so
+    ``kernel.add_function`` and ``kernel.add_plugin`` accept it unchanged.
+    """
+
+    def decorate(func: F) -> F:
+        return _KernelMethod(func, description)  # type: ignore[return-value]
+
+    return decorate
@@ -1,11 +1,22 @@
 """Utility script for creating a virtual environment and installing dependencies."""
 
 import argparse
+import hashlib
+import json
 import os
 import pathlib
+import platform
+import re
+from contextlib import contextmanager
 from subprocess import CalledProcessError, run
 import sys
-from typing import Sequence
+import tempfile
+import time
+from typing import Iterator, Sequence
+
+# Written into the virtual environment after a successful installation.
+STAMP_NAME = ".setup_venv.json"
+
 
 def _venv_python(venv_dir: pathlib.Path) -> pathlib.Path:
     """Return the path to the Python interpreter inside ``venv_dir``."""
@@ -14,9 +25,72 @@ def _venv_python(venv_dir: pathlib.Path) -> pathlib.Path:
         return venv_dir / "Scripts" / "python"
     return venv_dir / "bin" / "python"
 
+
+def _interpreter_version() -> str:
+    """Return the implementation and version of the running interpreter."""
+
+    return f"{platform.python_implementation()} {platform.python_version()}"
+
+
+def _parse_requirements(text: str) -> dict[str, str] | None:
+    """Return requirement lines keyed by normalized project name.
+
+    Returns ``None`` when the file holds options such as ``-r`` or
+    ``--index-url``, which an incremental install cannot honor.
+    """
+
+    requirements: dict[str, str] = {}
+    for raw in text.splitlines():
+        line = raw.split(" #", 1)[0].strip()
+        if not line or line.startswith("#"):
+            continue
+        if line.startswith("-"):
+            return None
+        name = re.split(r"[\s<>=!~;\[@]", line, maxsplit=1)[0]
+        requirements[re.sub(r"[-_.]+", "-", name).lower()] = line
+    return requirements
+
+
+def _read_stamp(path: pathlib.Path) -> dict[str, object]:
+    """Return the stamp at ``path``, or an empty dict if it is missing or invalid."""
+
+    try:
+        stamp = json.loads(path.read_text())
+    except (OSError, ValueError):
+        return {}
+    return stamp if isinstance(stamp, dict) else {}
+
+
+class _PhaseTimer:
+    """Record the wall time of each setup phase."""
+
+    def __init__(self) -> None:
+        self.timings: dict[str, float] = {}
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = time.perf_counter() - start
+
+    def report(self) -> None:
+        """Print the time spent in each phase and in total."""
+
+        for name, seconds in self.timings.items():
+            print(f"setup_venv: {name:<8} {seconds:7.2f}s")
+        print(f"setup_venv: {'total':<8} {sum(self.timings.values()):7.2f}s")
+
+
 def main(argv: Sequence[str] | None = None) -> None:
     """Create a virtual environment and install dependencies.
 
+    Installation is skipped when the requirements file and the interpreter
+    version match the stamp left by the previous successful run. When only
+    some requirements changed, only those are installed, constrained by the
+    full file. Requirements removed from the file are not uninstalled.
+
     Args:
         argv: Optional CLI arguments.
             Positional argument may specify a custom requirements file path.
@@ -29,29 +103,114 @@ def main(argv: Sequence[str] | None = None) -> None:
         default=None,
         help="Path to requirements file (defaults to requirements.txt alongside this script)",
     )
+    parser.add_argument(
+        "--wheelhouse",
+        type=pathlib.Path,
+        default=None,
+        help="Directory of wheels to install from; missing wheels are added to it first",
+    )
+    parser.add_argument(
+        "--offline",
+        action="store_true",
+        help="Install only from --wheelhouse without contacting the package index",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Reinstall every requirement even if nothing changed",
+    )
     args = parser.parse_args(argv)
+    if args.offline and args.wheelhouse is None:
+        parser.error("--offline requires --wheelhouse")
 
+    timer = _PhaseTimer()
     root = pathlib.Path(os.environ.get("BUILD_WORKING_DIRECTORY", ".")).resolve()
     venv_dir = root / ".venv"
-    if not venv_dir.exists():
-        try:
-            run([sys.executable, "-m", "venv", str(venv_dir)], check=True, text=True)
-        except CalledProcessError as exc:
-            raise RuntimeError("Failed to create virtual environment") from exc
+    stamp_path = venv_dir / STAMP_NAME
+    stamp = _read_stamp(stamp_path)
+    interpreter = _interpreter_version()
+    with timer.phase("venv"):
+        # Packages built for another interpreter version cannot be reused.
+        stale = stamp.get("python") not in (None, interpreter)
+        if not venv_dir.exists() or stale:
+            command = [sys.executable, "-m", "venv"]
+            if stale:
+                command.append("--clear")
+                stamp = {}
+            try:
+                run([*command, str(venv_dir)], check=True, text=True)
+            except CalledProcessError as exc:
+                raise RuntimeError("Failed to create virtual environment") from exc
 
     reqs = (
         pathlib.Path(args.requirements_path)
         if args.requirements_path is not None
         else pathlib.Path(__file__).with_name("requirements.txt")
     )
-    try:
-        run(
-            [str(_venv_python(venv_dir)), "-m", "pip", "install", "-r", str(reqs)],
-            check=True,
-            text=True,
+    with timer.phase("hash"):
+        text = reqs.read_text()
+        digest = hashlib.sha256(text.encode()).hexdigest()
+        requirements = _parse_requirements(text)
+    if not args.force and stamp.get("requirements_sha256") == digest:
+        print(f"setup_venv: {reqs} is unchanged; skipping installation")
+        timer.report()
+        return
+
+    installed = stamp.get("requirements")
+    changed: list[str] | None = None
+    if not args.force and requirements is not None and isinstance(installed, dict):
+        changed = [
+            line for name, line in requirements.items() if installed.get(name) != line
+        ]
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        if changed is None:
+            targets = ["-r", str(reqs)]
+        else:
+            subset = pathlib.Path(tmpdir) / "changed.txt"
+            subset.write_text("\n".join(changed) + "\n")
+            targets = ["-r", str(subset), "-c", str(reqs)]
+            print(f"setup_venv: installing {len(changed)} changed requirements")
+        pip = [str(_venv_python(venv_dir)), "-m", "pip"]
+        sources: list[str] = []
+        if args.wheelhouse is not None:
+            wheelhouse = str(args.wheelhouse.resolve())
+            sources = ["--no-index", "--find-links", wheelhouse]
+            if not args.offline and changed != []:
+                with timer.phase("wheels"):
+                    try:
+                        run(
+                            [*pip, "wheel", "--wheel-dir", wheelhouse]
+                            + ["--find-links", wheelhouse, *targets],
+                            check=True,
+                            text=True,
+                        )
+                    except CalledProcessError as exc:
+                        raise RuntimeError(
+                            f"Failed to build wheels into {wheelhouse}"
+                        ) from exc
+        if changed != []:
+            with timer.phase("install"):
+                try:
+                    run([*pip, "install", *targets, *sources], check=True, text=True)
+                except CalledProcessError as exc:
+                    raise RuntimeError(
+                        f"Failed to install dependencies from {reqs}"
+                    ) from exc
+
+    with timer.phase("stamp"):
+        stamp_path.parent.mkdir(parents=True, exist_ok=True)
+        stamp_path.write_text(
+            json.dumps(
+                {
+                    "python": interpreter,
+                    "requirements_sha256": digest,
+                    "requirements": requirements,
+                },
+                indent=2,
+            )
         )
-    except CalledProcessError as exc:
-        raise RuntimeError(f"Failed to install dependencies from {reqs}") from exc
+    timer.report()
 
 
 if __name__ == "__main__":
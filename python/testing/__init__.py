@@ -0,0 +1 @@
+"""Test doubles shared by the tests and benchmarks; not part of local_py."""
@@ -0,0 +1,616 @@
+"""Local stand-in for the Gmail v1 HTTP API, with request recording and replay.
+
+:class:`FakeGmailServer` serves the endpoints the pollers use from an
+in-memory mailbox, with configurable latency and error rate, so pollers can
+be measured and regression-tested over real HTTP without a Google account.
+:class:`RecordingHttp` wraps a transport talking to the real API and writes
+every response to a JSON lines file, which a :class:`FakeGmailServer` can
+replay instead of its own mailbox.
+"""
+
+from __future__ import annotations
+
+import base64
+import json
+import mimetypes
+import random
+import threading
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from email.parser import Parser
+from email.utils import format_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Callable, Deque, Dict, List, Optional, Self, Tuple, cast
+from urllib.parse import parse_qs, parse_qsl, quote, urlencode, urlsplit
+
+import httplib2
+from googleapiclient.discovery import build_from_document
+
+from local_py.gmail_poller import discovery_document
+
+# Path prefix of every Gmail v1 resource.
+API_PREFIX = "/gmail/v1/users/me/"
+# Paths batch requests are posted to; the discovery document uses the first.
+BATCH_PATHS = ("/batch", "/batch/gmail/v1")
+
+Response = Tuple[int, str]
+
+
+@dataclass
+class FakeMessage:
+    """Message held by :class:`FakeGmailServer`."""
+
+    id: str
+    thread_id: str
+    sender: str
+    subject: str
+    date: datetime
+    snippet: str
+    body: str
+    labels: set[str] = field(default_factory=lambda: {"UNREAD", "INBOX"})
+    # File names and contents, served with attachment IDs ``<id>.<index>``.
+    attachments: List[Tuple[str, bytes]] = field(default_factory=list)
+
+    def resource(self, fmt: str = "full", headers: Optional[List[str]] = None) -> Any:
+        """Return the ``messages.get`` response for format *fmt*."""
+        message: Dict[str, Any] = {
+            "id": self.id,
+            "threadId": self.thread_id,
+            "labelIds": sorted(self.labels),
+            "snippet": self.snippet,
+            "internalDate": str(int(self.date.timestamp() * 1000)),
+        }
+        if fmt == "minimal":
+            return message
+        all_headers = [
+            {"name": "From", "value": self.sender},
+            {"name": "Subject", "value": self.subject},
+            {"name": "Date", "value": format_datetime(self.date)},
+        ]
+        if fmt == "metadata":
+            wanted = {name.lower() for name in headers or []}
+            all_headers = [
+                h for h in all_headers if not wanted or h["name"].lower() in wanted
+            ]
+            message["payload"] = {"headers": all_headers}
+            return message
+        parts: List[Dict[str, Any]] = [
+            {"mimeType": "text/plain", "body": {"data": _encode(self.body.encode())}}
+        ]
+        for number, (filename, data) in enumerate(self.attachments):
+            parts.append(
+                {
+                    "mimeType": mimetypes.guess_type(filename)[0]
+                    or "application/octet-stream",
+                    "filename": filename,
+                    "body": {"attachmentId": f"{self.id}.{number}", "size": len(data)},
+                }
+            )
+        message["payload"] = {
+            "mimeType": "multipart/mixed"
+            if self.attachments
+            else "multipart/alternative",
+            "headers": all_headers,
+            "parts": parts,
+        }
+        return message
+
+
+class FakeGmailServer:
+    """Threaded HTTP server answering Gmail v1 requests from memory.
+
+    Supported are ``users.getProfile``, ``messages.list`` (``is:unread`` and
+    ``from:`` queries), ``messages.get``, ``messages.modify``,
+    ``messages.batchModify``, ``messages.attachments.get``, ``history.list``
+    and batch requests. Field masks are ignored. Point a
+    :class:`~local_py.gmail_poller.GmailPoller` at it with :meth:`service`,
+    or an :class:`~local_py.async_gmail_poller.AsyncGmailPoller` at
+    :attr:`api_url`.
+
+    Besides the random failures of *error_rate*, calls can be failed on
+    purpose through :attr:`failing`. Every call is logged in :attr:`requests`
+    and counted in :attr:`calls`; :attr:`http_requests` counts round trips,
+    and :attr:`max_in_flight` the most requests served at once.
+    """
+
+    def __init__(
+        self,
+        messages: int = 0,
+        *,
+        latency: float = 0.0,
+        error_rate: float = 0.0,
+        error_status: int = 500,
+        replay: Optional[Path | str] = None,
+        seed: int = 0,
+    ) -> None:
+        """Create a new :class:`FakeGmailServer`; call :meth:`start` to listen.
+
+        Args:
+            messages: Unread messages in the mailbox at the start.
+            latency: Seconds added to every HTTP request, including each
+                batch request as a whole.
+            error_rate: Fraction of calls, counting each call in a batch,
+                that fail with *error_status*.
+            error_status: Status of injected failures, e.g. 429 or 500.
+            replay: Recording written by :class:`RecordingHttp`. Recorded
+                calls are answered with the recorded responses in order,
+                repeating the last one; other calls fail with 404.
+            seed: Seed for generated messages and injected failures.
+        """
+        if not 0 <= error_rate <= 1:
+            raise ValueError("error_rate must be between 0 and 1")
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        # Status to fail calls with, by Gmail API method such as
+        # ``users.messages.list`` or by the ID of the message called on.
+        self.failing: Dict[str, int] = {}
+        self.calls: Dict[str, int] = {}
+        # Method and query parameters of every call, in order.
+        self.requests: List[Tuple[str, Dict[str, List[str]]]] = []
+        # ``Authorization`` header of every HTTP request, in order.
+        self.auth_headers: List[str] = []
+        self.http_requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+        self._rng = random.Random(seed)
+        self._recorded: Optional[Dict[str, Deque[Response]]] = None
+        if replay is not None:
+            self._recorded = load_recording(replay)
+        self.reset(messages)
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        """Root URL of the server, without a trailing slash."""
+        return f"http://127.0.0.1:{self._server.server_port}"
+
+    @property
+    def api_url(self) -> str:
+        """Base URL of the Gmail v1 REST API on this server."""
+        return f"{self.url}/gmail/v1"
+
+    def start(self) -> Self:
+        """Serve requests on a daemon thread and return the server."""
+        # A short poll interval keeps :meth:`stop` fast in tests.
+        self._thread = threading.Thread(
+            target=self._server.serve_forever,
+            args=(0.05,),
+            name="fake-gmail",
+            daemon=True,
+        )
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Stop serving and close the socket."""
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> Self:
+        return self.start()
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.stop()
+
+    def service(
+        self, transport: Optional[Callable[..., Any]] = None, timeout: float = 10.0
+    ) -> Any:
+        """Return an unauthenticated Gmail API service that talks to this server.
+
+        Args:
+            transport: ``httplib2.Http`` compatible factory called with
+                ``timeout=``, e.g. :class:`~local_py.gmail_transport.PooledHttp`.
+            timeout: Timeout in seconds for each request.
+        """
+        document = discovery_document()
+        document["rootUrl"] = f"{self.url}/"
+        document["baseUrl"] = f"{self.url}/gmail/v1/"
+        http = (transport or httplib2.Http)(timeout=timeout)
+        return build_from_document(document, http=http)
+
+    def reset(self, messages: int) -> None:
+        """Replace the mailbox with *messages* generated unread messages."""
+        with self._lock:
+            self.messages: Dict[str, FakeMessage] = {}
+            self.history: List[Tuple[int, str]] = []
+            self.history_id = 1000
+            self.oldest_history_id = self.history_id
+        for _ in range(messages):
+            self.deliver()
+
+    def deliver(
+        self,
+        sender: Optional[str] = None,
+        subject: Optional[str] = None,
+        attachments: Optional[List[Tuple[str, bytes]]] = None,
+    ) -> FakeMessage:
+        """Add an unread message and record it in the mailbox history."""
+        with self._lock:
+            number = len(self.messages)
+            self.history_id += 1
+            message = FakeMessage(
+                id=f"{self.history_id:016x}",
+                thread_id=f"{self.history_id - number % 3:016x}",
+                sender=sender or f"user{self._rng.randrange(50)}@example.com",
+                subject=subject or f"Report {number}",
+                date=datetime(2025, 1, 6, tzinfo=timezone.utc)
+                + timedelta(minutes=number),
+                snippet=f"Message number {number} about the quarterly report",
+                body=f"Body of message {number}.\n" * 20,
+                attachments=list(attachments or []),
+            )
+            self.messages[message.id] = message
+            self.history.append((self.history_id, message.id))
+            return message
+
+    def unread(self) -> List[str]:
+        """Return the IDs of unread messages, oldest first."""
+        with self._lock:
+            return [m.id for m in self.messages.values() if "UNREAD" in m.labels]
+
+    def expire_history(self) -> None:
+        """Make every earlier ``historyId`` too old for ``history.list``."""
+        with self._lock:
+            self.oldest_history_id = self.history_id
+
+    def handle(self, method: str, target: str, body: str = "") -> Response:
+        """Answer one API call and return its status and JSON body.
+
+        *target* is the request path with its query string.
+        """
+        url = urlsplit(target)
+        path = url.path[len(API_PREFIX) :] if url.path.startswith(API_PREFIX) else None
+        name = _method_name(method, path)
+        with self._lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+            self.requests.append((name, parse_qs(url.query)))
+            status = self.failing.get(name) or self.failing.get(_message_id(path))
+            if not status and self.error_rate and self._rng.random() < self.error_rate:
+                status = self.error_status
+        if status:
+            return status, _error(status, "Injected failure")
+        if self._recorded is not None:
+            return self._replay(method, target)
+        query = dict(parse_qsl(url.query))
+        headers = [v for k, v in parse_qsl(url.query) if k == "metadataHeaders"]
+        with self._lock:
+            try:
+                result = self._dispatch(name, path or "", query, headers, body)
+            except KeyError:
+                return 404, _error(404, "Requested entity was not found.")
+        return (200, json.dumps(result)) if result is not None else (204, "")
+
+    def _dispatch(
+        self,
+        name: str,
+        path: str,
+        query: Dict[str, str],
+        headers: List[str],
+        body: str,
+    ) -> Any:
+        if name == "users.getProfile":
+            return {
+                "emailAddress": "me@example.com",
+                "messagesTotal": len(self.messages),
+                "historyId": str(self.history_id),
+            }
+        if name == "users.messages.list":
+            return self._list(query)
+        if name == "users.messages.get":
+            message = self.messages[path.split("/")[1]]
+            return message.resource(query.get("format", "full"), headers)
+        if name == "users.messages.modify":
+            message = self.messages[path.split("/")[1]]
+            self._modify([message.id], json.loads(body or "{}"))
+            return message.resource("minimal")
+        if name == "users.messages.batchModify":
+            request = json.loads(body or "{}")
+            self._modify(request.get("ids", []), request)
+            return None
+        if name == "users.messages.attachments.get":
+            _, message_id, _, attachment_id = path.split("/")
+            number = int(attachment_id.rpartition(".")[2])
+            data = self.messages[message_id].attachments[number][1]
+            return {"size": len(data), "data": _encode(data)}
+        if name == "users.history.list":
+            return self._history(query)
+        raise KeyError(name)
+
+    def _list(self, query: Dict[str, str]) -> Dict[str, Any]:
+        matches = list(reversed(self.messages.values()))
+        for term in query.get("q", "").split():
+            if term == "is:unread":
+                matches = [m for m in matches if "UNREAD" in m.labels]
+            elif term.startswith("from:"):
+                matches = [m for m in matches if term[5:] in m.sender]
+        # As with Gmail, page tokens are positions in the results, so marking
+        # listed messages as read between pages makes later pages skip some.
+        offset = int(query.get("pageToken") or 0)
+        size = int(query.get("maxResults", 100))
+        page = matches[offset : offset + size]
+        result: Dict[str, Any] = {
+            "messages": [{"id": m.id, "threadId": m.thread_id} for m in page],
+            "resultSizeEstimate": len(matches),
+        }
+        if len(matches) > offset + size:
+            result["nextPageToken"] = str(offset + size)
+        return result
+
+    def _history(self, query: Dict[str, str]) -> Dict[str, Any]:
+        start = int(query["startHistoryId"])
+        if start < self.oldest_history_id:
+            raise KeyError(start)
+        label = query.get("labelId")
+        records = [
+            {
+                "id": str(history_id),
+                "messagesAdded": [{"message": {"id": message_id}}],
+            }
+            for history_id, message_id in self.history
+            if history_id > start
+            and message_id in self.messages
+            and (label is None or label in self.messages[message_id].labels)
+        ]
+        return {"history": records, "historyId": str(self.history_id)}
+
+    def _modify(self, ids: List[str], request: Dict[str, Any]) -> None:
+        for message_id in ids:
+            message = self.messages.get(message_id)
+            if message is None:
+                continue
+            message.labels.update(request.get("addLabelIds", []))
+            message.labels.difference_update(request.get("removeLabelIds", []))
+
+    def _replay(self, method: str, target: str) -> Response:
+        assert self._recorded is not None
+        with self._lock:
+            responses = self._recorded.get(_request_key(method, target))
+            if not responses:
+                return 404, _error(404, f"No recorded response for {method} {target}")
+            return responses.popleft() if len(responses) > 1 else responses[0]
+
+    def _handle_batch(self, content_type: str, body: str) -> Tuple[str, str]:
+        """Answer every call of a batch request; return content type and body."""
+        boundary = f"batch_{uuid.uuid4().hex}"
+        parts = []
+        for content_id, method, target, part_body in split_batch_request(
+            content_type, body
+        ):
+            status, content = self.handle(method, target, part_body)
+            parts.append(
+                f"--{boundary}\r\n"
+                "Content-Type: application/http\r\n"
+                f"Content-ID: <response-{content_id[1:]}\r\n\r\n"
+                f"HTTP/1.1 {status} {'OK' if status < 300 else 'Error'}\r\n"
+                "Content-Type: application/json; charset=UTF-8\r\n\r\n"
+                f"{content}\r\n"
+            )
+        parts.append(f"--{boundary}--\r\n")
+        return f"multipart/mixed; boundary={boundary}", "".join(parts)
+
+    def _handler(self) -> type[BaseHTTPRequestHandler]:
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body go out in separate writes; without this,
+            # delayed ACKs add ~40 ms to every keep-alive response.
+            disable_nagle_algorithm = True
+
+            def do_GET(self) -> None:
+                self._answer()
+
+            def do_POST(self) -> None:
+                self._answer()
+
+            def _answer(self) -> None:
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length).decode() if length else ""
+                with server._lock:
+                    server.http_requests += 1
+                    server.auth_headers.append(self.headers.get("Authorization", ""))
+                    server.in_flight += 1
+                    server.max_in_flight = max(server.max_in_flight, server.in_flight)
+                try:
+                    self._respond(body)
+                finally:
+                    with server._lock:
+                        server.in_flight -= 1
+
+            def _respond(self, body: str) -> None:
+                if server.latency:
+                    time.sleep(server.latency)
+                content_type = "application/json; charset=UTF-8"
+                if urlsplit(self.path).path in BATCH_PATHS:
+                    status = 200
+                    content_type, content = server._handle_batch(
+                        self.headers["Content-Type"], body
+                    )
+                else:
+                    status, content = server.handle(self.command, self.path, body)
+                data = content.encode()
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format: str, *args: object) -> None:
+                pass
+
+        return Handler
+
+
+class RecordingHttp:
+    """``httplib2.Http`` compatible wrapper recording every Gmail response.
+
+    Each call, including every call inside a batch request, is appended to
+    *path* as one JSON line holding the method, path, status and body.
+    Request headers, and with them credentials, are never written. The file
+    can be replayed with ``FakeGmailServer(replay=path)``.
+    """
+
+    def __init__(self, http: Any, path: Path | str) -> None:
+        """Create a new :class:`RecordingHttp`.
+
+        Args:
+            http: Transport sending the requests, e.g. ``httplib2.Http``.
+            path: JSON lines file appended to.
+        """
+        self.http = http
+        self.path = Path(path)
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name: str) -> Any:
+        # googleapiclient and google-auth read attributes such as
+        # ``follow_redirects`` and ``redirect_codes`` from the transport.
+        return getattr(self.http, name)
+
+    def request(
+        self,
+        uri: str,
+        method: str = "GET",
+        body: Any = None,
+        headers: Optional[Dict[str, str]] = None,
+        **kwargs: Any,
+    ) -> Tuple[Any, bytes]:
+        """Send the request with :attr:`http` and record the response."""
+        response, content = self.http.request(
+            uri, method=method, body=body, headers=headers, **kwargs
+        )
+        url = urlsplit(uri)
+        text = content.decode() if isinstance(content, bytes) else content
+        if url.path in BATCH_PATHS:
+            entries = _split_batch_exchange(
+                (headers or {}).get("content-type", ""),
+                body or "",
+                response.get("content-type", ""),
+                text,
+            )
+        else:
+            target = f"{url.path}?{url.query}" if url.query else url.path
+            entries = [(method, target, response.status, text)]
+        with self._lock, self.path.open("a") as file:
+            for entry_method, target, status, entry_body in entries:
+                record = {
+                    "method": entry_method,
+                    "path": target,
+                    "status": status,
+                    "body": entry_body,
+                }
+                file.write(json.dumps(record) + "\n")
+        return response, content
+
+
+def load_recording(path: Path | str) -> Dict[str, Deque[Response]]:
+    """Return the responses in a :class:`RecordingHttp` file by request."""
+    recorded: Dict[str, Deque[Response]] = {}
+    with Path(path).open() as file:
+        for line in file:
+            if line.strip():
+                entry = json.loads(line)
+                key = _request_key(entry["method"], entry["path"])
+                recorded.setdefault(key, deque()).append(
+                    (entry["status"], entry["body"])
+                )
+    return recorded
+
+
+def split_batch_request(
+    content_type: str, body: str
+) -> List[Tuple[str, str, str, str]]:
+    """Return ``(content_id, method, target, body)`` for each call in a batch."""
+    calls = []
+    for part in _parts(content_type, body):
+        request_line, _, rest = part.get_payload().partition("\n")
+        method, target, _ = request_line.strip().split(" ", 2)
+        _, _, part_body = rest.replace("\r\n", "\n").partition("\n\n")
+        calls.append((part["Content-ID"], method, target, part_body.strip()))
+    return calls
+
+
+def _split_batch_exchange(
+    request_type: str, request_body: str, response_type: str, response_body: str
+) -> List[Tuple[str, str, int, str]]:
+    """Pair the calls of a batch request with their responses."""
+    responses: Dict[str, Tuple[int, str]] = {}
+    for part in _parts(response_type, response_body):
+        status_line, _, rest = part.get_payload().partition("\n")
+        _, _, content = rest.partition("\r\n\r\n")
+        # "<response-base + id>" answers the call "<base + id>".
+        content_id = "<" + part["Content-ID"][len("<response-") :]
+        responses[content_id] = (int(status_line.split(" ")[1]), content.strip())
+    return [
+        (method, target, *responses[content_id])
+        for content_id, method, target, _ in split_batch_request(
+            request_type, request_body
+        )
+        if content_id in responses
+    ]
+
+
+def _parts(content_type: str, body: str) -> List[Any]:
+    message = Parser().parsestr(f"Content-Type: {content_type}\r\n\r\n{body}")
+    return cast(List[Any], message.get_payload()) if message.is_multipart() else []
+
+
+def _request_key(method: str, target: str) -> str:
+    """Return *target* with a sorted query, so equal calls match."""
+    url = urlsplit(target)
+    query = urlencode(sorted(parse_qsl(url.query)), quote_via=quote)
+    return f"{method} {url.path}?{query}"
+
+
+def _method_name(method: str, path: Optional[str]) -> str:
+    """Return the Gmail API method called by *method* on resource *path*."""
+    if path is None:
+        return "unknown"
+    parts = path.split("/")
+    if parts == ["profile"]:
+        return "users.getProfile"
+    if parts == ["history"]:
+        return "users.history.list"
+    if parts[0] == "messages":
+        if len(parts) == 1:
+            return "users.messages.list"
+        if parts[1] == "batchModify":
+            return "users.messages.batchModify"
+        if len(parts) == 2:
+            return "users.messages.get"
+        if parts[2:] == ["modify"]:
+            return "users.messages.modify"
+        if parts[2] == "attachments" and len(parts) == 4:
+            return "users.messages.attachments.get"
+    return "unknown"
+
+
+def _message_id(path: Optional[str]) -> str:
+    """Return the ID of the message a call on *path* is about, or ``""``."""
+    parts = (path or "").split("/")
+    if parts[0] == "messages" and len(parts) > 1 and parts[1] != "batchModify":
+        return parts[1]
+    return ""
+
+
+def _encode(data: bytes) -> str:
+    """Encode *data* in Gmail's unpadded base64url."""
+    return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+
+def _error(status: int, message: str) -> str:
+    return json.dumps(
+        {
+            "error": {
+                "code": status,
+                "message": message,
+                "errors": [{"message": message}],
+            }
+        }
+    )
@@ -0,0 +1,82 @@
+"""Tests for :mod:`local_py.async_gmail_poller` against a local fake Gmail server."""
+
+import asyncio
+from types import SimpleNamespace
+from unittest import IsolatedAsyncioTestCase
+
+from local_py.async_gmail_poller import AsyncGmailPoller
+from testing.fake_gmail import FakeGmailServer
+
+
+class AsyncGmailPollerTest(IsolatedAsyncioTestCase):
+    """Verify concurrent fetching, pagination and read marking."""
+
+    async def start(self, count: int, **kwargs: object) -> AsyncGmailPoller:
+        self.gmail = FakeGmailServer(count, latency=0.01).start()
+        self.addCleanup(self.gmail.stop)
+        poller = AsyncGmailPoller(
+            credentials=SimpleNamespace(valid=True, token="test-token"),
+            base_url=self.gmail.api_url,
+            **kwargs,  # type: ignore[arg-type]
+        )
+        self.addAsyncCleanup(poller.close)
+        return poller
+
+    async def test_poll_follows_pages_and_marks_read(self) -> None:
+        poller = await self.start(25, max_results=10)
+        ids = self.gmail.unread()[::-1]
+
+        emails = await poller.poll()
+
+        self.assertEqual(ids, [email.id for email in emails])
+        message = self.gmail.messages[ids[0]]
+        self.assertEqual(message.snippet, emails[0].snippet)
+        self.assertEqual(message.sender, (emails[0].headers or {})["From"])
+        self.assertEqual([], self.gmail.unread())
+        self.assertEqual(3, self.gmail.calls["users.messages.list"])
+        self.assertEqual({"Bearer test-token"}, set(self.gmail.auth_headers))
+
+    async def test_requests_profile_with_field_mask(self) -> None:
+        poller = await self.start(1)
+
+        await poller.poll()
+
+        query = next(
+            q for name, q in self.gmail.requests if name == "users.messages.get"
+        )
+        self.assertEqual(["metadata"], query["format"])
+        self.assertEqual(["From", "Subject", "Date"], query["metadataHeaders"])
+        self.assertIn("payload/headers", query["fields"][0])
+
+    async def test_fetches_are_concurrent_and_bounded(self) -> None:
+        poller = await self.start(20, max_concurrency=4)
+
+        await poller.poll()
+
+        self.assertEqual(4, self.gmail.max_in_flight)
+
+    async def test_failed_messages_stay_unread(self) -> None:
+        poller = await self.start(3)
+        first, failing, last = self.gmail.unread()
+        self.gmail.failing[failing] = 500
+
+        emails = await poller.poll()
+
+        self.assertEqual([last, first], [email.id for email in emails])
+        self.assertEqual([failing], self.gmail.unread())
+
+    async def test_poll_does_not_block_event_loop(self) -> None:
+        poller = await self.start(10, max_concurrency=2)
+        ticks = 0
+
+        async def ticker() -> None:
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.001)
+
+        task = asyncio.create_task(ticker())
+        await poller.poll()
+        task.cancel()
+
+        self.assertGreater(ticks, 5)
@@ -0,0 +1,95 @@
+"""Tests for the token-budgeted chat history."""
+
+import json
+from unittest import TestCase
+
+from local_py.chat_context import MAX_EXPANDABLE, ChatContext, estimate_tokens
+from local_py.gmail_poller import Email
+
+
+class ChatContextTest(TestCase):
+    def test_messages_start_with_system_prompt(self) -> None:
+        context = ChatContext("Be brief.")
+        context.add_user("hi")
+        context.add_assistant("hello")
+
+        self.assertEqual(
+            [
+                {"role": "system", "content": "Be brief."},
+                {"role": "user", "content": "hi"},
+                {"role": "assistant", "content": "hello"},
+            ],
+            context.messages,
+        )
+
+    def test_old_turns_are_summarized_to_fit_budget(self) -> None:
+        context = ChatContext("sys", token_budget=100)
+        for i in range(10):
+            context.add_user(f"question {i} " + "x" * 100)
+            context.add_assistant(f"answer {i}")
+
+        history = context.messages[2:]
+        self.assertLessEqual(sum(map(estimate_tokens, history)), 100)
+        self.assertTrue(history[-2]["content"].startswith("question 9"))
+        summary = context.messages[1]
+        self.assertEqual("system", summary["role"])
+        self.assertIn("User: question 0", summary["content"])
+        self.assertIn("Assistant: answer 0", summary["content"])
+
+    def test_current_turn_is_kept_over_budget(self) -> None:
+        context = ChatContext("sys", token_budget=10)
+        context.add_user("first")
+        context.add_user("y" * 1000)
+
+        self.assertEqual("y" * 1000, context.messages[-1]["content"])
+
+    def test_summary_keeps_latest_lines(self) -> None:
+        context = ChatContext("sys", token_budget=1, summary_tokens=10)
+        for i in range(20):
+            context.add_user(f"question {i}")
+
+        self.assertLessEqual(len(context.summary), 40)
+        self.assertTrue(context.summary.endswith("User: question 18"))
+        self.assertFalse(context.summary.startswith("\n"))
+
+    def test_small_poll_results_are_sent_in_full(self) -> None:
+        context = ChatContext("sys")
+        context.add_user("check")
+        context.add_emails("call", [Email(id="1", snippet="hi")])
+
+        self.assertEqual(
+            {
+                "role": "tool",
+                "tool_call_id": "call",
+                "content": '[{"id": "1", "snippet": "hi"}]',
+            },
+            context.messages[-1],
+        )
+
+    def test_large_poll_results_are_compressed_and_expandable(self) -> None:
+        context = ChatContext("sys", tool_result_tokens=50)
+        emails = [Email(id=str(i), snippet="s" * 100) for i in range(20)]
+        context.add_user("check")
+        context.add_emails("call", emails)
+
+        content = json.loads(context.messages[-1]["content"])
+        self.assertEqual(20, content["count"])
+        self.assertEqual([str(i) for i in range(20)], content["ids"])
+        self.assertEqual(
+            [emails[3].to_dict(), {"id": "x", "error": "unknown email ID"}],
+            context.expand(["3", "x"]),
+        )
+
+    def test_expandable_emails_are_bounded(self) -> None:
+        context = ChatContext("sys")
+        context.add_user("check")
+        context.add_emails(
+            "call", [Email(id=str(i), snippet="") for i in range(MAX_EXPANDABLE + 1)]
+        )
+
+        self.assertIn("error", context.expand(["0"])[0])
+        self.assertNotIn("error", context.expand(["1"])[0])
+
+    def test_reply_requires_user_turn(self) -> None:
+        with self.assertRaises(ValueError):
+            ChatContext("sys").add_assistant("hello")
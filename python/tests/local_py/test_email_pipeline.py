@@ -0,0 +1,159 @@
+"""Tests for the concurrent email handling pipeline."""
+
+import asyncio
+import threading
+import time
+from typing import AsyncIterator, List
+from unittest import IsolatedAsyncioTestCase, TestCase
+
+from local_py.email_pipeline import (
+    BlockingEmailHandler,
+    EmailHandler,
+    EmailPipeline,
+    LoggingHandler,
+    load_handler,
+)
+from local_py.gmail_poller import Email
+
+
+async def stream(count: int, pulled: List[int] | None = None) -> AsyncIterator[Email]:
+    for i in range(count):
+        if pulled is not None:
+            pulled.append(i)
+        yield Email(id=str(i), snippet="")
+
+
+class SlowHandler(EmailHandler):
+    def __init__(self, delay: float = 0.05, fail: str | None = None) -> None:
+        self.delay = delay
+        self.fail = fail
+        self.active = 0
+        self.max_active = 0
+        self.handled: List[str] = []
+
+    async def handle(self, email: Email) -> None:
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.active -= 1
+        if email.id == self.fail:
+            raise ValueError("cannot parse")
+        self.handled.append(email.id)
+
+
+class ThreadHandler(BlockingEmailHandler):
+    def __init__(self) -> None:
+        super().__init__()
+        self.threads: set[str] = set()
+
+    def handle_blocking(self, email: Email) -> None:
+        self.threads.add(threading.current_thread().name)
+
+
+class BufferingHandler(EmailHandler):
+    def __init__(self, events: List[str], fail: bool = False) -> None:
+        self.events = events
+        self.fail = fail
+        self.buffered: List[str] = []
+
+    async def handle(self, email: Email) -> None:
+        self.buffered.append(email.id)
+
+    async def flush(self) -> None:
+        if self.fail:
+            raise ConnectionError("database is down")
+        self.events.append(f"flush {len(self.buffered)}")
+        self.buffered.clear()
+
+
+class EmailPipelineTest(IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.acked: List[List[str]] = []
+
+    async def ack(self, ids: List[str]) -> None:
+        self.acked.append(ids)
+
+    def acked_ids(self) -> List[str]:
+        return sorted(i for batch in self.acked for i in batch)
+
+    async def test_workers_handle_concurrently_then_ack(self) -> None:
+        handler = SlowHandler()
+        pipeline = EmailPipeline([handler], workers=4, ack_batch_size=3)
+
+        start = time.monotonic()
+        received = await pipeline.process(stream(8), self.ack)
+
+        self.assertEqual(8, received)
+        self.assertEqual(4, handler.max_active)
+        self.assertLess(time.monotonic() - start, 0.3)
+        self.assertEqual(sorted(str(i) for i in range(8)), self.acked_ids())
+        self.assertTrue(all(len(batch) <= 3 for batch in self.acked))
+
+    async def test_slow_handlers_throttle_fetching(self) -> None:
+        handler = SlowHandler(delay=0.02)
+        pipeline = EmailPipeline([handler], workers=1, queue_size=1)
+        pulled: List[int] = []
+        task = asyncio.create_task(pipeline.process(stream(20, pulled), self.ack))
+
+        await asyncio.sleep(0.05)
+
+        # One message in the worker, one queued and one waiting to be queued.
+        self.assertLessEqual(len(pulled), len(handler.handled) + 3)
+        await task
+
+    async def test_failed_messages_are_not_acked(self) -> None:
+        pipeline = EmailPipeline([SlowHandler(delay=0, fail="2")])
+
+        with self.assertLogs(level="WARNING"):
+            await pipeline.process(stream(4), self.ack)
+
+        self.assertEqual(["0", "1", "3"], self.acked_ids())
+        self.assertEqual(1, pipeline.failures)
+
+    async def test_received_messages_are_handled_before_stream_error(self) -> None:
+        async def failing() -> AsyncIterator[Email]:
+            yield Email(id="1", snippet="")
+            raise OSError("boom")
+
+        with self.assertRaises(OSError):
+            await EmailPipeline([SlowHandler(delay=0)]).process(failing(), self.ack)
+
+        self.assertEqual(["1"], self.acked_ids())
+
+    async def test_handlers_flush_before_ack(self) -> None:
+        events: List[str] = []
+
+        async def ack(ids: List[str]) -> None:
+            events.append(f"ack {len(ids)}")
+
+        pipeline = EmailPipeline([BufferingHandler(events)], ack_batch_size=3)
+        await pipeline.process(stream(5), ack)
+
+        self.assertEqual(["flush 3", "ack 3", "flush 2", "ack 2"], events)
+
+    async def test_failed_flush_leaves_messages_unacked(self) -> None:
+        pipeline = EmailPipeline([BufferingHandler([], fail=True)])
+
+        with self.assertLogs(level="WARNING"):
+            await pipeline.process(stream(3), self.ack)
+
+        self.assertEqual([], self.acked)
+
+    async def test_blocking_handler_runs_off_the_loop(self) -> None:
+        handler = ThreadHandler()
+
+        await EmailPipeline([handler]).process(stream(3), self.ack)
+
+        self.assertNotIn(threading.current_thread().name, handler.threads)
+
+
+class LoadHandlerTest(TestCase):
+    def test_loads_registered_names_and_import_paths(self) -> None:
+        self.assertIsInstance(load_handler("log"), LoggingHandler)
+        self.assertIsInstance(
+            load_handler("local_py.email_pipeline:LoggingHandler"), LoggingHandler
+        )
+        with self.assertRaises(ValueError):
+            load_handler("missing")
@@ -0,0 +1,297 @@
+"""Tests for :mod:`local_py.email_triage`."""
+
+import asyncio
+import json
+import threading
+import time
+from types import SimpleNamespace
+from typing import Any, AsyncIterator, Callable, List, Optional
+from unittest import IsolatedAsyncioTestCase, TestCase
+
+from local_py.email_pipeline import EmailPipeline
+from local_py.email_triage import (
+    Triage,
+    TriageError,
+    TriageHandler,
+    parse_triage,
+    triage_item,
+)
+from local_py.gmail_poller import Email
+from local_py.llm_backend import BackendProfile
+
+
+def make_email(index: int) -> Email:
+    return Email(
+        id=f"m{index}",
+        snippet=f"snippet {index}",
+        headers={"From": "boss@example.com", "Subject": f"Report {index}"},
+    )
+
+
+async def stream(count: int) -> AsyncIterator[Email]:
+    for i in range(count):
+        yield make_email(i)
+
+
+def reply(ids: List[str]) -> str:
+    return json.dumps(
+        {
+            "results": [
+                {
+                    "id": message_id,
+                    "category": "fyi",
+                    "priority": "low",
+                    "summary": f"About {message_id}.",
+                }
+                for message_id in ids
+            ]
+        }
+    )
+
+
+class FakeClient:
+    """OpenAI client stand-in answering for every email it is sent.
+
+    *respond* maps the IDs of a request to the reply content; it may raise
+    to fail the request.
+    """
+
+    def __init__(
+        self,
+        respond: Callable[[List[str]], str] = reply,
+        delay: float = 0.0,
+    ) -> None:
+        self.respond = respond
+        self.delay = delay
+        self.requests: List[List[str]] = []
+        self.kwargs: List[dict[str, Any]] = []
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, **kwargs: Any) -> Any:
+        ids = [item["id"] for item in json.loads(kwargs["messages"][-1]["content"])]
+        with self._lock:
+            self.requests.append(ids)
+            self.kwargs.append(kwargs)
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            time.sleep(self.delay)
+            content = self.respond(ids)
+        finally:
+            with self._lock:
+                self.active -= 1
+        message = SimpleNamespace(content=content)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+def make_handler(
+    client: FakeClient, results: Optional[List[str]] = None, **kwargs: Any
+) -> TriageHandler:
+    kwargs.setdefault("flush_interval", 60)
+    kwargs.setdefault("retry_delay", 0)
+    return TriageHandler(
+        client,
+        backend=BackendProfile(model="triage-model", max_tokens=500),
+        on_result=(
+            (lambda email, triage: results.append(email.id))
+            if results is not None
+            else None
+        ),
+        **kwargs,
+    )
+
+
+class ParseTriageTest(TestCase):
+    def test_keeps_valid_entries_for_requested_ids(self) -> None:
+        content = json.dumps(
+            {
+                "results": [
+                    {
+                        "id": "a",
+                        "category": "Action",
+                        "priority": "HIGH",
+                        "summary": " Pay ",
+                    },
+                    {
+                        "id": "b",
+                        "category": "urgent",
+                        "priority": "high",
+                        "summary": "x",
+                    },
+                    {"id": "c", "category": "fyi", "priority": "low", "summary": None},
+                    {"id": "z", "category": "fyi", "priority": "low", "summary": "x"},
+                    "junk",
+                ]
+            }
+        )
+
+        results = parse_triage(content, {"a", "b", "c"})
+
+        self.assertEqual({"a": Triage("action", "high", "Pay")}, results)
+
+    def test_invalid_reply_gives_no_results(self) -> None:
+        for content in ("not json", "[]", '{"results": {}}'):
+            with self.subTest(content=content):
+                self.assertEqual({}, parse_triage(content, {"a"}))
+
+    def test_item_truncates_long_fields(self) -> None:
+        email = Email(id="m1", snippet="s" * 1000, headers=None)
+
+        item = triage_item(email)
+
+        self.assertEqual(300, len(item["snippet"]))
+        self.assertEqual("", item["subject"])
+
+
+class TriageHandlerTest(IsolatedAsyncioTestCase):
+    async def test_packs_emails_into_batches(self) -> None:
+        client = FakeClient()
+        results: List[str] = []
+        handler = make_handler(client, results, batch_size=3)
+
+        for i in range(7):
+            await handler.handle(make_email(i))
+        await handler.flush()
+
+        self.assertEqual([3, 3, 1], sorted(map(len, client.requests), reverse=True))
+        self.assertCountEqual([f"m{i}" for i in range(7)], results)
+        self.assertEqual(Triage("fyi", "low", "About m4."), handler.cache.get("m4"))
+
+    async def test_request_asks_for_json_with_backend_settings(self) -> None:
+        client = FakeClient()
+        handler = make_handler(client)
+
+        await handler.handle(make_email(1))
+        await handler.flush()
+
+        kwargs = client.kwargs[0]
+        self.assertEqual({"type": "json_object"}, kwargs["response_format"])
+        self.assertEqual("triage-model", kwargs["model"])
+        self.assertEqual(500, kwargs["max_tokens"])
+        self.assertIn("newsletter", kwargs["messages"][0]["content"])
+
+    async def test_bounds_concurrent_requests(self) -> None:
+        client = FakeClient(delay=0.02)
+        handler = make_handler(client, batch_size=1, concurrency=2)
+
+        for i in range(6):
+            await handler.handle(make_email(i))
+        await handler.flush()
+
+        self.assertEqual(6, len(client.requests))
+        self.assertEqual(2, client.max_active)
+
+    async def test_retries_only_failed_items(self) -> None:
+        def respond(ids: List[str]) -> str:
+            # The model skips m1 the first time it sees it.
+            return reply([i for i in ids if i != "m1" or len(client.requests) > 1])
+
+        client = FakeClient(respond)
+        results: List[str] = []
+        handler = make_handler(client, results, batch_size=3)
+
+        for i in range(3):
+            await handler.handle(make_email(i))
+        await handler.flush()
+
+        self.assertEqual([["m0", "m1", "m2"], ["m1"]], client.requests)
+        self.assertCountEqual(["m0", "m1", "m2"], results)
+
+    async def test_failed_requests_are_retried(self) -> None:
+        calls: List[List[str]] = []
+
+        def respond(ids: List[str]) -> str:
+            calls.append(ids)
+            if len(calls) == 1:
+                raise ConnectionError("reset by peer")
+            return "not json" if len(calls) == 2 else reply(ids)
+
+        client = FakeClient(respond)
+        handler = make_handler(client)
+
+        await handler.handle(make_email(1))
+        await handler.flush()
+
+        self.assertEqual(3, len(client.requests))
+        self.assertIsNotNone(handler.cache.get("m1"))
+
+    async def test_flush_raises_after_last_attempt(self) -> None:
+        client = FakeClient(lambda ids: reply([i for i in ids if i != "m1"]))
+        handler = make_handler(client, max_attempts=2)
+
+        for i in range(3):
+            await handler.handle(make_email(i))
+        with self.assertRaises(TriageError) as raised:
+            await handler.flush()
+
+        self.assertEqual(["m1"], raised.exception.message_ids)
+        self.assertIsNone(handler.cache.get("m1"))
+        self.assertEqual(2, len(client.requests))
+        # The failure is reported once.
+        await handler.flush()
+
+    async def test_cached_results_skip_the_model(self) -> None:
+        client = FakeClient()
+        results: List[str] = []
+        handler = make_handler(client, results)
+
+        for _ in range(2):
+            await handler.handle(make_email(1))
+            await handler.flush()
+
+        self.assertEqual([["m1"]], client.requests)
+        self.assertEqual(["m1", "m1"], results)
+
+    async def test_duplicates_wait_for_the_copy_being_triaged(self) -> None:
+        client = FakeClient(delay=0.02)
+        results: List[str] = []
+        handler = make_handler(client, results, batch_size=5)
+
+        await handler.handle(make_email(1))
+        # The buffered copy is sent at once instead of after flush_interval.
+        await handler.handle(make_email(1))
+
+        self.assertEqual([["m1"]], client.requests)
+        self.assertEqual(["m1", "m1"], results)
+
+    async def test_duplicates_of_failed_messages_fail(self) -> None:
+        client = FakeClient(lambda ids: reply([]), delay=0.02)
+        handler = make_handler(client, batch_size=1, max_attempts=1)
+
+        await handler.handle(make_email(1))
+        with self.assertRaises(TriageError):
+            await handler.handle(make_email(1))
+        with self.assertRaises(TriageError):
+            await handler.flush()
+
+        self.assertEqual([["m1"]], client.requests)
+
+    async def test_partial_batch_is_sent_after_flush_interval(self) -> None:
+        client = FakeClient()
+        handler = make_handler(client, flush_interval=0.01)
+
+        await handler.handle(make_email(1))
+        for _ in range(100):
+            if handler.cache.get("m1") is not None:
+                break
+            await asyncio.sleep(0.01)
+
+        self.assertEqual([["m1"]], client.requests)
+
+    async def test_pipeline_acknowledges_triaged_emails(self) -> None:
+        client = FakeClient(lambda ids: reply([i for i in ids if i != "m3"]))
+        handler = make_handler(client, batch_size=4, max_attempts=1)
+        acked: List[str] = []
+
+        async def ack(ids: List[str]) -> None:
+            acked.extend(ids)
+
+        pipeline = EmailPipeline([handler], ack_batch_size=4)
+        await pipeline.process(stream(8), ack)
+
+        # m3 failed, so the ack batch holding it stays unread.
+        self.assertEqual(4, len(acked))
+        self.assertNotIn("m3", acked)
@@ -1,70 +1,482 @@
 import asyncio
-from unittest import TestCase
-from unittest.mock import MagicMock
+import base64
+import json
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from pathlib import Path
+from typing import Any, List
+from unittest import TestCase, mock
 
+import httplib2
 import semantic_kernel as sk
 
-from local_py.gmail_poller import Email, GmailPoller
+from google.oauth2.credentials import Credentials
+from googleapiclient.errors import HttpError
+
+from local_py.gmail_poller import (
+    Email,
+    FetchProfile,
+    GmailPoller,
+    clear_auth_cache,
+    get_credentials,
+    http_status,
+    retry_after,
+)
+from local_py.gmail_quota import QuotaLimiter
+from local_py.gmail_transport import PooledHttp
+from local_py.mail_index import MailIndex
+from local_py.metrics import Metrics
+from local_py.message_store import MessageStore
+from testing.fake_gmail import FakeGmailServer, FakeMessage
+
+SENDER = "sender@example.com"
+
+
+def expected(message: FakeMessage) -> Email:
+    """Return the email the default metadata profile yields for *message*."""
+    return Email(
+        id=message.id,
+        snippet=message.snippet,
+        thread_id=message.thread_id,
+        label_ids=["INBOX", "UNREAD"],
+        headers={
+            "From": message.sender,
+            "Subject": message.subject,
+            "Date": format_datetime(message.date),
+        },
+    )
 
 
 class GmailPollerTest(TestCase):
     def setUp(self) -> None:
-        self.service = MagicMock()
-        users = self.service.users.return_value
-        self.messages = users.messages.return_value
-
+        self.server = FakeGmailServer().start()
+        self.addCleanup(self.server.stop)
         # Simulate two unread messages
-        self.messages.list.return_value.execute.return_value = {
-            "messages": [{"id": "1"}, {"id": "2"}]
-        }
+        self.messages = [self.server.deliver(SENDER), self.server.deliver(SENDER)]
+        self.ids = [message.id for message in self.messages]
 
-        def get_call(userId: str, id: str):  # noqa: D401 - short mock function
-            msg = MagicMock()
-            msg.execute.return_value = {
-                "id": id,
-                "snippet": f"snippet {id}",
-            }
-            return msg
+    def poller(self, **kwargs: Any) -> GmailPoller:
+        return GmailPoller(service=self.server.service(), **kwargs)
 
-        self.messages.get.side_effect = get_call
+    def deliver(self, sender: str = SENDER) -> str:
+        return self.server.deliver(sender).id
 
-        def modify_call(userId: str, id: str, body: dict):
-            mod = MagicMock()
-            mod.execute.return_value = None
-            return mod
+    def test_poll_returns_emails(self) -> None:
+        emails = self.poller().poll(SENDER)
 
-        self.messages.modify.side_effect = modify_call
+        # Gmail lists the newest messages first.
+        self.assertEqual([expected(m) for m in reversed(self.messages)], emails)
+        self.assertEqual(1, self.server.calls["users.messages.batchModify"])
+        self.assertEqual([], self.server.unread())
 
-    def test_poll_returns_emails(self) -> None:
-        poller = GmailPoller(service=self.service)
-        emails = poller.poll("sender@example.com")
+    def test_poll_batches_round_trips(self) -> None:
+        self.server.reset(120)
+        ids = self.server.unread()[::-1]
+        poller = self.poller(batch_size=50, max_results=500)
+
+        emails = poller.poll()
+
+        self.assertEqual(ids, [email.id for email in emails])
+        # One list, three batched gets and a single batchModify.
+        self.assertEqual(5, self.server.http_requests)
+        self.assertEqual(1, self.server.calls["users.messages.batchModify"])
+        self.assertEqual([], self.server.unread())
+
+    def test_iter_unread_lists_every_page_before_marking_read(self) -> None:
+        self.server.reset(250)
+        ids = self.server.unread()[::-1]
+        poller = self.poller(max_results=100)
+
+        stream = poller.iter_unread()
+        first = next(stream)
+
+        # Every page has been listed, but only the first fetched and marked
+        # as read, so no page token points past messages read since.
+        self.assertEqual(ids[0], first.id)
+        self.assertEqual(3, self.server.calls["users.messages.list"])
+        self.assertEqual(100, self.server.calls["users.messages.get"])
+        self.assertEqual(ids[100:][::-1], self.server.unread())
+
+        rest = list(stream)
+        self.assertEqual(ids[1:], [email.id for email in rest])
+        self.assertEqual(3, self.server.calls["users.messages.list"])
+        self.assertEqual([], self.server.unread())
+
+    def test_iter_unread_propagates_errors(self) -> None:
+        self.server.reset(150)
+        ids = self.server.unread()[::-1]
+        poller = self.poller(max_results=100)
+
+        stream = poller.iter_unread()
+        next(stream)
+        self.server.failing["users.messages.get"] = 429
+        with self.assertRaises(HttpError):
+            list(stream)
+
+        self.server.failing.clear()
+        new = self.deliver()
+        self.assertEqual([new] + ids[100:], [e.id for e in poller.poll()])
+
+    def test_poll_skips_failed_messages(self) -> None:
+        self.server.failing[self.ids[1]] = 500
+
+        emails = self.poller().poll()
+
+        self.assertEqual([expected(self.messages[0])], emails)
+        self.assertEqual([self.ids[1]], self.server.unread())
+
+    def test_rate_limited_fetches_are_reported(self) -> None:
+        third = self.deliver()
+        # Listed newest first, so the second batch is refused.
+        self.server.failing[self.ids[1]] = 429
+        poller = self.poller(batch_size=1)
+
+        emails = poller.poll()
+
+        self.assertEqual([third], [email.id for email in emails])
+        assert poller.last_error is not None
+        self.assertEqual(429, http_status(poller.last_error))
+        # No further batches are sent once Gmail pushes back.
+        self.assertEqual(2, self.server.calls["users.messages.get"])
+        self.assertEqual(self.ids, self.server.unread())
+
+        self.server.failing.clear()
+        self.assertEqual(self.ids[::-1], [email.id for email in poller.poll()])
+        self.assertIsNone(poller.last_error)
+
+    def test_failed_fetch_batches_are_reported(self) -> None:
+        self.server.failing["users.messages.get"] = 429
+        poller = self.poller()
+
+        self.assertEqual([], poller.poll())
+
+        assert poller.last_error is not None
+        self.assertEqual(429, http_status(poller.last_error))
+        self.assertEqual(self.ids, self.server.unread())
+
+    def test_poll_handles_errors(self) -> None:
+        poller = self.poller()
+        self.server.failing["users.messages.list"] = 500
+
+        emails = poller.poll(SENDER)
+
+        self.assertEqual([], emails)
+        self.assertEqual(1, self.server.http_requests)
+        assert poller.last_error is not None
+        self.assertEqual(500, http_status(poller.last_error))
+
+        self.server.failing.clear()
+        poller.poll()
+        self.assertIsNone(poller.last_error)
+
+    def test_error_helpers_read_status_and_retry_after(self) -> None:
+        error = HttpError(httplib2.Response({"status": 429, "retry-after": "30"}), b"")
+
+        self.assertEqual(429, http_status(error))
+        self.assertEqual(30.0, retry_after(error))
+        self.assertIsNone(retry_after(OSError("boom")))
+        self.assertIsNone(http_status(OSError("boom")))
+
+    def test_incremental_poll_uses_history(self) -> None:
+        poller = self.poller(incremental=True)
+        self.assertEqual(self.ids[::-1], [email.id for email in poller.poll()])
+
+        new = self.server.deliver(SENDER)
+        emails = poller.poll()
+
+        self.assertEqual([expected(new)], emails)
+        self.assertEqual(1, self.server.calls["users.messages.list"])
+        self.assertEqual(str(self.server.history_id), poller.history_id)
+
+    def test_incremental_poll_filters_sender(self) -> None:
+        poller = self.poller(incremental=True)
+        poller.poll(SENDER)
+
+        other = self.deliver("Other <other@example.com>")
+        match = self.deliver("Sender <SENDER@example.com>")
+        emails = poller.poll(SENDER)
+
+        self.assertEqual([match], [email.id for email in emails])
+        self.assertIn(other, self.server.unread())
+
+    def test_incremental_cursor_belongs_to_its_sender(self) -> None:
+        store = MessageStore()
+        self.addCleanup(store.close)
+        self.poller(incremental=True, store=store).poll(SENDER)
+        other = self.deliver("other@example.com")
+        self.assertEqual([], self.poller(incremental=True, store=store).poll(SENDER))
+
+        # The cursor was built with a sender filter, so every sender needs a
+        # full listing to find the dropped message.
+        poller = self.poller(incremental=True, store=store)
+        self.assertEqual([other], [email.id for email in poller.poll()])
+        self.assertEqual(2, self.server.calls["users.messages.list"])
+        self.assertEqual("", store.get_cursor("history_sender"))
+
+    def test_incremental_poll_falls_back_when_history_expires(self) -> None:
+        poller = self.poller(incremental=True)
+        poller.poll()
+
+        new = self.deliver()
+        self.server.expire_history()
+        emails = poller.poll()
+
+        self.assertEqual([new], [email.id for email in emails])
+        self.assertEqual(2, self.server.calls["users.messages.list"])
+        self.assertEqual(str(self.server.history_id), poller.history_id)
+
+    def test_incremental_poll_retries_failed_fetches(self) -> None:
+        poller = self.poller(incremental=True)
+        poller.poll()
+        new = self.deliver()
+        self.server.failing[new] = 500
+
+        self.assertEqual([], poller.poll())
+        self.assertIn(new, self.server.unread())
+
+        self.server.failing.clear()
+        self.assertEqual([new], [email.id for email in poller.poll()])
+        self.assertNotIn(new, self.server.unread())
+        self.assertEqual([], poller.poll())
+        self.assertEqual(1, self.server.calls["users.messages.list"])
+
+    def test_incremental_poll_retries_unacknowledged_messages(self) -> None:
+        poller = self.poller(incremental=True)
+        poller.poll()
+        first, second = self.deliver(), self.deliver()
+
+        handled = list(poller.iter_unread(ack=False))
+        poller.acknowledge([handled[1].id])
+
+        self.assertEqual([first], [email.id for email in poller.iter_unread()])
+        self.assertEqual([], poller.poll())
+        self.assertNotIn(second, self.server.unread())
+
+    def test_incremental_retries_survive_restart(self) -> None:
+        store = MessageStore()
+        self.addCleanup(store.close)
+        self.poller(incremental=True, store=store).poll()
+        new = self.deliver()
+        self.server.failing[new] = 500
+        self.poller(incremental=True, store=store).poll()
+
+        self.server.failing.clear()
+        restarted = self.poller(incremental=True, store=store)
+
+        self.assertEqual([new], [email.id for email in restarted.poll()])
+        self.assertEqual([], store.pending_ids())
+
+    def test_incremental_poll_drops_deleted_messages(self) -> None:
+        poller = self.poller(incremental=True)
+        poller.poll()
+        new = self.deliver()
+        self.server.failing[new] = 404
+        poller.poll()
+
+        self.server.failing.clear()
+        before = self.server.http_requests
+        self.assertEqual([], poller.poll())
+        # Only the history call; the deleted message is not fetched again.
+        self.assertEqual(1, self.server.http_requests - before)
 
+    def test_deferred_ack_marks_read_only_when_acknowledged(self) -> None:
+        store = MessageStore()
+        self.addCleanup(store.close)
+        poller = self.poller(store=store)
+
+        emails = list(poller.iter_unread(ack=False))
+        self.assertNotIn("users.messages.batchModify", self.server.calls)
+
+        poller.acknowledge([emails[0].id])
+
+        self.assertEqual([emails[1].id], self.server.unread())
+        self.assertEqual([emails[1].id], store.filter_unseen(self.ids))
+
+    def test_store_skips_processed_messages_without_marking_read(self) -> None:
+        store = MessageStore()
+        self.addCleanup(store.close)
+        poller = self.poller(store=store, mark_read=False)
+        self.assertEqual(self.ids[::-1], [email.id for email in poller.poll()])
+
+        new = self.deliver()
+        emails = poller.poll()
+
+        self.assertEqual([new], [email.id for email in emails])
+        self.assertNotIn("users.messages.batchModify", self.server.calls)
+        self.assertEqual(3, len(self.server.unread()))
+
+    def test_store_resumes_incremental_sync_after_restart(self) -> None:
+        store = MessageStore()
+        self.addCleanup(store.close)
+        self.poller(incremental=True, store=store).poll()
+
+        new = self.deliver()
+        restarted = self.poller(incremental=True, store=store)
+        emails = restarted.poll()
+
+        self.assertEqual([new], [email.id for email in emails])
+        self.assertEqual(1, self.server.calls["users.messages.list"])
+        self.assertEqual(str(self.server.history_id), store.get_cursor("history_id"))
+
+    def get_params(self) -> List[dict]:
+        """Return the query parameters of every ``messages.get`` call."""
+        return [q for name, q in self.server.requests if name == "users.messages.get"]
+
+    def test_default_profile_requests_masked_metadata(self) -> None:
+        self.poller().poll()
+
+        params = self.get_params()[0]
+        self.assertEqual(["metadata"], params["format"])
+        self.assertEqual(["From", "Subject", "Date"], params["metadataHeaders"])
         self.assertEqual(
-            [
-                Email(id="1", snippet="snippet 1"),
-                Email(id="2", snippet="snippet 2"),
-            ],
-            emails,
+            ["id,threadId,labelIds,snippet,payload/headers"], params["fields"]
         )
-        self.assertEqual(2, self.messages.modify.call_count)
-        self.messages.modify.assert_any_call(
-            userId="me", id="1", body={"removeLabelIds": ["UNREAD"]}
+
+    def test_minimal_profile_skips_headers_unless_filtering(self) -> None:
+        poller = self.poller(incremental=True, profile=FetchProfile("minimal"))
+        # A full listing filters by sender with its query.
+        emails = poller.poll(SENDER)
+        self.assertIsNone(emails[0].headers)
+
+        self.deliver("other@example.com")
+        match = self.deliver()
+        emails = poller.poll(SENDER)
+
+        # History results need the From header to be filtered by sender.
+        self.assertEqual([match], [email.id for email in emails])
+        self.assertEqual(["metadata"], self.get_params()[-1]["format"])
+
+    def test_full_profile_parses_body_and_attachments(self) -> None:
+        message = self.server.deliver(SENDER, attachments=[("report.pdf", b"pdf")])
+        poller = self.poller(profile=FetchProfile("full"))
+
+        email = poller.poll()[0]
+
+        self.assertEqual(message.id, email.id)
+        self.assertEqual(message.body, email.body)
+        self.assertEqual(["From", "Subject", "Date"], list(email.headers or {}))
+        assert email.attachments is not None
+        self.assertEqual("report.pdf", email.attachments[0].filename)
+        self.assertEqual("application/pdf", email.attachments[0].mime_type)
+
+    def test_body_and_attachments_load_lazily(self) -> None:
+        message = self.server.deliver(SENDER, attachments=[("report.pdf", b"pdf")])
+        poller = self.poller()
+        email = poller.poll()[0]
+        self.assertIsNone(email.body)
+        self.assertNotIn("body", email.to_dict())
+
+        poller.load_body(email)
+
+        self.assertEqual(message.body, email.body)
+        assert email.attachments is not None
+        data = poller.load_attachment(email, email.attachments[0])
+        self.assertEqual(b"pdf", data)
+
+        trips = self.server.http_requests
+        again = poller.load_attachment(email, email.attachments[0])
+        self.assertEqual(trips, self.server.http_requests)
+        self.assertIs(data.obj, again.obj)
+
+    def test_fetched_messages_and_bodies_are_indexed(self) -> None:
+        index = MailIndex()
+        self.addCleanup(index.close)
+        poller = self.poller(index=index)
+        email = poller.poll()[0]
+
+        found = index.search(sender=SENDER)
+        self.assertEqual(
+            self.ids[::-1], [message["id"] for message in found["messages"]]
         )
-        self.messages.modify.assert_any_call(
-            userId="me", id="2", body={"removeLabelIds": ["UNREAD"]}
+        self.assertEqual(0, index.search(query="body")["count"])
+
+        poller.load_body(email)
+        trips = self.server.http_requests
+        self.assertEqual(
+            [email.id], [m["id"] for m in index.search(query="body")["messages"]]
         )
+        self.assertEqual(trips, self.server.http_requests)
 
-    def test_poll_handles_errors(self) -> None:
-        poller = GmailPoller(service=self.service)
-        self.messages.list.return_value.execute.side_effect = OSError("boom")
+    def test_calls_are_charged_to_the_quota_limiter(self) -> None:
+        sleeps: List[float] = []
+        limiter = QuotaLimiter(40, clock=lambda: 0.0, sleep=sleeps.append)
+        poller = self.poller(incremental=True, limiter=limiter)
+        poller.poll()
+        self.deliver()
+        poller.poll()
 
-        emails = poller.poll("sender@example.com")
+        self.assertEqual(
+            {
+                "users.getProfile": 1,
+                "users.messages.list": 5,
+                "users.messages.get": 15,
+                "users.messages.batchModify": 100,
+                "users.history.list": 2,
+            },
+            limiter.stats()["units_by_method"],
+        )
+        self.assertEqual(123, poller.units)
+        # The first batchModify overdrew the 40 unit bucket; later calls wait
+        # until it is paid back.
+        self.assertEqual([0.65, 0.7, 0.825, 2.075], [round(s, 3) for s in sleeps])
+        self.assertIsNone(self.poller().limiter)
 
-        self.assertEqual([], emails)
-        self.messages.get.assert_not_called()
+    def test_metrics_time_calls_by_method(self) -> None:
+        metrics = Metrics()
+        self.poller(metrics=metrics).poll()
+
+        snapshot = metrics.snapshot()
+        counts = {
+            name: histogram["count"]
+            for name, histogram in snapshot["histograms"].items()
+        }
+        self.assertEqual(
+            {
+                'gmail_request_seconds{method="users.messages.list"}': 1,
+                'gmail_request_seconds{method="users.messages.get"}': 1,
+                'gmail_request_seconds{method="users.messages.batchModify"}': 1,
+            },
+            counts,
+        )
+        self.assertEqual(2, snapshot["counters"]["gmail_messages_fetched_total"])
+
+    def test_email_is_compact_and_serializes_set_fields(self) -> None:
+        self.server.reset(0)
+        message = self.server.deliver(SENDER, attachments=[("report.pdf", b"pdf")])
+        email = self.poller(profile=FetchProfile("full")).poll()[0]
+
+        self.assertFalse(hasattr(email, "__dict__"))
+        encoded = base64.urlsafe_b64encode(message.body.encode()).decode()
+        self.assertEqual((encoded.rstrip("="),), email.encoded_body)
+        self.assertEqual(
+            {
+                "id": message.id,
+                "snippet": message.snippet,
+                "thread_id": message.thread_id,
+                "label_ids": ["INBOX", "UNREAD"],
+                "headers": {
+                    "From": SENDER,
+                    "Subject": message.subject,
+                    "Date": format_datetime(message.date),
+                },
+                "body": message.body,
+                "attachments": [
+                    {
+                        "attachment_id": f"{message.id}.0",
+                        "filename": "report.pdf",
+                        "mime_type": "application/pdf",
+                        "size": 3,
+                    }
+                ],
+            },
+            email.to_dict(),
+        )
 
     def test_poll_kernel_function(self) -> None:
-        poller = GmailPoller(service=self.service)
+        poller = self.poller()
         kernel = sk.Kernel()
         kernel.add_function(
             plugin_name="gmail", function=poller.poll, function_name="poll"
@@ -73,15 +485,75 @@ class GmailPollerTest(TestCase):
             kernel.invoke(
                 function_name="poll",
                 plugin_name="gmail",
-                sender="sender@example.com",
+                sender=SENDER,
             )
         )
         emails = result.value if result else []
 
-        self.assertEqual(
-            [
-                Email(id="1", snippet="snippet 1"),
-                Email(id="2", snippet="snippet 2"),
-            ],
-            emails,
+        self.assertEqual([expected(m) for m in reversed(self.messages)], emails)
+
+
+class AuthCacheTest(TestCase):
+    def setUp(self) -> None:
+        clear_auth_cache()
+        self.addCleanup(clear_auth_cache)
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.token_path = Path(tmpdir.name) / "token.json"
+
+    def write_token(self, expires_in: timedelta) -> None:
+        expiry = datetime.now(timezone.utc) + expires_in
+        self.token_path.write_text(
+            json.dumps(
+                {
+                    "token": "old",
+                    "refresh_token": "refresh",
+                    "client_id": "client",
+                    "client_secret": "secret",
+                    "expiry": expiry.strftime("%Y-%m-%dT%H:%M:%SZ"),
+                }
+            )
         )
+
+    def test_pollers_share_thread_safe_service_for_token(self) -> None:
+        self.write_token(timedelta(hours=1))
+
+        first = GmailPoller(token_path=self.token_path, transport=PooledHttp)
+        second = GmailPoller(token_path=self.token_path, transport=PooledHttp)
+
+        self.assertIs(first.service, second.service)
+
+    def test_pollers_do_not_share_httplib2_service(self) -> None:
+        self.write_token(timedelta(hours=1))
+
+        first = GmailPoller(token_path=self.token_path)
+        second = GmailPoller(token_path=self.token_path)
+
+        self.assertIsNot(first.service, second.service)
+
+    def test_expiring_token_is_refreshed_once(self) -> None:
+        self.write_token(timedelta(minutes=1))
+        refreshes = []
+
+        def refresh(creds: Credentials, request: Any) -> None:
+            refreshes.append(request)
+            time.sleep(0.05)
+            creds.token = "new"
+            creds.expiry = datetime.now(timezone.utc).replace(tzinfo=None) + timedelta(
+                hours=1
+            )
+
+        with mock.patch.object(Credentials, "refresh", autospec=True) as patched:
+            patched.side_effect = refresh
+            threads = [
+                threading.Thread(target=get_credentials, args=(self.token_path,))
+                for _ in range(5)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(1, len(refreshes))
+        self.assertEqual("new", get_credentials(self.token_path).token)
+        self.assertEqual("new", json.loads(self.token_path.read_text())["token"])
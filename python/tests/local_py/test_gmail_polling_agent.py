@@ -1,10 +1,17 @@
 """Tests for the asynchronous Gmail polling agent using mocks."""
 
 import asyncio
+import threading
 from unittest import IsolatedAsyncioTestCase
 from unittest.mock import AsyncMock, MagicMock, patch
 
+from local_py.email_pipeline import EmailHandler, EmailPipeline, LoggingHandler
+from local_py.gmail_poller import Email, GmailPoller
 from local_py.gmail_polling_agent import GmailPollingAgent
+from local_py.gmail_quota import QuotaLimiter
+from local_py.metrics import Metrics
+from local_py.polling_policy import PollingPolicy
+from testing.fake_gmail import FakeGmailServer
 
 
 class GmailPollingAgentTest(IsolatedAsyncioTestCase):
@@ -13,7 +20,7 @@ class GmailPollingAgentTest(IsolatedAsyncioTestCase):
     async def test_run_polls_until_cancelled(self) -> None:
         """Poll until cancellation to ensure repeated execution."""
         poller = MagicMock()
-        poller.poll.return_value = []
+        poller.iter_unread.return_value = []
 
         agent = GmailPollingAgent(poller)
         task = asyncio.create_task(agent.run(interval=0))
@@ -21,12 +28,13 @@ class GmailPollingAgentTest(IsolatedAsyncioTestCase):
         task.cancel()
         with self.assertRaises(asyncio.CancelledError):
             await task
-        self.assertGreaterEqual(poller.poll.call_count, 1)
+        self.assertGreaterEqual(poller.iter_unread.call_count, 1)
+        poller.iter_unread.assert_called_with(sender=None, ack=True)
 
     async def test_run_uses_provided_interval(self) -> None:
         """Override default interval when provided at run time."""
         poller = MagicMock()
-        poller.poll.return_value = []
+        poller.iter_unread.return_value = []
 
         agent = GmailPollingAgent(poller, interval=10)
         sleep_mock = AsyncMock(side_effect=asyncio.CancelledError())
@@ -34,3 +42,180 @@ class GmailPollingAgentTest(IsolatedAsyncioTestCase):
             with self.assertRaises(asyncio.CancelledError):
                 await agent.run(interval=2)
         sleep_mock.assert_awaited_with(2)
+
+    async def test_run_handles_streamed_emails_before_failure(self) -> None:
+        """Log emails as they stream in and keep polling after an error."""
+
+        def stream(sender=None, ack=True):
+            yield Email(id="1", snippet="first")
+            raise OSError("boom")
+
+        poller = MagicMock()
+        poller.iter_unread.side_effect = stream
+
+        agent = GmailPollingAgent(poller)
+        sleep_mock = AsyncMock(side_effect=asyncio.CancelledError())
+        with patch("local_py.gmail_polling_agent.asyncio.sleep", sleep_mock):
+            with self.assertLogs(level="INFO") as logs:
+                with self.assertRaises(asyncio.CancelledError):
+                    await agent.run(interval=1)
+        self.assertIn("INFO:root:New email 1: first", logs.output)
+        self.assertIn("WARNING:root:Failed to poll Gmail: boom", logs.output)
+
+    async def test_run_consumes_async_poller_natively(self) -> None:
+        """Iterate an async poller's stream directly on the event loop."""
+        handled: list[str] = []
+
+        async def stream(sender=None, ack=True):
+            yield Email(id="1", snippet="first")
+            handled.append("1")
+
+        poller = MagicMock()
+        poller.iter_unread.side_effect = stream
+
+        agent = GmailPollingAgent(poller)
+        sleep_mock = AsyncMock(side_effect=asyncio.CancelledError())
+        with patch("local_py.gmail_polling_agent.asyncio.sleep", sleep_mock):
+            with self.assertRaises(asyncio.CancelledError):
+                await agent.run(interval=1)
+        self.assertEqual(["1"], handled)
+
+    async def test_run_offloads_blocking_poller(self) -> None:
+        """Advance blocking pollers outside the event loop thread."""
+        threads: list[int] = []
+
+        def stream(sender=None, ack=True):
+            threads.append(threading.get_ident())
+            yield Email(id="1", snippet="first")
+
+        poller = MagicMock()
+        poller.iter_unread.side_effect = stream
+
+        agent = GmailPollingAgent(poller)
+        sleep_mock = AsyncMock(side_effect=asyncio.CancelledError())
+        with patch("local_py.gmail_polling_agent.asyncio.sleep", sleep_mock):
+            with self.assertRaises(asyncio.CancelledError):
+                await agent.run(interval=1)
+        self.assertEqual(1, len(threads))
+        self.assertNotEqual(threading.get_ident(), threads[0])
+
+    async def test_run_sleeps_for_policy_delay(self) -> None:
+        """Feed each poll's outcome to the policy and sleep for its delay."""
+        error = OSError("boom")
+        poller = MagicMock()
+        poller.iter_unread.side_effect = [
+            [Email(id="1", snippet=""), Email(id="2", snippet="")],
+            error,
+        ]
+        policy = MagicMock(spec=PollingPolicy)
+        policy.next_delay.side_effect = [7, 42]
+
+        agent = GmailPollingAgent(poller, policy=policy)
+        sleep_mock = AsyncMock(side_effect=[None, asyncio.CancelledError()])
+        with patch("local_py.gmail_polling_agent.asyncio.sleep", sleep_mock):
+            with self.assertRaises(asyncio.CancelledError):
+                await agent.run()
+
+        policy.next_delay.assert_any_call(2, None)
+        policy.next_delay.assert_any_call(0, error)
+        self.assertEqual([7, 42], [c.args[0] for c in sleep_mock.await_args_list])
+
+    async def test_run_paces_polls_below_quota_rate(self) -> None:
+        """Wait longer than the policy asks while the last poll's units refill."""
+        limiter = QuotaLimiter(10, clock=lambda: 0.0)
+
+        def stream(sender=None, ack=True):
+            limiter.reserve("users.messages.batchModify")
+            poller.units += 50
+            # Another poller on the same token spends from the shared bucket.
+            limiter.reserve("users.history.list")
+            return []
+
+        poller = MagicMock()
+        poller.limiter = limiter
+        poller.units = 0
+        poller.iter_unread.side_effect = stream
+
+        agent = GmailPollingAgent(poller)
+        sleep_mock = AsyncMock(side_effect=[None, asyncio.CancelledError()])
+        with patch("local_py.gmail_polling_agent.asyncio.sleep", sleep_mock):
+            with self.assertRaises(asyncio.CancelledError):
+                await agent.run(interval=1)
+
+        # Only this poller's units count towards its pace, but the other
+        # poller's leave the shared bucket 52 units in debt, then 104.
+        self.assertEqual(50, agent.last_poll_units)
+        self.assertEqual(
+            [5.2, 10.4], [round(c.args[0], 3) for c in sleep_mock.await_args_list]
+        )
+
+    async def test_metrics_record_polls_and_loop_lag(self) -> None:
+        """Record poll duration, messages per poll, failures and loop lag."""
+        poller = MagicMock()
+        poller.iter_unread.side_effect = [
+            [Email(id="1", snippet=""), Email(id="2", snippet="")],
+            OSError("boom"),
+        ]
+        metrics = Metrics()
+
+        agent = GmailPollingAgent(poller, metrics=metrics)
+        sleep_mock = AsyncMock(side_effect=[None, asyncio.CancelledError()])
+        with patch("local_py.gmail_polling_agent.asyncio.sleep", sleep_mock):
+            with self.assertRaises(asyncio.CancelledError):
+                await agent.run(interval=0)
+
+        snapshot = metrics.snapshot()
+        histograms = snapshot["histograms"]
+        self.assertEqual(1, histograms["poll_messages"]["count"])
+        self.assertEqual(2, histograms["poll_messages"]["sum"])
+        self.assertEqual(2, histograms["poll_seconds"]["count"])
+        self.assertEqual(1, histograms["poll_loop_lag_seconds"]["count"])
+        self.assertEqual({"poll_errors_total": 1}, snapshot["counters"])
+
+    async def test_pipeline_acknowledges_after_handling(self) -> None:
+        poller = MagicMock()
+        poller.iter_unread.return_value = [
+            Email(id="1", snippet="first"),
+            Email(id="2", snippet="second"),
+        ]
+        agent = GmailPollingAgent(
+            poller, pipeline=EmailPipeline([LoggingHandler()], workers=2)
+        )
+
+        with self.assertLogs(level="INFO"):
+            count = await agent.poll_once()
+
+        self.assertEqual(2, count)
+        poller.iter_unread.assert_called_once_with(sender=None, ack=False)
+        poller.acknowledge.assert_called_once_with(["1", "2"])
+
+    async def test_failed_handler_is_retried_by_incremental_poller(self) -> None:
+        server = FakeGmailServer(2).start()
+        self.addCleanup(server.stop)
+        poller = GmailPoller(service=server.service(), incremental=True)
+        poller.poll()
+        handled: list[str] = []
+
+        class FlakyHandler(EmailHandler):
+            fail = True
+
+            async def handle(self, email: Email) -> None:
+                if self.fail:
+                    raise OSError("handler down")
+                handled.append(email.id)
+
+        handler = FlakyHandler()
+        agent = GmailPollingAgent(poller, pipeline=EmailPipeline([handler]))
+        message = server.deliver()
+
+        with self.assertLogs(level="WARNING"):
+            await agent.poll_once()
+        self.assertEqual([], handled)
+        self.assertIn("UNREAD", message.labels)
+
+        handler.fail = False
+        await agent.poll_once()
+
+        self.assertEqual([message.id], handled)
+        self.assertNotIn("UNREAD", message.labels)
+        self.assertEqual(1, server.calls["users.messages.list"])
@@ -0,0 +1,125 @@
+"""Tests for push-based Gmail delivery using a local notification sender."""
+
+import asyncio
+import base64
+import json
+from unittest import IsolatedAsyncioTestCase
+from unittest.mock import MagicMock
+
+import aiohttp
+
+from local_py.gmail_poller import Email
+from local_py.gmail_polling_agent import GmailPollingAgent
+from local_py.gmail_push import GmailPushAgent, PushNotificationReceiver
+from local_py.polling_policy import PollingPolicy
+
+
+def envelope(history_id: str) -> dict:
+    """Return a Pub/Sub push body like the ones Gmail notifications produce."""
+    data = json.dumps({"emailAddress": "me@example.com", "historyId": history_id})
+    return {
+        "message": {
+            "data": base64.b64encode(data.encode()).decode(),
+            "messageId": history_id,
+        },
+        "subscription": "projects/p/subscriptions/s",
+    }
+
+
+class GmailPushAgentTest(IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.receiver = PushNotificationReceiver(port=0, token="secret")
+        await self.receiver.start()
+        self.addAsyncCleanup(self.receiver.stop)
+        self.url = f"http://127.0.0.1:{self.receiver.port}/gmail/push"
+        self.session = aiohttp.ClientSession()
+        self.addAsyncCleanup(self.session.close)
+
+    async def post(self, body: object, token: str = "secret") -> int:
+        async with self.session.post(
+            self.url, params={"token": token}, json=body
+        ) as response:
+            return response.status
+
+    async def start(self, push: GmailPushAgent) -> None:
+        task = asyncio.create_task(push.run())
+
+        async def cancel() -> None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+        self.addAsyncCleanup(cancel)
+
+    async def wait_for_calls(self, mock: MagicMock, count: int) -> None:
+        for _ in range(200):
+            if mock.call_count >= count:
+                return
+            await asyncio.sleep(0.01)
+        self.fail(f"expected {count} calls, got {mock.call_count}")
+
+    async def test_notification_triggers_fetch(self) -> None:
+        poller = MagicMock()
+        poller.watch.return_value = {"historyId": "1", "expiration": "0"}
+        poller.iter_unread.side_effect = lambda sender=None, ack=True: iter(
+            [Email(id="1", snippet="hi")]
+        )
+        push = GmailPushAgent(
+            GmailPollingAgent(poller),
+            self.receiver,
+            topic_name="projects/p/topics/gmail",
+            safety_interval=60,
+        )
+        await self.start(push)
+
+        # The initial catch-up fetch runs right after the watch is registered.
+        await self.wait_for_calls(poller.iter_unread, 1)
+        poller.watch.assert_called_once_with("projects/p/topics/gmail")
+
+        self.assertEqual(204, await self.post(envelope("42")))
+        await self.wait_for_calls(poller.iter_unread, 2)
+        assert self.receiver.last_notification is not None
+        self.assertEqual("42", self.receiver.last_notification["historyId"])
+
+    async def test_safety_poll_runs_without_notifications(self) -> None:
+        poller = MagicMock()
+        poller.watch.return_value = {}
+        poller.iter_unread.return_value = []
+        push = GmailPushAgent(
+            GmailPollingAgent(poller),
+            self.receiver,
+            topic_name="projects/p/topics/gmail",
+            safety_interval=0.01,
+        )
+        await self.start(push)
+
+        await self.wait_for_calls(poller.iter_unread, 3)
+        self.assertEqual(1, poller.watch.call_count)
+
+    async def test_failed_fetch_waits_for_policy_delay(self) -> None:
+        """Notifications during the policy's backoff do not trigger a fetch."""
+        poller = MagicMock()
+        poller.watch.return_value = {}
+        poller.iter_unread.side_effect = RuntimeError("429 rate limited")
+        policy = MagicMock(spec=PollingPolicy)
+        policy.next_delay.return_value = 60.0
+        push = GmailPushAgent(
+            GmailPollingAgent(poller, policy=policy),
+            self.receiver,
+            topic_name="projects/p/topics/gmail",
+            safety_interval=0.01,
+        )
+        await self.start(push)
+
+        await self.wait_for_calls(poller.iter_unread, 1)
+        self.assertEqual(204, await self.post(envelope("42")))
+        await asyncio.sleep(0.1)
+
+        self.assertEqual(1, poller.iter_unread.call_count)
+        count, error = policy.next_delay.call_args.args
+        self.assertEqual(0, count)
+        self.assertIsInstance(error, RuntimeError)
+
+    async def test_rejects_bad_token_and_malformed_bodies(self) -> None:
+        self.assertEqual(403, await self.post(envelope("1"), token="wrong"))
+        self.assertEqual(400, await self.post({"message": {}}))
+        self.assertIsNone(self.receiver.last_notification)
@@ -0,0 +1,91 @@
+"""Tests for the Gmail quota limiter."""
+
+import tempfile
+from pathlib import Path
+from typing import List
+from unittest import TestCase
+
+from local_py.gmail_quota import (
+    DEFAULT_METHOD_UNITS,
+    QuotaLimiter,
+    get_limiter,
+    quota_units,
+)
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class QuotaLimiterTest(TestCase):
+    def setUp(self) -> None:
+        self.clock = FakeClock()
+        self.sleeps: List[float] = []
+        self.limiter = QuotaLimiter(100, clock=self.clock, sleep=self.sleeps.append)
+
+    def test_units_per_method(self) -> None:
+        self.assertEqual(5, quota_units("users.messages.get"))
+        self.assertEqual(50, quota_units("users.messages.batchModify"))
+        self.assertEqual(DEFAULT_METHOD_UNITS, quota_units("users.drafts.create"))
+
+    def test_calls_wait_once_the_burst_is_spent(self) -> None:
+        for _ in range(20):
+            self.assertEqual(0, self.limiter.acquire("users.messages.list"))
+        self.assertEqual([], self.sleeps)
+
+        self.assertAlmostEqual(0.05, self.limiter.acquire("users.messages.get"))
+        self.assertEqual([0.05], self.sleeps)
+
+        self.clock.now = 1.05
+        self.assertEqual(0, self.limiter.acquire("users.messages.get", 19))
+
+    def test_call_larger_than_burst_delays_later_calls(self) -> None:
+        # A batch of 100 messages.get costs 500 units.
+        self.assertEqual(4, self.limiter.reserve("users.messages.get", 100))
+        self.assertAlmostEqual(4.01, self.limiter.reserve("users.getProfile"))
+
+    def test_delay_hints_when_units_are_available(self) -> None:
+        self.assertEqual(0, self.limiter.delay(60))
+        self.limiter.reserve("users.messages.batchModify")
+
+        self.assertAlmostEqual(0.1, self.limiter.delay(60))
+        # Never more than a full bucket needs to be waited for.
+        self.assertAlmostEqual(0.5, self.limiter.delay(1000))
+        self.clock.now = 0.5
+        self.assertEqual(0, self.limiter.delay(100))
+
+    def test_stats_report_usage(self) -> None:
+        self.limiter.acquire("users.messages.list")
+        self.limiter.acquire("users.messages.get", 30)
+
+        self.assertEqual(
+            {
+                "calls": 31,
+                "units": 155,
+                "throttled": 1,
+                "wait_seconds": 0.55,
+                "available": -55,
+                "units_by_method": {
+                    "users.messages.list": 5,
+                    "users.messages.get": 150,
+                },
+            },
+            self.limiter.stats(),
+        )
+        self.assertEqual(155, self.limiter.units)
+
+    def test_rejects_invalid_settings(self) -> None:
+        with self.assertRaises(ValueError):
+            QuotaLimiter(0)
+        with self.assertRaises(ValueError):
+            QuotaLimiter(10, burst=0)
+
+    def test_limiter_is_shared_per_token(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp:
+            token = Path(tmp) / "token.json"
+            self.assertIs(get_limiter(token), get_limiter(str(token)))
+            self.assertIsNot(get_limiter(token), get_limiter(Path(tmp) / "other.json"))
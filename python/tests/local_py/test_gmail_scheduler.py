@@ -0,0 +1,159 @@
+"""Tests for the multi-mailbox Gmail scheduler."""
+
+import asyncio
+import json
+import random
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List
+from unittest import IsolatedAsyncioTestCase, TestCase
+
+from local_py.gmail_poller import Email
+from local_py.gmail_scheduler import (
+    GmailScheduler,
+    MailboxConfig,
+    load_mailbox_configs,
+)
+
+
+class BlockingPoller:
+    """Poller whose stream blocks like an HTTP call and records concurrency."""
+
+    lock = threading.Lock()
+    active = 0
+    max_active = 0
+
+    def __init__(self, name: str, delay: float = 0.0, fail: bool = False) -> None:
+        self.name = name
+        self.delay = delay
+        self.fail = fail
+        self.calls = 0
+
+    def iter_unread(self, sender=None, *, ack=True):
+        cls = type(self)
+        with cls.lock:
+            cls.active += 1
+            cls.max_active = max(cls.max_active, cls.active)
+        try:
+            self.calls += 1
+            time.sleep(self.delay)
+            if self.fail:
+                raise OSError("boom")
+        finally:
+            with cls.lock:
+                cls.active -= 1
+        yield Email(id=f"{self.name}-{self.calls}", snippet="")
+
+
+class LoadMailboxConfigsTest(TestCase):
+    def test_resolves_relative_token_paths(self) -> None:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "mailboxes.json"
+            path.write_text(
+                json.dumps(
+                    [
+                        {"name": "work", "token_path": "work.json", "interval": 30},
+                        {
+                            "name": "home",
+                            "token_path": "/abs/home.json",
+                            "sender": "a@example.com",
+                        },
+                    ]
+                )
+            )
+
+            configs = load_mailbox_configs(path)
+
+        self.assertEqual(Path(tmpdir) / "work.json", configs[0].token_path)
+        self.assertEqual(30, configs[0].interval)
+        self.assertEqual(Path("/abs/home.json"), configs[1].token_path)
+        self.assertEqual("a@example.com", configs[1].sender)
+
+    def test_rejects_duplicate_names(self) -> None:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "mailboxes.json"
+            entry = {"name": "dup", "token_path": "t.json"}
+            path.write_text(json.dumps([entry, entry]))
+            with self.assertRaises(ValueError):
+                load_mailbox_configs(path)
+
+
+class GmailSchedulerTest(IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        BlockingPoller.active = 0
+        BlockingPoller.max_active = 0
+
+    async def run_for(self, scheduler: GmailScheduler, seconds: float) -> None:
+        task = asyncio.create_task(scheduler.run())
+        await asyncio.sleep(seconds)
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+
+    async def test_polls_each_mailbox_with_bounded_workers(self) -> None:
+        pollers: Dict[str, BlockingPoller] = {}
+
+        def factory(config: MailboxConfig) -> BlockingPoller:
+            pollers[config.name] = BlockingPoller(config.name, delay=0.02)
+            return pollers[config.name]
+
+        configs: List[MailboxConfig] = [
+            MailboxConfig(name=f"box{i}", token_path=Path("t.json"), interval=0.01)
+            for i in range(6)
+        ]
+        scheduler = GmailScheduler(
+            configs, max_workers=2, poller_factory=factory, rng=random.Random(0)
+        )
+
+        await self.run_for(scheduler, 0.3)
+
+        self.assertEqual(2, BlockingPoller.max_active)
+        report = scheduler.lag_report()
+        for config in configs:
+            self.assertGreaterEqual(pollers[config.name].calls, 1)
+            self.assertEqual(report[config.name].polls, report[config.name].messages)
+        # Six mailboxes sharing two workers must wait for a free slot.
+        self.assertGreater(max(stats.max_lag for stats in report.values()), 0.0)
+
+    async def test_counts_errors_per_mailbox(self) -> None:
+        def factory(config: MailboxConfig) -> BlockingPoller:
+            return BlockingPoller(config.name, fail=config.name == "bad")
+
+        configs = [
+            MailboxConfig(name="good", token_path=Path("t.json"), interval=0.01),
+            MailboxConfig(name="bad", token_path=Path("t.json"), interval=0.01),
+        ]
+        scheduler = GmailScheduler(configs, poller_factory=factory)
+
+        with self.assertLogs(level="WARNING"):
+            await self.run_for(scheduler, 0.1)
+
+        report = scheduler.lag_report()
+        self.assertEqual(0, report["good"].errors)
+        self.assertGreater(report["good"].messages, 0)
+        self.assertEqual(report["bad"].polls, report["bad"].errors)
+        self.assertEqual(0, report["bad"].messages)
+
+    def test_jitter_spreads_intervals(self) -> None:
+        config = MailboxConfig(
+            name="box", token_path=Path("t.json"), interval=10, jitter=0.2
+        )
+        scheduler = GmailScheduler(
+            [config], poller_factory=lambda c: None, rng=random.Random(1)
+        )
+
+        delays = {scheduler._next_delay(config, 0, None) for _ in range(20)}
+
+        self.assertGreater(len(delays), 1)
+        self.assertTrue(all(8 <= delay <= 12 for delay in delays))
+
+    def test_adaptive_mailbox_uses_adaptive_policy(self) -> None:
+        config = MailboxConfig(
+            name="box", token_path=Path("t.json"), interval=30, jitter=0, adaptive=True
+        )
+        scheduler = GmailScheduler([config], poller_factory=lambda c: None)
+
+        self.assertEqual(5.0, scheduler._next_delay(config, 3, None))
+        self.assertEqual(10.0, scheduler._next_delay(config, 0, None))
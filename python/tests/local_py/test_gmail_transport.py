@@ -0,0 +1,99 @@
+"""Tests for the pooled Gmail HTTP transport against a local server."""
+
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import TestCase
+
+from googleapiclient.discovery import build_from_document
+from googleapiclient.discovery_cache import get_static_doc
+
+from local_py.gmail_transport import PooledHttp
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    connections = 0
+    lock = threading.Lock()
+
+    def setup(self) -> None:
+        super().setup()
+        with Handler.lock:
+            Handler.connections += 1
+
+    def do_GET(self) -> None:
+        if self.path.startswith("/slow"):
+            time.sleep(0.5)
+        body = json.dumps({"emailAddress": "me@example.com", "path": self.path})
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        try:
+            self.wfile.write(body.encode())
+        except BrokenPipeError:
+            # The client gave up on a slow request.
+            pass
+
+    def log_message(self, format: str, *args: object) -> None:
+        pass
+
+
+class PooledHttpTest(TestCase):
+    def setUp(self) -> None:
+        Handler.connections = 0
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        thread = threading.Thread(
+            target=self.server.serve_forever, args=(0.01,), daemon=True
+        )
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+
+    def test_returns_httplib2_style_response(self) -> None:
+        http = PooledHttp()
+        self.addCleanup(http.close)
+
+        response, content = http.request(f"{self.url}/ping")
+
+        self.assertEqual(200, response.status)
+        self.assertEqual("application/json", response["content-type"])
+        self.assertEqual("/ping", json.loads(content)["path"])
+
+    def test_threads_reuse_bounded_connections(self) -> None:
+        http = PooledHttp(maxsize=2)
+        self.addCleanup(http.close)
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            statuses = list(
+                executor.map(
+                    lambda i: http.request(f"{self.url}/{i}")[0].status, range(40)
+                )
+            )
+
+        self.assertEqual([200] * 40, statuses)
+        self.assertLessEqual(Handler.connections, 2)
+
+    def test_timeout_applies_per_request(self) -> None:
+        http = PooledHttp(timeout=5)
+        self.addCleanup(http.close)
+
+        with self.assertRaises(TimeoutError):
+            http.request(f"{self.url}/slow", timeout=0.05)
+
+    def test_drives_gmail_client(self) -> None:
+        http = PooledHttp()
+        self.addCleanup(http.close)
+        service = build_from_document(
+            get_static_doc("gmail", "v1"),
+            http=http,
+            client_options={"api_endpoint": self.url},
+        )
+
+        profile = service.users().getProfile(userId="me").execute()
+
+        self.assertEqual("me@example.com", profile["emailAddress"])
+        self.assertEqual("/gmail/v1/users/me/profile", profile["path"].split("?")[0])
@@ -0,0 +1,70 @@
+"""Tests for chat model backend profiles."""
+
+import json
+import os
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, List
+from unittest import TestCase
+from unittest.mock import patch
+
+import httpx
+
+from local_py.llm_backend import BACKENDS, BackendProfile, load_backends
+
+
+class BackendProfileTest(TestCase):
+    def test_request_params_include_max_tokens_when_set(self) -> None:
+        self.assertEqual({"model": "m"}, BackendProfile(model="m").request_params())
+        self.assertEqual(
+            {"model": "m", "max_tokens": 64},
+            BackendProfile(model="m", max_tokens=64).request_params(),
+        )
+
+    def test_invalid_settings_are_rejected(self) -> None:
+        invalid: List[Dict[str, Any]] = [
+            {"timeout": 0},
+            {"max_tokens": 0},
+            {"max_connections": 0},
+            {"keepalive": -1},
+        ]
+        for kwargs in invalid:
+            with self.subTest(kwargs=kwargs), self.assertRaises(ValueError):
+                BackendProfile(**kwargs)
+
+    def test_local_client_needs_no_api_key(self) -> None:
+        profile = BackendProfile(base_url="http://localhost:1234/v1", timeout=7)
+        with patch.dict(os.environ, {}, clear=True):
+            client = profile.create_client()
+        self.addCleanup(client.close)
+
+        self.assertEqual("http://localhost:1234/v1/", str(client.base_url))
+        self.assertEqual(httpx.Timeout(7, connect=5.0), client.timeout)
+
+    def test_base_url_defaults_to_environment(self) -> None:
+        env = {"OPENAI_API_BASE": "http://llm:8000/v1", "OPENAI_API_KEY": "k"}
+        with patch.dict(os.environ, env, clear=True):
+            client = BackendProfile().create_client()
+        self.addCleanup(client.close)
+
+        self.assertEqual("http://llm:8000/v1/", str(client.base_url))
+        self.assertEqual("k", client.api_key)
+
+    def test_load_backends_adds_and_replaces_profiles(self) -> None:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "backends.json"
+            path.write_text(
+                json.dumps(
+                    {
+                        "fast": {"model": "small", "max_tokens": 128},
+                        "local": {"base_url": "http://gpu:8080/v1"},
+                    }
+                )
+            )
+            backends = load_backends(path)
+
+        self.assertEqual(
+            BackendProfile(model="small", max_tokens=128), backends["fast"]
+        )
+        self.assertEqual("http://gpu:8080/v1", backends["local"].base_url)
+        self.assertEqual(BACKENDS["openai"], backends["openai"])
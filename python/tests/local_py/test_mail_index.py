@@ -0,0 +1,137 @@
+"""Tests for the local full-text mail index."""
+
+import base64
+import tempfile
+from pathlib import Path
+from typing import Any, List, Optional
+from unittest import TestCase
+
+from local_py.gmail_poller import Email
+from local_py.mail_index import MailIndex
+
+
+def email(
+    id: str,
+    sender: str,
+    subject: str,
+    date: str,
+    labels: Optional[List[str]] = None,
+    thread_id: Optional[str] = None,
+    body: Optional[str] = None,
+) -> Email:
+    return Email(
+        id=id,
+        snippet=f"{subject} snippet",
+        thread_id=thread_id or id,
+        label_ids=labels if labels is not None else ["INBOX", "UNREAD"],
+        headers={"From": sender, "Subject": subject, "Date": date},
+        encoded_body=(base64.urlsafe_b64encode(body.encode()).decode(),)
+        if body
+        else None,
+    )
+
+
+class MailIndexTest(TestCase):
+    def setUp(self) -> None:
+        self.index = MailIndex()
+        self.addCleanup(self.index.close)
+        self.index.add(
+            [
+                email(
+                    "1",
+                    "Alice <alice@example.com>",
+                    "Quarterly report",
+                    "Mon, 6 Jan 2025 10:00:00 +0000",
+                ),
+                email(
+                    "2",
+                    "Bob <bob@example.com>",
+                    "Lunch?",
+                    "Tue, 7 Jan 2025 12:00:00 +0000",
+                    thread_id="t",
+                ),
+                email(
+                    "3",
+                    "Alice <alice@example.com>",
+                    "Re: Lunch?",
+                    "Wed, 8 Jan 2025 09:00:00 +0000",
+                    ["INBOX"],
+                    "t",
+                    "Report is attached",
+                ),
+            ]
+        )
+
+    def ids(self, **filters: Any) -> List[str]:
+        return [message["id"] for message in self.index.search(**filters)["messages"]]
+
+    def test_search_filters_combine(self) -> None:
+        self.assertEqual(["3", "2", "1"], self.ids())
+        self.assertEqual(["3", "1"], self.ids(sender="alice"))
+        self.assertEqual(["2", "1"], self.ids(label="UNREAD"))
+        self.assertEqual(["3", "2"], self.ids(thread_id="t"))
+        self.assertEqual(["3", "2"], self.ids(since="2025-01-07"))
+        self.assertEqual(["1"], self.ids(until="2025-01-07"))
+        self.assertEqual(["3"], self.ids(sender="alice", since="2025-01-07"))
+
+    def test_full_text_search_covers_subject_and_body(self) -> None:
+        self.assertEqual(["3", "1"], self.ids(query="report"))
+        self.assertEqual(["3"], self.ids(query="report attached"))
+        # FTS5 operators in user input are treated as plain words.
+        self.assertEqual([], self.ids(query='lunch" OR "report'))
+        self.assertEqual(["3"], self.ids(query="lunch?  Re:"))
+
+    def test_search_summarizes_all_matches(self) -> None:
+        result = self.index.search(limit=1)
+
+        self.assertEqual(3, result["count"])
+        self.assertEqual(
+            [
+                {"sender": "Alice <alice@example.com>", "count": 2},
+                {"sender": "Bob <bob@example.com>", "count": 1},
+            ],
+            result["top_senders"],
+        )
+        self.assertEqual(
+            {
+                "id": "3",
+                "thread_id": "t",
+                "from": "Alice <alice@example.com>",
+                "subject": "Re: Lunch?",
+                "date": "2025-01-08T09:00:00+00:00",
+                "snippet": "Re: Lunch? snippet",
+                "labels": ["INBOX"],
+            },
+            result["messages"][0],
+        )
+
+    def test_update_keeps_fields_fetched_earlier(self) -> None:
+        self.index.add([Email(id="3", snippet="new snippet")])
+
+        result = self.index.search(query="attached")
+        self.assertEqual("Re: Lunch?", result["messages"][0]["subject"])
+        self.assertEqual("new snippet", result["messages"][0]["snippet"])
+        self.assertEqual(["INBOX"], result["messages"][0]["labels"])
+
+    def test_remove_label(self) -> None:
+        self.index.remove_label(["1", "2"], "UNREAD")
+
+        self.assertEqual([], self.ids(label="UNREAD"))
+        self.assertEqual(["3", "2", "1"], self.ids(label="INBOX"))
+
+    def test_index_is_shared_through_the_file(self) -> None:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "mail.db"
+            writer = MailIndex(path)
+            reader = MailIndex(path)
+            writer.add(
+                [
+                    email(
+                        "9", "carol@example.com", "Hi", "Thu, 9 Jan 2025 08:00:00 +0000"
+                    )
+                ]
+            )
+
+            self.assertEqual(1, reader.search(sender="carol")["count"])
+            writer.close()
+            reader.close()
@@ -0,0 +1,82 @@
+"""Tests for the SQLite store of processed messages."""
+
+import tempfile
+import time
+from pathlib import Path
+from unittest import TestCase
+
+from local_py.message_store import MessageStore
+
+
+class MessageStoreTest(TestCase):
+    def test_filters_seen_ids_in_order(self) -> None:
+        store = MessageStore()
+        self.addCleanup(store.close)
+        store.mark_seen(["b", "d"])
+
+        self.assertEqual(["a", "c"], store.filter_unseen(["a", "b", "c", "d"]))
+
+    def test_filters_more_ids_than_one_query_binds(self) -> None:
+        store = MessageStore()
+        self.addCleanup(store.close)
+        ids = [str(i) for i in range(1200)]
+        store.mark_seen(ids[::2])
+
+        self.assertEqual(ids[1::2], store.filter_unseen(ids))
+
+    def test_state_survives_reopen(self) -> None:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "state.db"
+            store = MessageStore(path)
+            store.mark_seen(["1"])
+            store.set_cursor("history_id", "42")
+            store.close()
+
+            reopened = MessageStore(path)
+            self.addCleanup(reopened.close)
+
+            self.assertEqual([], reopened.filter_unseen(["1"]))
+            self.assertEqual("42", reopened.get_cursor("history_id"))
+
+    def test_reopen_keeps_old_ids_unless_retention_is_set(self) -> None:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "state.db"
+            store = MessageStore(path)
+            store.mark_seen(["1"])
+            store.close()
+            time.sleep(0.05)
+
+            kept = MessageStore(path)
+            self.assertEqual([], kept.filter_unseen(["1"]))
+            kept.close()
+            pruned = MessageStore(path, retention=0.025)
+            self.addCleanup(pruned.close)
+
+            self.assertEqual(["1"], pruned.filter_unseen(["1"]))
+
+    def test_pending_ids_keep_insertion_order(self) -> None:
+        store = MessageStore()
+        self.addCleanup(store.close)
+        store.add_pending(["b", "a", "c"])
+        store.add_pending(["a"])
+        store.remove_pending(["c", "z"])
+
+        self.assertEqual(["b", "a"], store.pending_ids())
+
+    def test_clearing_cursor_deletes_it(self) -> None:
+        store = MessageStore()
+        self.addCleanup(store.close)
+        store.set_cursor("history_id", "1")
+        store.set_cursor("history_id", None)
+
+        self.assertIsNone(store.get_cursor("history_id"))
+
+    def test_prune_forgets_old_ids(self) -> None:
+        store = MessageStore()
+        self.addCleanup(store.close)
+        store.mark_seen(["old"])
+        time.sleep(0.05)
+        store.mark_seen(["new"])
+
+        self.assertEqual(1, store.prune(0.025))
+        self.assertEqual(["old"], store.filter_unseen(["old", "new"]))
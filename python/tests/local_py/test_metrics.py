@@ -0,0 +1,98 @@
+"""Tests for the metrics registry and its exporters."""
+
+import json
+import urllib.error
+import urllib.request
+from unittest import TestCase
+
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import (
+    InMemorySpanExporter,
+)
+
+from local_py.metrics import NULL_METRICS, Metrics, MetricsServer
+
+
+class MetricsTest(TestCase):
+    def test_snapshot_reports_every_series(self) -> None:
+        metrics = Metrics()
+        metrics.inc("polls_total")
+        metrics.inc("polls_total", 2)
+        metrics.set("queue_depth", 7, queue="handlers")
+        metrics.observe("poll_messages", 3)
+        metrics.observe("poll_messages", 600)
+
+        snapshot = metrics.snapshot()
+
+        self.assertEqual({"polls_total": 3}, snapshot["counters"])
+        self.assertEqual({'queue_depth{queue="handlers"}': 7}, snapshot["gauges"])
+        histogram = snapshot["histograms"]["poll_messages"]
+        self.assertEqual(2, histogram["count"])
+        self.assertEqual(603, histogram["sum"])
+        self.assertEqual(1, histogram["buckets"]["5"])
+        self.assertEqual(1, histogram["buckets"]["500"])
+        self.assertEqual(2, histogram["buckets"]["+Inf"])
+        json.dumps(snapshot)
+
+    def test_timer_observes_seconds_with_latency_buckets(self) -> None:
+        metrics = Metrics()
+        with metrics.timer("request_seconds", method="list"):
+            pass
+
+        text = metrics.render_prometheus()
+
+        self.assertIn("# TYPE request_seconds histogram", text)
+        self.assertIn('request_seconds_bucket{method="list",le="0.005"} 1', text)
+        self.assertIn('request_seconds_bucket{method="list",le="+Inf"} 1', text)
+        self.assertIn('request_seconds_count{method="list"} 1', text)
+
+    def test_prometheus_text_escapes_label_values(self) -> None:
+        metrics = Metrics()
+        metrics.inc("errors_total", reason='bad "quote"\n')
+
+        self.assertEqual(
+            '# TYPE errors_total counter\nerrors_total{reason="bad \\"quote\\"\\n"} 1\n',
+            metrics.render_prometheus(),
+        )
+
+    def test_disabled_registry_records_nothing(self) -> None:
+        with NULL_METRICS.timer("request_seconds") as first:
+            NULL_METRICS.inc("polls_total")
+            NULL_METRICS.observe("poll_messages", 1)
+
+        self.assertIs(first, NULL_METRICS.timer("other_seconds").__enter__())
+        self.assertEqual(
+            {"counters": {}, "gauges": {}, "histograms": {}}, NULL_METRICS.snapshot()
+        )
+
+    def test_timer_opens_span_when_tracing(self) -> None:
+        exporter = InMemorySpanExporter()
+        provider = TracerProvider()
+        provider.add_span_processor(SimpleSpanProcessor(exporter))
+        metrics = Metrics()
+        metrics.tracer = provider.get_tracer("test")
+
+        with metrics.timer("request_seconds", method="get"):
+            pass
+
+        (span,) = exporter.get_finished_spans()
+        self.assertEqual("request_seconds", span.name)
+        self.assertEqual({"method": "get"}, dict(span.attributes or {}))
+
+
+class MetricsServerTest(TestCase):
+    def test_serves_text_and_json(self) -> None:
+        metrics = Metrics()
+        metrics.inc("polls_total")
+        server = MetricsServer(metrics, port=0)
+        server.start()
+        self.addCleanup(server.stop)
+        url = f"http://127.0.0.1:{server.port}"
+
+        with urllib.request.urlopen(f"{url}/metrics") as response:
+            self.assertIn(b"polls_total 1", response.read())
+        with urllib.request.urlopen(f"{url}/metrics.json") as response:
+            self.assertEqual(1, json.load(response)["counters"]["polls_total"])
+        with self.assertRaises(urllib.error.HTTPError):
+            urllib.request.urlopen(f"{url}/other")
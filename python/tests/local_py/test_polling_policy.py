@@ -0,0 +1,58 @@
+"""Tests for polling delay policies."""
+
+from types import SimpleNamespace
+from unittest import TestCase
+
+from local_py.polling_policy import AdaptivePollingPolicy, FixedPollingPolicy
+
+
+class ApiError(Exception):
+    """Error shaped like ``googleapiclient.errors.HttpError``."""
+
+    def __init__(self, status: int, headers: dict | None = None) -> None:
+        super().__init__(f"HTTP {status}")
+        self.resp = SimpleNamespace(status=status, get=(headers or {}).get)
+
+
+class FixedPollingPolicyTest(TestCase):
+    def test_ignores_outcome(self) -> None:
+        policy = FixedPollingPolicy(30)
+
+        self.assertEqual(30, policy.next_delay(5))
+        self.assertEqual(30, policy.next_delay(0, OSError("boom")))
+
+
+class AdaptivePollingPolicyTest(TestCase):
+    def setUp(self) -> None:
+        self.policy = AdaptivePollingPolicy(
+            60, min_interval=5, max_interval=300, backoff=2
+        )
+
+    def test_bursts_after_messages_and_backs_off_when_idle(self) -> None:
+        self.assertEqual(5, self.policy.next_delay(3))
+        self.assertEqual(10, self.policy.next_delay(0))
+        self.assertEqual(20, self.policy.next_delay(0))
+        for _ in range(10):
+            delay = self.policy.next_delay(0)
+        self.assertEqual(300, delay)
+        self.assertEqual(5, self.policy.next_delay(1))
+
+    def test_backs_off_exponentially_on_errors(self) -> None:
+        delays = [self.policy.next_delay(0, OSError("boom")) for _ in range(4)]
+
+        self.assertEqual([120, 240, 300, 300], delays)
+        # A successful poll resets the failure count.
+        self.policy.next_delay(1)
+        self.assertEqual(120, self.policy.next_delay(0, OSError("boom")))
+
+    def test_honours_retry_after(self) -> None:
+        error = ApiError(429, {"retry-after": "1200"})
+
+        self.assertEqual(1200, self.policy.next_delay(0, error))
+
+    def test_rate_limit_without_hint_waits_for_cap(self) -> None:
+        self.assertEqual(300, self.policy.next_delay(0, ApiError(429)))
+
+    def test_rejects_inconsistent_bounds(self) -> None:
+        with self.assertRaises(ValueError):
+            AdaptivePollingPolicy(10, min_interval=20)
@@ -0,0 +1,186 @@
+"""Tests for :mod:`local_py.postgres_sink`.
+
+The tests in :class:`PostgresIngestTest` need a PostgreSQL server configured
+by ``PG_HOST``, ``PG_PORT``, ``PG_USER``, ``PG_PASS`` and ``DB_NAME`` and are
+skipped when none is reachable.
+"""
+
+import asyncio
+import base64
+import uuid
+from typing import AsyncIterator, List
+from unittest import IsolatedAsyncioTestCase, TestCase
+
+import psycopg
+from psycopg import sql
+
+from local_py.email_pipeline import EmailPipeline
+from local_py.gmail_poller import Email
+from local_py.postgres_sink import (
+    COPY_THRESHOLD,
+    PostgresSink,
+    Row,
+    conninfo_from_env,
+    email_row,
+)
+
+
+def make_email(index: int, body: str | None = None) -> Email:
+    return Email(
+        id=f"m{index}",
+        snippet=f"snippet {index}",
+        thread_id="t1",
+        label_ids=["INBOX", "UNREAD"],
+        headers={"From": "boss@example.com", "Subject": f"Report {index}"},
+        encoded_body=(base64.urlsafe_b64encode(body.encode()).decode(),)
+        if body is not None
+        else None,
+    )
+
+
+async def stream(count: int) -> AsyncIterator[Email]:
+    for i in range(count):
+        yield make_email(i)
+
+
+class RecordingSink(PostgresSink):
+    """Sink keeping its writes in memory, optionally failing them."""
+
+    def __init__(self, **kwargs: object) -> None:
+        super().__init__("", **kwargs)  # type: ignore[arg-type]
+        self.batches: List[List[str]] = []
+        self.fail = False
+
+    async def _write(self, rows: List[Row]) -> None:
+        await asyncio.sleep(0)
+        if self.fail:
+            raise psycopg.OperationalError("connection refused")
+        self.batches.append([row[0] for row in rows])
+
+
+class EmailRowTest(TestCase):
+    def test_row_holds_columns_in_order(self) -> None:
+        row = email_row(make_email(1, body="hello\x00"))
+
+        self.assertEqual(("m1", "t1", "snippet 1", ["INBOX", "UNREAD"]), tuple(row[:4]))
+        self.assertEqual("Report 1", row[4].obj["Subject"])
+        self.assertEqual("hello", row[5])
+        self.assertIsNone(row[6])
+
+    def test_conninfo_from_env(self) -> None:
+        conninfo = conninfo_from_env(
+            {"PG_HOST": "db", "PG_PORT": "5433", "PG_USER": "me", "DB_NAME": "mail"}
+        )
+
+        self.assertEqual("host=db port=5433 user=me dbname=mail", conninfo)
+
+
+class PostgresSinkBufferTest(IsolatedAsyncioTestCase):
+    async def test_writes_when_batch_is_full(self) -> None:
+        sink = RecordingSink(batch_size=3, flush_interval=60)
+
+        for i in range(7):
+            await sink.handle(make_email(i))
+
+        self.assertEqual([["m0", "m1", "m2"], ["m3", "m4", "m5"]], sink.batches)
+        await sink.flush()
+        self.assertEqual(["m6"], sink.batches[-1])
+
+    async def test_writes_after_flush_interval(self) -> None:
+        sink = RecordingSink(flush_interval=0.01)
+
+        await sink.handle(make_email(1))
+        await asyncio.sleep(0.05)
+
+        self.assertEqual([["m1"]], sink.batches)
+
+    async def test_duplicates_are_written_once(self) -> None:
+        sink = RecordingSink()
+
+        await sink.handle(make_email(1))
+        await sink.handle(make_email(1))
+        await sink.flush()
+
+        self.assertEqual([["m1"]], sink.batches)
+
+    async def test_failed_write_is_retried_by_next_flush(self) -> None:
+        sink = RecordingSink(batch_size=2)
+        sink.fail = True
+
+        await sink.handle(make_email(1))
+        with self.assertRaises(psycopg.OperationalError):
+            await sink.handle(make_email(2))
+
+        sink.fail = False
+        await sink.flush()
+        self.assertEqual([["m1", "m2"]], sink.batches)
+
+    async def test_pipeline_acks_only_written_messages(self) -> None:
+        sink = RecordingSink()
+        sink.fail = True
+        acked: List[str] = []
+
+        async def ack(ids: List[str]) -> None:
+            acked.extend(ids)
+
+        with self.assertLogs(level="WARNING"):
+            await EmailPipeline([sink]).process(stream(5), ack)
+        self.assertEqual([], acked)
+
+        sink.fail = False
+        await EmailPipeline([sink]).process(stream(5), ack)
+        self.assertEqual([f"m{i}" for i in range(5)], sorted(acked))
+        self.assertEqual(5, len(sink.batches[0]))
+
+
+class PostgresIngestTest(IsolatedAsyncioTestCase):
+    """Write to a real PostgreSQL server through both load paths."""
+
+    async def asyncSetUp(self) -> None:
+        try:
+            conn = await psycopg.AsyncConnection.connect(
+                conninfo_from_env(), autocommit=True, connect_timeout=2
+            )
+        except psycopg.OperationalError as exc:
+            self.skipTest(f"PostgreSQL is not available: {exc}")
+        self.conn = conn
+        self.addAsyncCleanup(conn.close)
+        self.table = f"emails_test_{uuid.uuid4().hex[:8]}"
+        self.addAsyncCleanup(
+            conn.execute,
+            sql.SQL("DROP TABLE IF EXISTS {}").format(sql.Identifier(self.table)),
+        )
+        self.sink = PostgresSink(table=self.table, pool_size=2)
+        self.addAsyncCleanup(self.sink.close)
+
+    async def rows(self) -> List[tuple]:
+        cursor = await self.conn.execute(
+            sql.SQL("SELECT id, snippet, headers, body FROM {} ORDER BY id").format(
+                sql.Identifier(self.table)
+            )
+        )
+        return await cursor.fetchall()
+
+    async def test_ingest_is_idempotent_on_message_id(self) -> None:
+        for _ in range(2):
+            for i in range(3):
+                await self.sink.handle(make_email(i))
+            await self.sink.flush()
+
+        rows = await self.rows()
+        self.assertEqual(["m0", "m1", "m2"], [row[0] for row in rows])
+        self.assertEqual("Report 0", rows[0][2]["Subject"])
+
+    async def test_copy_path_keeps_stored_fields(self) -> None:
+        count = COPY_THRESHOLD * 2
+        for i in range(count):
+            await self.sink.handle(make_email(i, body=f"body {i}"))
+        await self.sink.flush()
+        # A later metadata fetch has no body; the stored one is kept.
+        for i in range(count):
+            await self.sink.handle(make_email(i))
+        await self.sink.flush()
+
+        rows = await self.rows()
+        self.assertEqual(count, len(rows))
+        self.assertEqual({f"body {i}" for i in range(count)}, {row[3] for row in rows})
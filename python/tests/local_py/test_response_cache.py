@@ -0,0 +1,69 @@
+"""Tests for the TTL and LRU caches."""
+
+from unittest import TestCase
+
+from local_py.response_cache import LRUCache, TTLCache
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class TTLCacheTest(TestCase):
+    def test_entries_expire_after_ttl(self) -> None:
+        clock = FakeClock()
+        cache: TTLCache[str, int] = TTLCache(10, clock=clock)
+        cache.put("a", 1)
+
+        clock.now = 9.9
+        self.assertEqual(1, cache.get("a"))
+        clock.now = 10
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual({"hits": 1, "misses": 1, "entries": 0}, cache.stats())
+
+    def test_put_drops_expired_entries(self) -> None:
+        clock = FakeClock()
+        cache: TTLCache[str, int] = TTLCache(10, clock=clock)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        clock.now = 15
+        cache.put("c", 3)
+
+        self.assertEqual(1, len(cache))
+
+    def test_invalidate_one_or_all(self) -> None:
+        cache: TTLCache[str, int] = TTLCache(10)
+        cache.put("a", 1)
+        cache.put("b", 2)
+
+        cache.invalidate("a")
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(2, cache.get("b"))
+        cache.invalidate()
+        self.assertEqual(0, len(cache))
+
+    def test_ttl_must_be_positive(self) -> None:
+        with self.assertRaises(ValueError):
+            TTLCache(0)
+
+
+class LRUCacheTest(TestCase):
+    def test_evicts_least_recently_used(self) -> None:
+        cache: LRUCache[str, int] = LRUCache(2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        cache.get("a")
+        cache.put("c", 3)
+
+        self.assertEqual(1, cache.get("a"))
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(3, cache.get("c"))
+        self.assertEqual({"hits": 3, "misses": 1, "entries": 2}, cache.stats())
+
+    def test_maxsize_must_be_positive(self) -> None:
+        with self.assertRaises(ValueError):
+            LRUCache(0)
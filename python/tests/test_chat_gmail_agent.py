@@ -1,12 +1,19 @@
 """Tests for :mod:`chat_gmail_agent` using mocked services."""
 
 import json
+import tempfile
+import threading
+from pathlib import Path
 from types import SimpleNamespace
+from typing import Any
 from unittest import TestCase
 from unittest.mock import MagicMock
 
 from chat_gmail_agent import ChatGmailAgent
 from local_py.gmail_poller import Email
+from local_py.mail_index import MailIndex
+from local_py.metrics import Metrics
+from local_py.response_cache import LRUCache
 
 
 class ChatGmailAgentTest(TestCase):
@@ -64,3 +71,354 @@ class ChatGmailAgentTest(TestCase):
             [{"id": "1", "snippet": "snippet 1"}],
             json.loads(tool_message["content"]),
         )
+
+    def test_streams_tokens_and_runs_tool_calls_concurrently(self) -> None:
+        """Stream replies and start each streamed tool call while others run."""
+        started = threading.Barrier(2, timeout=5)
+
+        def poll(sender: str | None = None) -> list[Email]:
+            # Both calls must be running at once to pass the barrier.
+            started.wait()
+            return [Email(id=sender or "", snippet="hi")]
+
+        poller = MagicMock()
+        poller.poll.side_effect = poll
+
+        def chunk(content: str | None = None, tool_calls: list | None = None) -> Any:
+            delta = SimpleNamespace(content=content, tool_calls=tool_calls)
+            return SimpleNamespace(choices=[SimpleNamespace(delta=delta)])
+
+        def call(index: int, arguments: str, id: str | None = None) -> Any:
+            name = "gmail_poll" if id else None
+            return SimpleNamespace(
+                index=index,
+                id=id,
+                function=SimpleNamespace(name=name, arguments=arguments),
+            )
+
+        first = [
+            chunk(tool_calls=[call(0, '{"sender": ', id="a")]),
+            chunk(tool_calls=[call(0, '"a@example.com"}')]),
+            chunk(tool_calls=[call(1, '{"sender": "b@example.com"}', id="b")]),
+        ]
+        second = [chunk("Two "), chunk("emails"), SimpleNamespace(choices=[])]
+
+        client = MagicMock()
+        client.chat.completions.create.side_effect = [iter(first), iter(second)]
+
+        inputs = iter(["check", "exit"])
+        outputs: list[str] = []
+        tokens: list[str] = []
+
+        agent = ChatGmailAgent(poller, client=client, stream=True)
+        agent.run(
+            input_fn=lambda prompt: next(inputs),
+            print_fn=outputs.append,
+            stream_fn=tokens.append,
+        )
+
+        self.assertEqual(["Two ", "emails", "\n"], tokens)
+        self.assertEqual(
+            [
+                "Type 'exit' to quit.",
+                "Checking Gmail...",
+                "Checking Gmail...",
+                "Found 1 unread email.",
+                "Found 1 unread email.",
+            ],
+            outputs,
+        )
+        self.assertIsNotNone(agent.last_ttft)
+
+        calls = client.chat.completions.create.call_args_list
+        self.assertTrue(calls[0].kwargs["stream"])
+        self.assertEqual({"include_usage": True}, calls[0].kwargs["stream_options"])
+        assistant, *tool_messages = calls[1].kwargs["messages"][-3:]
+        self.assertEqual(
+            ["a", "b"], [tool_call["id"] for tool_call in assistant["tool_calls"]]
+        )
+        self.assertEqual(
+            '{"sender": "a@example.com"}',
+            assistant["tool_calls"][0]["function"]["arguments"],
+        )
+        self.assertEqual(
+            [
+                ("a", [{"id": "a@example.com", "snippet": "hi"}]),
+                ("b", [{"id": "b@example.com", "snippet": "hi"}]),
+            ],
+            [(m["tool_call_id"], json.loads(m["content"])) for m in tool_messages],
+        )
+
+    def test_failed_tool_call_is_reported_to_model(self) -> None:
+        """Return a tool error to the model instead of aborting the chat."""
+        poller = MagicMock()
+        poller.poll.side_effect = RuntimeError("boom")
+        message = SimpleNamespace(
+            tool_calls=[
+                SimpleNamespace(
+                    id="1", function=SimpleNamespace(name="gmail_poll", arguments="{}")
+                )
+            ],
+            content=None,
+        )
+        client = MagicMock()
+        client.chat.completions.create.side_effect = [
+            SimpleNamespace(choices=[SimpleNamespace(message=message)]),
+            SimpleNamespace(
+                choices=[
+                    SimpleNamespace(
+                        message=SimpleNamespace(tool_calls=None, content="Sorry")
+                    )
+                ]
+            ),
+        ]
+        inputs = iter(["check", "exit"])
+        outputs: list[str] = []
+
+        with self.assertLogs(level="WARNING"):
+            ChatGmailAgent(poller, client=client).run(
+                input_fn=lambda prompt: next(inputs), print_fn=outputs.append
+            )
+
+        self.assertEqual(
+            ["Type 'exit' to quit.", "Checking Gmail...", "Sorry"], outputs
+        )
+        tool_message = client.chat.completions.create.call_args_list[1].kwargs[
+            "messages"
+        ][-1]
+        self.assertEqual({"error": "boom"}, json.loads(tool_message["content"]))
+
+    def test_large_poll_result_is_compressed_and_expanded_on_demand(self) -> None:
+        """Send IDs for large results and full emails only when asked."""
+        poller = MagicMock()
+        poller.poll.return_value = [
+            Email(id=str(i), snippet="s" * 100) for i in range(30)
+        ]
+
+        def response(
+            content: str | None, name: str | None = None, args: str = ""
+        ) -> Any:
+            tool_calls = None
+            if name:
+                tool_calls = [
+                    SimpleNamespace(
+                        id=name, function=SimpleNamespace(name=name, arguments=args)
+                    )
+                ]
+            message = SimpleNamespace(tool_calls=tool_calls, content=content)
+            usage = SimpleNamespace(prompt_tokens=100, completion_tokens=5)
+            return SimpleNamespace(
+                choices=[SimpleNamespace(message=message)], usage=usage
+            )
+
+        client = MagicMock()
+        client.chat.completions.create.side_effect = [
+            response(None, "gmail_poll", "{}"),
+            response(None, "gmail_expand", '{"ids": ["2"]}'),
+            response("Email 2 is about s"),
+        ]
+        inputs = iter(["check", "exit"])
+        outputs: list[str] = []
+
+        agent = ChatGmailAgent(poller, client=client)
+        agent.run(input_fn=lambda prompt: next(inputs), print_fn=outputs.append)
+
+        self.assertEqual("Email 2 is about s", outputs[-1])
+        calls = client.chat.completions.create.call_args_list
+        poll_result = json.loads(calls[1].kwargs["messages"][-1]["content"])
+        self.assertEqual(30, poll_result["count"])
+        expand_result = json.loads(calls[2].kwargs["messages"][-1]["content"])
+        self.assertEqual([{"id": "2", "snippet": "s" * 100}], expand_result)
+        self.assertEqual(
+            {"prompt_tokens": 300, "completion_tokens": 15}, agent.last_usage
+        )
+
+    def test_poll_results_are_cached_until_new_mail(self) -> None:
+        """Reuse a recent poll for the same sender until new mail arrives."""
+        poller = MagicMock(last_error=None)
+        poller.poll.return_value = [Email(id="1", snippet="hi")]
+        agent = ChatGmailAgent(poller, client=MagicMock())
+
+        self.assertEqual(poller.poll.return_value, agent._handle_gmail_poll("{}"))
+        agent._handle_gmail_poll("{}")
+        agent._handle_gmail_poll('{"sender": "a@example.com"}')
+        self.assertEqual(2, poller.poll.call_count)
+
+        agent.notify_new_mail()
+        agent._handle_gmail_poll("{}")
+        self.assertEqual(3, poller.poll.call_count)
+        assert agent.poll_cache is not None
+        self.assertEqual(
+            {"hits": 1, "misses": 3, "entries": 1}, agent.poll_cache.stats()
+        )
+
+    def test_poll_cache_is_dropped_when_another_process_indexes_mail(self) -> None:
+        """A poller writing the shared index invalidates cached polls."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "mail.db"
+            index = MailIndex(path)
+            self.addCleanup(index.close)
+            writer = MailIndex(path)
+            self.addCleanup(writer.close)
+            poller = MagicMock(last_error=None)
+            poller.poll.return_value = []
+            agent = ChatGmailAgent(poller, client=MagicMock(), index=index)
+
+            agent._handle_gmail_poll("{}")
+            index.add([Email(id="1", snippet="own write")])
+            agent._handle_gmail_poll("{}")
+            self.assertEqual(1, poller.poll.call_count)
+
+            writer.add([Email(id="2", snippet="new mail")])
+            agent._handle_gmail_poll("{}")
+            self.assertEqual(2, poller.poll.call_count)
+
+    def test_failed_polls_are_not_cached(self) -> None:
+        """An empty result from a failed poll must not hide mail for the TTL."""
+        poller = MagicMock(last_error=OSError("boom"))
+        poller.poll.return_value = []
+        agent = ChatGmailAgent(poller, client=MagicMock())
+
+        agent._handle_gmail_poll("{}")
+        poller.last_error = None
+        poller.poll.return_value = [Email(id="1", snippet="hi")]
+
+        self.assertEqual(poller.poll.return_value, agent._handle_gmail_poll("{}"))
+        self.assertEqual(poller.poll.return_value, agent._handle_gmail_poll("{}"))
+        self.assertEqual(2, poller.poll.call_count)
+
+    def test_poll_cache_can_be_disabled(self) -> None:
+        poller = MagicMock()
+        poller.poll.return_value = []
+        agent = ChatGmailAgent(poller, client=MagicMock(), poll_cache_ttl=0)
+
+        agent._handle_gmail_poll("{}")
+        agent._handle_gmail_poll("{}")
+
+        self.assertIsNone(agent.poll_cache)
+        self.assertEqual(2, poller.poll.call_count)
+
+    def test_identical_requests_are_answered_from_completion_cache(self) -> None:
+        """Agents sharing a completion cache skip repeated identical requests."""
+        client = MagicMock()
+        client.chat.completions.create.return_value = SimpleNamespace(
+            choices=[
+                SimpleNamespace(message=SimpleNamespace(tool_calls=None, content="Hi"))
+            ]
+        )
+        cache: LRUCache = LRUCache(8)
+
+        outputs: list[str] = []
+        for _ in range(2):
+            inputs = iter(["hello", "exit"])
+            ChatGmailAgent(MagicMock(), client=client, completion_cache=cache).run(
+                input_fn=lambda prompt: next(inputs), print_fn=outputs.append
+            )
+
+        client.chat.completions.create.assert_called_once()
+        self.assertEqual(["Hi", "Hi"], [o for o in outputs if o == "Hi"])
+        self.assertEqual({"hits": 1, "misses": 1, "entries": 1}, cache.stats())
+
+    def test_search_tool_answers_from_index_without_polling(self) -> None:
+        """Offer gmail_search only with an index and answer from it."""
+        index = MailIndex()
+        self.addCleanup(index.close)
+        index.add(
+            [
+                Email(
+                    id="7",
+                    snippet="Invoice attached",
+                    headers={"From": "billing@example.com", "Subject": "Invoice"},
+                )
+            ]
+        )
+        search = SimpleNamespace(
+            id="s",
+            function=SimpleNamespace(
+                name="gmail_search", arguments='{"query": "invoice"}'
+            ),
+        )
+        client = MagicMock()
+        client.chat.completions.create.side_effect = [
+            SimpleNamespace(
+                choices=[
+                    SimpleNamespace(
+                        message=SimpleNamespace(tool_calls=[search], content=None)
+                    )
+                ]
+            ),
+            SimpleNamespace(
+                choices=[
+                    SimpleNamespace(
+                        message=SimpleNamespace(tool_calls=None, content="One invoice")
+                    )
+                ]
+            ),
+        ]
+        poller = MagicMock()
+        inputs = iter(["any invoices?", "exit"])
+
+        ChatGmailAgent(poller, client=client, index=index).run(
+            input_fn=lambda prompt: next(inputs), print_fn=lambda line: None
+        )
+
+        poller.poll.assert_not_called()
+        calls = client.chat.completions.create.call_args_list
+        names = [tool["function"]["name"] for tool in calls[0].kwargs["tools"]]
+        self.assertIn("gmail_search", names)
+        result = json.loads(calls[1].kwargs["messages"][-1]["content"])
+        self.assertEqual(1, result["count"])
+        self.assertEqual("7", result["messages"][0]["id"])
+
+        without_index = ChatGmailAgent(poller, client=client)
+        self.assertNotIn(
+            "gmail_search", [tool["function"]["name"] for tool in without_index.tools]
+        )
+
+    def test_metrics_separate_model_and_tool_time(self) -> None:
+        """Record model requests, tool calls, turns and token usage."""
+        call = SimpleNamespace(
+            id="1", function=SimpleNamespace(name="gmail_poll", arguments="{}")
+        )
+        usage = SimpleNamespace(prompt_tokens=10, completion_tokens=2)
+        client = MagicMock()
+        client.chat.completions.create.side_effect = [
+            SimpleNamespace(
+                choices=[
+                    SimpleNamespace(
+                        message=SimpleNamespace(tool_calls=[call], content=None)
+                    )
+                ],
+                usage=usage,
+            ),
+            SimpleNamespace(
+                choices=[
+                    SimpleNamespace(
+                        message=SimpleNamespace(tool_calls=None, content="None")
+                    )
+                ],
+                usage=usage,
+            ),
+        ]
+        poller = MagicMock()
+        poller.poll.return_value = []
+        metrics = Metrics()
+        inputs = iter(["check", "exit"])
+
+        ChatGmailAgent(poller, client=client, metrics=metrics).run(
+            input_fn=lambda prompt: next(inputs), print_fn=lambda line: None
+        )
+
+        snapshot = metrics.snapshot()
+        histograms = snapshot["histograms"]
+        self.assertEqual(2, histograms["chat_llm_seconds"]["count"])
+        self.assertEqual(2, histograms["chat_ttft_seconds"]["count"])
+        self.assertEqual(1, histograms['chat_tool_seconds{tool="gmail_poll"}']["count"])
+        self.assertEqual(1, histograms["chat_turn_seconds"]["count"])
+        self.assertEqual(
+            {
+                'chat_tokens_total{kind="prompt_tokens"}': 20,
+                'chat_tokens_total{kind="completion_tokens"}': 4,
+            },
+            snapshot["counters"],
+        )
@@ -0,0 +1,116 @@
+"""Tests for :mod:`testing.fake_gmail` driven by the real pollers over HTTP."""
+
+import json
+import tempfile
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import IsolatedAsyncioTestCase, TestCase
+
+import httplib2
+
+from local_py.async_gmail_poller import AsyncGmailPoller
+from local_py.gmail_poller import GmailPoller
+from local_py.gmail_quota import QuotaLimiter
+from local_py.gmail_transport import PooledHttp
+from testing.fake_gmail import FakeGmailServer, RecordingHttp
+
+
+class FakeGmailServerTest(TestCase):
+    def start(self, messages: int, **kwargs: object) -> FakeGmailServer:
+        server = FakeGmailServer(messages, **kwargs)  # type: ignore[arg-type]
+        server.start()
+        self.addCleanup(server.stop)
+        return server
+
+    def poller(self, server: FakeGmailServer, **kwargs: object) -> GmailPoller:
+        return GmailPoller(
+            service=server.service(transport=PooledHttp),
+            limiter=QuotaLimiter(1e9),
+            **kwargs,  # type: ignore[arg-type]
+        )
+
+    def test_poll_drains_backlog_in_pages_and_batches(self) -> None:
+        server = self.start(25)
+        poller = self.poller(server, max_results=10, batch_size=4)
+
+        emails = poller.poll()
+
+        self.assertEqual(25, len(emails))
+        self.assertEqual(len(emails), len({email.id for email in emails}))
+        self.assertEqual("Report 24", emails[0].headers["Subject"])  # type: ignore[index]
+        self.assertEqual([], poller.poll())
+        self.assertEqual(
+            {
+                "users.messages.list": 4,
+                "users.messages.get": 25,
+                "users.messages.batchModify": 3,
+            },
+            server.calls,
+        )
+
+    def test_incremental_poll_reads_history(self) -> None:
+        server = self.start(3)
+        poller = self.poller(server, incremental=True)
+        self.assertEqual(3, len(poller.poll()))
+
+        message = server.deliver(sender="boss@example.com")
+
+        self.assertEqual([message.id], [email.id for email in poller.poll()])
+        self.assertEqual(1, server.calls["users.history.list"])
+
+    def test_expired_history_falls_back_to_listing(self) -> None:
+        server = self.start(1)
+        poller = self.poller(server, incremental=True)
+        poller.poll()
+        message = server.deliver()
+        server.expire_history()
+
+        self.assertEqual([message.id], [email.id for email in poller.poll()])
+        self.assertEqual(2, server.calls["users.messages.list"])
+
+    def test_injected_errors_leave_messages_unread(self) -> None:
+        server = self.start(20, error_rate=1.0, error_status=429)
+        poller = self.poller(server)
+
+        self.assertEqual([], poller.poll())
+        self.assertEqual(429, poller.last_error.resp.status)  # type: ignore[union-attr]
+
+        server.error_rate = 0.0
+        self.assertEqual(20, len(poller.poll()))
+
+    def test_recording_replays_the_same_messages(self) -> None:
+        server = self.start(5)
+        recording = Path(tempfile.mkdtemp()) / "gmail.jsonl"
+        service = server.service(
+            transport=lambda timeout: RecordingHttp(
+                httplib2.Http(timeout=timeout), recording
+            )
+        )
+        recorded = GmailPoller(
+            service=service, limiter=QuotaLimiter(1e9), mark_read=False
+        ).poll()
+
+        entries = [json.loads(line) for line in recording.read_text().splitlines()]
+        self.assertEqual(6, len(entries))
+        self.assertTrue(entries[1]["path"].startswith("/gmail/v1/users/me/messages/"))
+
+        replay = self.start(0, replay=recording)
+        replayed = self.poller(replay, mark_read=False).poll()
+
+        self.assertEqual(recorded, replayed)
+
+
+class AsyncFakeGmailServerTest(IsolatedAsyncioTestCase):
+    async def test_async_poller_marks_messages_read(self) -> None:
+        server = FakeGmailServer(12, latency=0.001).start()
+        self.addCleanup(server.stop)
+        poller = AsyncGmailPoller(
+            credentials=SimpleNamespace(valid=True, token="test-token"),
+            base_url=server.api_url,
+            max_results=5,
+            limiter=QuotaLimiter(1e9),
+        )
+        self.addAsyncCleanup(poller.close)
+
+        self.assertEqual(12, len(await poller.poll()))
+        self.assertEqual([], await poller.poll())
@@ -2,12 +2,16 @@
 
 from __future__ import annotations
 
+import io
 import os
 import pathlib
 import sys
 import tempfile
+from contextlib import redirect_stderr, redirect_stdout
+from subprocess import CalledProcessError
+from typing import Any
 from unittest import TestCase
-from unittest.mock import call, patch
+from unittest.mock import MagicMock, call, patch
 
 import setup_venv
 
@@ -17,9 +21,11 @@ class SetupVenvSmokeTest(TestCase):
 
     def test_main_creates_and_installs(self) -> None:
         """Ensure main invokes commands to create venv and install deps."""
-        with tempfile.TemporaryDirectory() as tmpdir, patch(
-            "setup_venv.run"
-        ) as run_mock, patch.dict(os.environ, {"BUILD_WORKING_DIRECTORY": tmpdir}):
+        with (
+            tempfile.TemporaryDirectory() as tmpdir,
+            patch("setup_venv.run") as run_mock,
+            patch.dict(os.environ, {"BUILD_WORKING_DIRECTORY": tmpdir}),
+        ):
             setup_venv.main([])
 
             venv_dir = pathlib.Path(tmpdir) / ".venv"
@@ -47,3 +53,140 @@ class SetupVenvSmokeTest(TestCase):
                     ),
                 ]
             )
+
+
+class SetupVenvIncrementalTest(TestCase):
+    """Verify that unchanged environments are not reinstalled."""
+
+    def setUp(self) -> None:
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.root = pathlib.Path(tmpdir.name)
+        self.venv_dir = self.root / ".venv"
+        self.pip = [str(setup_venv._venv_python(self.venv_dir)), "-m", "pip"]
+        self.requirements = self.root / "requirements.txt"
+        self.requirements.write_text("alpha==1.0\n    # via beta\nBeta_Pkg==2.0\n")
+        env = patch.dict(os.environ, {"BUILD_WORKING_DIRECTORY": tmpdir.name})
+        env.start()
+        self.addCleanup(env.stop)
+        self.run_mock = self._patch("setup_venv.run")
+        self.installed: list[list[str]] = []
+        self.run_mock.side_effect = self._record
+
+    def _patch(self, target: str, **kwargs: Any) -> MagicMock:
+        patcher = patch(target, **kwargs)
+        self.addCleanup(patcher.stop)
+        return patcher.start()
+
+    def _record(self, command: list[str], **_: object) -> None:
+        if command[:3] == [sys.executable, "-m", "venv"]:
+            self.venv_dir.mkdir(exist_ok=True)
+        elif "install" in command:
+            # Capture the subset before its temporary file is removed.
+            subset = pathlib.Path(command[command.index("-r") + 1])
+            self.installed.append(subset.read_text().split())
+
+    def _main(self, *args: str) -> list[list[str]]:
+        self.run_mock.reset_mock()
+        self.installed.clear()
+        with redirect_stdout(io.StringIO()):
+            setup_venv.main([str(self.requirements), *args])
+        return [c.args[0] for c in self.run_mock.call_args_list]
+
+    def test_skips_installation_when_nothing_changed(self) -> None:
+        self._main()
+
+        self.assertEqual([], self._main())
+
+    def test_installs_only_changed_requirements(self) -> None:
+        self._main()
+        self.requirements.write_text("alpha==1.1\nBeta_Pkg==2.0\ngamma==3\n")
+
+        commands = self._main()
+
+        self.assertEqual(1, len(commands))
+        self.assertEqual([*self.pip, "install", "-r"], commands[0][:5])
+        self.assertEqual(["-c", str(self.requirements)], commands[0][6:])
+        self.assertEqual([["alpha==1.1", "gamma==3"]], self.installed)
+
+    def test_force_reinstalls_everything(self) -> None:
+        self._main()
+
+        commands = self._main("--force")
+
+        self.assertEqual(
+            [[*self.pip, "install", "-r", str(self.requirements)]], commands
+        )
+
+    def test_interpreter_change_recreates_environment(self) -> None:
+        self._main()
+        self._patch("setup_venv._interpreter_version", return_value="CPython 9.9.9")
+
+        commands = self._main()
+
+        self.assertEqual(
+            [
+                [sys.executable, "-m", "venv", "--clear", str(self.venv_dir)],
+                [*self.pip, "install", "-r", str(self.requirements)],
+            ],
+            commands,
+        )
+
+    def test_options_in_requirements_force_full_install(self) -> None:
+        self._main()
+        self.requirements.write_text("--index-url https://example.com\nalpha==1.1\n")
+
+        commands = self._main()
+
+        self.assertEqual(
+            [[*self.pip, "install", "-r", str(self.requirements)]], commands
+        )
+
+    def test_failed_install_is_retried(self) -> None:
+        def fail_install(command: list[str], **kwargs: object) -> None:
+            self._record(command, **kwargs)
+            if "install" in command:
+                raise CalledProcessError(1, command)
+
+        self.run_mock.side_effect = fail_install
+        with self.assertRaises(RuntimeError):
+            self._main()
+        self.run_mock.side_effect = self._record
+
+        commands = self._main()
+
+        self.assertEqual(
+            [[*self.pip, "install", "-r", str(self.requirements)]], commands
+        )
+
+    def test_wheelhouse_is_filled_then_used(self) -> None:
+        wheelhouse = str(self.root / "wheels")
+
+        commands = self._main("--wheelhouse", wheelhouse)
+
+        self.assertEqual(
+            [
+                [sys.executable, "-m", "venv", str(self.venv_dir)],
+                [*self.pip, "wheel", "--wheel-dir", wheelhouse]
+                + ["--find-links", wheelhouse, "-r", str(self.requirements)],
+                [*self.pip, "install", "-r", str(self.requirements)]
+                + ["--no-index", "--find-links", wheelhouse],
+            ],
+            commands,
+        )
+
+    def test_offline_installs_from_wheelhouse_only(self) -> None:
+        wheelhouse = str(self.root / "wheels")
+
+        commands = self._main("--wheelhouse", wheelhouse, "--offline")
+
+        self.assertEqual(
+            [*self.pip, "install", "-r", str(self.requirements)]
+            + ["--no-index", "--find-links", wheelhouse],
+            commands[-1],
+        )
+        self.assertNotIn("wheel", [c[3] for c in commands[1:]])
+
+    def test_offline_requires_wheelhouse(self) -> None:
+        with redirect_stderr(io.StringIO()), self.assertRaises(SystemExit):
+            self._main("--offline")
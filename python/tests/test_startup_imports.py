@@ -0,0 +1,52 @@
+"""Check that the entry points defer their heavy dependencies."""
+
+import os
+import subprocess
+import sys
+from typing import List
+from unittest import TestCase
+
+DEFERRED = [
+    "semantic_kernel",
+    "googleapiclient",
+    "google_auth_oauthlib",
+    "httplib2",
+    "openai",
+    "aiohttp",
+]
+
+
+def loaded_after(code: str) -> List[str]:
+    """Return the deferred dependencies imported by running *code*."""
+    check = f"{code}\nprint(' '.join(m for m in {DEFERRED!r} if m in sys.modules))"
+    result = subprocess.run(
+        [sys.executable, "-c", f"import sys\n{check}"],
+        capture_output=True,
+        text=True,
+        check=True,
+        env={**os.environ, "PYTHONPATH": os.pathsep.join(sys.path)},
+    )
+    return result.stdout.split()
+
+
+class StartupImportTest(TestCase):
+    def test_entry_points_defer_heavy_dependencies(self) -> None:
+        for module in ("local_py.poll_gmail_agent", "chat_gmail_agent"):
+            with self.subTest(module=module):
+                self.assertEqual([], loaded_after(f"import {module}"))
+
+    def test_poller_with_injected_service_skips_kernel_registration(self) -> None:
+        code = (
+            "from unittest.mock import MagicMock\n"
+            "from local_py.gmail_poller import GmailPoller\n"
+            "poller = GmailPoller(service=MagicMock())\n"
+            "assert not hasattr(poller.poll, '__kernel_function__')\n"
+            # Semantic Kernel itself imports openai.
+            "import semantic_kernel\n"
+            "assert poller.poll.__kernel_function__\n"
+        )
+
+        loaded = loaded_after(code)
+
+        self.assertIn("semantic_kernel", loaded)
+        self.assertNotIn("googleapiclient", loaded)